@@ -20,6 +20,10 @@ def create_app(config_name='development'):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app) # 执行特定配置的初始化方法
     
+    # 配置结构化日志 (JSON、按模块级别、request_id、限流采样)
+    from .utils.logger import setup_logging
+    setup_logging(app)
+
     # 添加此行: 禁止URL自动添加尾部斜杠
     app.url_map.strict_slashes = False
 
@@ -29,6 +33,22 @@ def create_app(config_name='development'):
     bcrypt.init_app(app)   # 关联 Bcrypt 到 app
     ma.init_app(app)       # 关联 Marshmallow 到 app
 
+    # 可选的SQL性能统计 (X-DB-Queries / X-DB-Time 响应头和慢查询日志)
+    from .utils.profiling import init_profiling
+    init_profiling(app)
+
+    # Prometheus 指标 (/metrics)
+    from .utils.metrics import init_metrics
+    init_metrics(app)
+
+    # 可选的账本发件箱工作线程
+    from .services.ledger_service import init_ledger
+    init_ledger(app)
+
+    # 库存读模型的会话事件和启动时构建
+    from .services.inventory_service import init_inventory
+    init_inventory(app)
+
     # 配置CORS - 确保允许来自前端的请求，包括localhost:3000和file://协议
     cors.init_app(app, resources={
         r"/api/*": {
@@ -43,7 +63,7 @@ def create_app(config_name='development'):
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
             "allow_headers": ["Content-Type", "Authorization", "Accept"],
             "supports_credentials": True,
-            "expose_headers": ["Content-Type", "X-Total-Count"]
+            "expose_headers": ["Content-Type", "X-Total-Count", "X-Request-ID", "X-DB-Queries", "X-DB-Time"]
         }
     })
     CORS(app, supports_credentials=True)
@@ -1,4 +1,5 @@
 import click
+from datetime import datetime
 from flask.cli import with_appcontext
 from .models.user import User
 from . import db
@@ -29,6 +30,120 @@ def init_admin_command(username, password, employee_id):
     db.session.commit()
     click.echo(f'超级管理员 {username} 创建成功')
 
+@click.command('rebuild-rollups')
+@click.option('--start', default=None, help='起始日期 YYYY-MM-DD (默认不限)')
+@click.option('--end', default=None, help='结束日期 YYYY-MM-DD (默认不限)')
+@with_appcontext
+def rebuild_rollups_command(start, end):
+    """根据交易和销售明细重建按日财务汇总表"""
+    from .services.rollup_service import RollupService
+
+    try:
+        start_day = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end_day = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    except ValueError:
+        raise click.BadParameter('日期格式无效，应为YYYY-MM-DD')
+
+    count = RollupService.rebuild(start_day, end_day)
+    click.echo(f'已重建 {count} 天的财务汇总数据')
+
+@click.command('create-partitions')
+@click.option('--months-ahead', default=3, show_default=True, help='提前创建的月份数')
+@with_appcontext
+def create_partitions_command(months_ahead):
+    """为交易和销售表创建本月及之后几个月的分区 (仅 PostgreSQL)"""
+    from .services.partition_service import PartitionService
+
+    if not PartitionService.supported():
+        click.echo('当前数据库的交易和销售表未分区，无需创建分区')
+        return
+
+    created = PartitionService.create_partitions(months_ahead)
+    for name in created:
+        click.echo(f'已创建分区 {name}')
+    click.echo(f'共创建 {len(created)} 个分区')
+
+@click.command('archive-partitions')
+@click.option('--before', required=True, help='早于该月份 (YYYY-MM) 的分区会被处理')
+@click.option('--mode', type=click.Choice(['detach', 'archive']), default='detach', show_default=True,
+              help='detach: 仅分离分区; archive: 分离后移入 archive schema')
+@click.option('--tablespace', default=None, help='archive 模式下归档表使用的表空间')
+@with_appcontext
+def archive_partitions_command(before, mode, tablespace):
+    """分离或归档旧的交易和销售分区 (仅 PostgreSQL)"""
+    from .services.partition_service import PartitionService
+
+    try:
+        before_month = datetime.strptime(before, '%Y-%m').date()
+    except ValueError:
+        raise click.BadParameter('月份格式无效，应为YYYY-MM')
+
+    if not PartitionService.supported():
+        click.echo('当前数据库的交易和销售表未分区，无需归档')
+        return
+
+    processed = PartitionService.archive_partitions(before_month, mode=mode, tablespace=tablespace)
+    for name in processed:
+        click.echo(f'已{"归档" if mode == "archive" else "分离"}分区 {name}')
+    click.echo(f'共处理 {len(processed)} 个分区')
+
+@click.command('ledger-worker')
+@click.option('--batch-size', default=None, type=int, help='每批处理的记录数 (默认 LEDGER_BATCH_SIZE)')
+@click.option('--interval', default=None, type=float, help='轮询间隔秒数 (默认 LEDGER_POLL_INTERVAL)')
+@click.option('--once', is_flag=True, help='清空发件箱后退出')
+@with_appcontext
+def ledger_worker_command(batch_size, interval, once):
+    """把账本发件箱中的记录批量写入 transactions (LEDGER_WORKER_MODE=external 时使用)"""
+    import time
+    from flask import current_app
+    from .services.ledger_service import LedgerService
+
+    batch_size = batch_size or current_app.config.get('LEDGER_BATCH_SIZE', 500)
+    interval = interval if interval is not None else current_app.config.get('LEDGER_POLL_INTERVAL', 1.0)
+
+    if once:
+        click.echo(f'已写入 {LedgerService.drain(batch_size)} 条交易记录')
+        return
+
+    click.echo(f'账本工作进程已启动 (每批 {batch_size} 条，间隔 {interval} 秒)，按 Ctrl+C 退出')
+    try:
+        while True:
+            LedgerService.drain(batch_size)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        click.echo(f'退出前写入 {LedgerService.drain(batch_size)} 条交易记录')
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys_command():
+    """删除超过 IDEMPOTENCY_TTL 的幂等键"""
+    from .utils.idempotency import purge_expired_keys
+
+    click.echo(f'已删除 {purge_expired_keys()} 个过期的幂等键')
+
+@click.command('check-inventory')
+@click.option('--repair', is_flag=True, help='以数据库为准修正读模型')
+@with_appcontext
+def check_inventory_command(repair):
+    """构建库存读模型并与 books 表逐本核对"""
+    from .services.inventory_service import get_inventory
+
+    mismatches = get_inventory().verify(repair=repair)
+    for mismatch in mismatches[:20]:
+        click.echo(f"书籍ID {mismatch['book_id']}: 数据库 {mismatch['expected']}，读模型 {mismatch['actual']}")
+    if mismatches:
+        click.echo(f'共 {len(mismatches)} 本书籍不一致' + ('，已修正' if repair else ''))
+        if not repair:
+            raise SystemExit(1)
+    else:
+        click.echo('库存读模型与数据库一致')
+
 # 在__init__.py的create_app函数中注册此命令
 def register_commands(app):
-    app.cli.add_command(init_admin_command)
\ No newline at end of file
+    app.cli.add_command(init_admin_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(create_partitions_command)
+    app.cli.add_command(archive_partitions_command)
+    app.cli.add_command(ledger_worker_command)
+    app.cli.add_command(purge_idempotency_keys_command)
+    app.cli.add_command(check_inventory_command)
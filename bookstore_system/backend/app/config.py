@@ -16,6 +16,38 @@ class Config:
     ITEMS_PER_PAGE = 20  # 分页默认值
     JWT_ACCESS_TOKEN_EXPIRES = 3600  # JWT令牌过期时间(秒)
     UPLOAD_FOLDER = os.path.join(basedir, '..', 'uploads')  # 文件上传目录
+    FINANCE_ROLLUP_ENABLED = True  # 整天范围的财务报表读取按日汇总表 (daily_finance_rollup)
+    BOOK_SEARCH_BACKEND = os.environ.get('BOOK_SEARCH_BACKEND', 'auto')  # 书籍搜索后端: auto (pg_trgm/FTS5) 或 like
+    AUTH_CACHE_TTL = 60  # 已验证令牌及用户快照的缓存时间(秒)，0 表示不缓存
+    AUTH_CACHE_SIZE = 1024  # 令牌缓存最多条目数
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')  # app.* 日志默认级别
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')  # 按模块覆盖级别，例如 app.routes=DEBUG,app.utils.auth=WARNING
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # json 或 text
+    LOG_SAMPLE_RATE = 10  # 每个调用位置每秒最多输出的 DEBUG/INFO 日志条数，0 表示不限流
+    LOG_ASYNC = True  # 日志通过队列由后台线程写出
+    SQL_PROFILING_ENABLED = os.environ.get('SQL_PROFILING', '').lower() in ('1', 'true')  # 按请求统计SQL语句数和耗时
+    SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 100))  # 慢查询日志阈值(毫秒)
+    SQL_QUERY_COUNT_WARN = 30  # 单个请求语句数超过该值时记录警告
+    METRICS_ENABLED = True  # 提供 /metrics 接口 (Prometheus 文本格式)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # 设置后抓取 /metrics 需要 Authorization: Bearer <token>
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')  # 多进程部署时各进程写入指标快照的共享目录
+    METRICS_FLUSH_INTERVAL = 5  # 多进程模式下快照写入的最短间隔(秒)
+    BOOK_SUGGEST_TTL = 300  # 联想索引最长使用时间(秒)，多进程部署时限制其他进程写入造成的陈旧
+    REPORT_CACHE_BACKEND = os.environ.get('REPORT_CACHE_BACKEND', 'memory')  # 报表缓存: memory、sqlite (多进程共享) 或 none
+    REPORT_CACHE_PATH = os.environ.get('REPORT_CACHE_PATH')  # sqlite 后端的缓存文件路径
+    REPORT_CACHE_TTL = 60  # 包含今天的报表结果缓存时间(秒)
+    REPORT_CACHE_HISTORICAL_TTL = 86400  # 结束日期早于今天的报表结果缓存时间(秒)
+    REPORT_CACHE_SIZE = 256  # memory 后端最多缓存的报表结果数
+    LEDGER_OUTBOX_ENABLED = os.environ.get('LEDGER_OUTBOX', '').lower() in ('1', 'true')  # 销售相关交易经发件箱异步写入
+    LEDGER_WORKER_MODE = os.environ.get('LEDGER_WORKER_MODE', 'thread')  # thread: 应用内线程; external: 由 flask ledger-worker 处理
+    LEDGER_BATCH_SIZE = 500  # 账本工作进程每批处理的发件箱记录数
+    LEDGER_POLL_INTERVAL = 1.0  # 账本工作进程轮询间隔(秒)
+    IDEMPOTENCY_TTL = 86400  # Idempotency-Key 及其响应的保存时间(秒)
+    IDEMPOTENCY_LEASE = 300  # 预留超过该时间(秒)仍未完成视为已放弃，可由重试接管；应大于请求超时
+    IDEMPOTENCY_CACHE_TTL = 300  # 进程内缓存已保存响应的时间(秒)
+    IDEMPOTENCY_CACHE_SIZE = 10000  # 进程内最多缓存的幂等响应数
+    INVENTORY_PRELOAD = True  # 启动时一次扫描构建库存读模型
+    INVENTORY_TTL = 60  # 库存读模型最长使用时间(秒)，多进程部署时限制其他进程写入造成的陈旧
 
     @staticmethod
     def init_app(app):
@@ -38,11 +70,23 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://' # 测试通常使用内存数据库或单独的测试数据库
     WTF_CSRF_ENABLED = False # 测试时通常禁用 CSRF 保护
+    INVENTORY_PRELOAD = False  # 表在应用创建之后才建立
     SQLALCHEMY_ENGINE_OPTIONS = {          # <--- 新增
         'connect_args': {'check_same_thread': False},
         'poolclass': StaticPool
     }
 
+class BenchmarkConfig(Config):
+    """基准测试配置 (python -m benchmarks)"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, '..', 'benchmark.db')
+    LOG_LEVEL = 'WARNING'  # 避免日志输出影响测量
+
+    @staticmethod
+    def init_app(app):
+        # 在创建应用时读取，python -m benchmarks --database-url 会在此之前设置该环境变量
+        if os.environ.get('BENCHMARK_DATABASE_URL'):
+            app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCHMARK_DATABASE_URL']
+
 class ProductionConfig(Config):
     """生产环境配置"""
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') # 生产环境必须配置数据库 URL
@@ -52,6 +96,7 @@ class ProductionConfig(Config):
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'production': ProductionConfig,
     'default': DevelopmentConfig # 默认使用开发环境配置
 }
@@ -2,4 +2,6 @@ from .user import User
 from .book import Book
 from .purchase_order import PurchaseOrder, PurchaseOrderItem, ORDER_STATUS
 from .transaction import Transaction, TRANSACTION_TYPES
-
+from .finance_rollup import DailyFinanceRollup
+from .ledger_outbox import LedgerOutbox
+from .idempotency_key import IdempotencyKey
@@ -1,9 +1,32 @@
+from sqlalchemy import update, values, column, cast, func, bindparam, Integer, Numeric
 from ..database import db
 from datetime import datetime, timezone, timedelta  # 添加 timedelta 导入
 
 # 定义中国标准时区 (UTC+8)
 CST = timezone(timedelta(hours=8))
 
+# session.info 中记录本事务修改过的书籍: {书籍ID: (库存, 零售价, 是否上架) 或 None}，
+# None 表示写入后的值未知，提交前重新读取；键 None 表示修改范围未知
+CHANGED_BOOKS_KEY = 'changed_books'
+
+
+def mark_books_changed(book_ids=None):
+    """记录当前事务中以 Core/批量语句修改的书籍 (ORM 对象的修改在 flush 时自动记录)
+
+    这些书籍在提交前用本事务的连接重新读取一次。book_ids 为 None 表示修改范围未知
+    (例如批量导入)，提交后库存读模型整体重建。
+    """
+    changed = db.session.info.setdefault(CHANGED_BOOKS_KEY, {})
+    if book_ids is None:
+        changed[None] = None
+    else:
+        changed.update(dict.fromkeys(book_ids))
+
+
+def record_book_state(book_id, quantity, retail_price, is_active):
+    """记录本事务写入后的库存字段 (例如 UPDATE ... RETURNING 的结果)，提交时不必重新读取"""
+    db.session.info.setdefault(CHANGED_BOOKS_KEY, {})[book_id] = (quantity, retail_price, is_active)
+
 class Book(db.Model):
     """
     书籍模型，用于存储书店中的书籍信息
@@ -61,6 +84,96 @@ class Book(db.Model):
         self.quantity -= quantity
         return True
     
+    @classmethod
+    def decrease_stock_atomic(cls, book_id, quantity):
+        """
+        以单条条件 UPDATE 原子地减少图书库存
+        
+        UPDATE books SET quantity = quantity - :n WHERE id = :id AND quantity >= :n RETURNING quantity
+        检查与扣减在数据库中一次完成，并发销售不会超卖，也无需先加锁读取。
+        
+        Args:
+            book_id: 书籍ID
+            quantity: 需要减少的数量
+        
+        Returns:
+            int: 扣减后的库存
+        
+        Raises:
+            ValueError: 库存不足（没有行被更新）
+        """
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == book_id, cls.quantity >= quantity)
+            .values(quantity=cls.quantity - quantity, updated_at=datetime.now(CST))
+            .returning(cls.quantity, cls.retail_price, cls.is_active)
+        )
+        row = result.one_or_none()
+        
+        if row is None:
+            # 仅在失败时读取当前库存，用于生成错误信息
+            current = db.session.query(cls.quantity).filter(cls.id == book_id).scalar()
+            raise ValueError(f"库存不足: 当前库存{current}, 请求数量{quantity}")
+        
+        record_book_state(book_id, *row)
+        return row.quantity
+    
+    @classmethod
+    def apply_stock_deltas(cls, deltas):
+        """
+        以一条语句批量增加多本书的库存，并可同时更新零售价
+
+        PostgreSQL 上执行 UPDATE books SET ... FROM (VALUES (id, 增量, 新零售价), ...)；
+        其他数据库以同一条参数化 UPDATE 的 executemany 执行。调用方负责提交事务。
+
+        Args:
+            deltas: {book_id: (增加数量, 新零售价或 None)}，None 表示保留原零售价
+
+        Returns:
+            int: 更新的行数
+        """
+        if not deltas:
+            return 0
+        table = cls.__table__
+        now = datetime.now(CST)
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            data = values(
+                column('id', Integer), column('delta', Integer), column('price', Numeric(10, 2)),
+                name='stock_deltas'
+            ).data([(book_id, amount, price) for book_id, (amount, price) in deltas.items()])
+            stmt = (
+                update(table)
+                .where(table.c.id == data.c.id)
+                .values(
+                    quantity=table.c.quantity + data.c.delta,
+                    # 整列为 NULL 时 VALUES 推断为 text，显式转换后再与原价合并
+                    retail_price=func.coalesce(cast(data.c.price, Numeric(10, 2)), table.c.retail_price),
+                    updated_at=now
+                )
+                .returning(table.c.id, table.c.quantity, table.c.retail_price, table.c.is_active)
+            )
+            rows = db.session.execute(stmt).all()
+            for book_id, *state in rows:
+                record_book_state(book_id, *state)
+            return len(rows)
+
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam('b_id'))
+            .values(
+                quantity=table.c.quantity + bindparam('b_delta', type_=Integer),
+                retail_price=func.coalesce(bindparam('b_price', type_=Numeric(10, 2)), table.c.retail_price),
+                updated_at=now
+            )
+        )
+        # executemany 不支持 RETURNING，提交前重新读取这些书籍
+        mark_books_changed(deltas)
+        return db.session.execute(stmt, [
+            {'b_id': book_id, 'b_delta': amount, 'b_price': price}
+            for book_id, (amount, price) in deltas.items()
+        ]).rowcount
+
     def increase_stock(self, amount, suggested_retail_price=None):
         """增加库存
         
@@ -93,14 +206,9 @@ def update_stock_from_order(order):
     Args:
         order: 包含订单项的订单对象
     """
+    deltas = {}
     for item in order.items:
         if item.book_id:
-            book = Book.query.get(item.book_id)
-            if book:
-                # 这里直接调用 increase_stock，但没有传递 suggested_retail_price
-                book.increase_stock(item.quantity)
-                
-                # 确保明确更新时间戳
-                book.updated_at = datetime.now(CST)
-                db.session.add(book)
-
+            amount, _ = deltas.get(item.book_id, (0, None))
+            deltas[item.book_id] = (amount + item.quantity, None)
+    Book.apply_stock_deltas(deltas)
@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from ..database import db
+
+
+class DailyFinanceRollup(db.Model):
+    """按日预聚合的财务汇总表
+
+    与销售、退款、取消和进货付款在同一数据库事务中增量维护，
+    报表在整天范围内直接读取此表，而不是扫描 transactions / sales 全表。
+    """
+    __tablename__ = 'daily_finance_rollup'
+
+    date = db.Column(db.Date, primary_key=True)
+    income = db.Column(db.Numeric(14, 2), default=0, nullable=False)          # 当日交易收入
+    expense = db.Column(db.Numeric(14, 2), default=0, nullable=False)         # 当日交易支出
+    sale_count = db.Column(db.Integer, default=0, nullable=False)             # 当日发生且仍为已完成状态的销售单数
+    sale_revenue = db.Column(db.Numeric(14, 2), default=0, nullable=False)    # 上述销售单的销售额
+    refund_count = db.Column(db.Integer, default=0, nullable=False)           # 当日发生的退款/取消次数
+    purchase_cost = db.Column(db.Numeric(14, 2), default=0, nullable=False)   # 当日下单且已付款的进货成本
+    other_expense = db.Column(db.Numeric(14, 2), default=0, nullable=False)   # 当日除进货付款外的支出 (退款/取消等)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<DailyFinanceRollup {self.date}>'
@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+from ..database import db
+
+
+class IdempotencyKey(db.Model):
+    """写操作的幂等键 (请求头 Idempotency-Key)
+
+    每个用户的同一个键只执行一次写操作，之后的重试直接返回这里保存的响应。
+    status_code 为空表示首个请求仍在处理中。
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    # 请求方法、路径和请求体的 SHA-256，同一个键用于不同请求时拒绝
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    # 以不带时区的 UTC 时间保存，用于过期清理
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None),
+                           nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id}:{self.key} {self.status_code}>'
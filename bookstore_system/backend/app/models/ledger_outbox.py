@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from ..database import db
+
+
+class LedgerOutbox(db.Model):
+    """待写入 transactions 的财务记录 (事务性发件箱)
+
+    启用 LEDGER_OUTBOX_ENABLED 时，销售、退款和取消在请求事务中只写入这张窄表，
+    由账本工作进程批量生成 Transaction 并在同一事务中删除已处理的行。
+    """
+    __tablename__ = 'ledger_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    type = db.Column(db.String(20), nullable=False)
+    description = db.Column(db.Text)
+    reference_id = db.Column(db.String(50))
+    reference_type = db.Column(db.String(20))
+    transaction_date = db.Column(db.DateTime, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    # 以不带时区的 UTC 时间保存，用于计算积压时长
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None), nullable=False)
+
+    def __repr__(self):
+        return f'<LedgerOutbox {self.id} {self.type} {self.amount}>'
@@ -12,6 +12,14 @@ SALE_STATUS = {
 class Sale(db.Model):
     """销售订单主表"""
     __tablename__ = 'sales'
+    __table_args__ = (
+        # 报表按状态和日期范围统计销售额，INCLUDE 使 PostgreSQL 可以只扫描索引
+        db.Index('ix_sales_status_sale_date', 'status', 'sale_date', postgresql_include=['total_amount']),
+        # 非管理员只能查看自己的销售单，按日期倒序分页
+        db.Index('ix_sales_user_id_sale_date', 'user_id', 'sale_date'),
+        # 离线收银批量上传时按客户端单号去重 (分区表上的唯一约束必须包含分区键，这里只建普通索引)
+        db.Index('ix_sales_user_id_client_ref', 'user_id', 'client_ref'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     sale_number = db.Column(db.String(50), unique=True, nullable=False)
@@ -22,6 +30,7 @@ class Sale(db.Model):
     contact = db.Column(db.String(100))  # 客户联系方式
     payment_method = db.Column(db.String(20), default='CASH')  # 支付方式：CASH, CARD, MOBILE等
     remarks = db.Column(db.Text)
+    client_ref = db.Column(db.String(64))  # 离线收银终端生成的单号，批量上传时用于去重
     created_at = db.Column(db.DateTime, default=func.now())
     updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
     
@@ -40,9 +49,15 @@ class Sale(db.Model):
 class SaleItem(db.Model):
     """销售订单项表"""
     __tablename__ = 'sale_items'
+    __table_args__ = (
+        # 畅销书统计和书籍引用查询按 book_id 关联销售单
+        db.Index('ix_sale_items_book_id_sale_id', 'book_id', 'sale_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
+    # 冗余所属销售单的日期：PostgreSQL 上 sale_items 与 sales 一样按该列按月分区
+    sale_date = db.Column(db.DateTime, nullable=False)
     
     # 书籍信息
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
@@ -22,6 +22,14 @@ REFERENCE_TYPES = {
 class Transaction(db.Model):
     """财务交易记录表"""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # 按类型和日期范围汇总金额
+        db.Index('ix_transactions_type_transaction_date', 'type', 'transaction_date',
+                 postgresql_include=['amount']),
+        # 摘要和趋势报表用 SUM(CASE type ...) 一次汇总收支，只按日期范围过滤
+        db.Index('ix_transactions_transaction_date', 'transaction_date',
+                 postgresql_include=['type', 'amount']),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
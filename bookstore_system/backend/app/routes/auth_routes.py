@@ -59,7 +59,8 @@ def get_current_user():
     返回:
     {用户信息对象}
     """
-    # 用户信息已在login_required装饰器中附加到g.user
+    # login_required 只附加了用户快照，这里加载完整的用户信息
+    user = db.session.get(User, g.user.id)
     user_schema = UserSchema()
-    return jsonify(user_schema.dump(g.user))
+    return jsonify(user_schema.dump(user))
 
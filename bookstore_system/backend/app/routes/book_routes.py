@@ -3,15 +3,33 @@ from werkzeug.exceptions import BadRequest
 from ..models.book import Book
 from ..schemas.book_schema import BookSchema, BookCreateSchema, BookUpdateSchema, BookQuerySchema
 from ..utils.decorators import login_required, admin_required
+from ..utils.pagination import keyset_paginate
+from ..utils.export import csv_response, EXPORT_CHUNK_SIZE
+from ..services.book_service import get_search_backend
+from ..services.suggest_service import get_suggest_index
+from ..services.inventory_service import get_inventory
+from ..services.book_import_service import BookImportService, IMPORT_FORMATS, CONFLICT_MODES, DEFAULT_BATCH_SIZE
 from .. import db
-from sqlalchemy import or_
 from marshmallow import ValidationError, Schema, fields
 from ..models.purchase_order import PurchaseOrder, PurchaseOrderItem
-import re
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
 
 # 创建蓝图
 book_bp = Blueprint('book', __name__, url_prefix='/api/books')
 
+def _filter_books(query, search, active_only, rank=False):
+    """按搜索词和上架状态过滤书籍，列表和导出共用"""
+    # 搜索：按数据库能力选择 pg_trgm / FTS5 / LIKE 后端
+    if search:
+        query = get_search_backend().apply(query, search, rank=rank)
+
+    if active_only:
+        query = query.filter(Book.is_active.is_(True))
+    return query
+
 @book_bp.route('/', methods=['GET'])
 def list_books():
     """
@@ -22,6 +40,9 @@ def list_books():
       - page: 页码(可选，默认1)
       - per_page: 每页数量(可选，默认20)
       - active_only: 是否仅显示有效书籍(可选，默认True)
+      - sort: 排序方式(可选)，relevance 表示按搜索相关度排序(游标分页时忽略)
+      - cursor: 游标分页(可选)，传空值获取第一页，之后传上一页返回的 next_cursor
+      - with_total: 游标分页时是否返回总数(可选，默认false)
     权限: 任何用户
     返回:
       - 200: 返回书籍列表和分页信息
@@ -30,30 +51,26 @@ def list_books():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     active_only = request.args.get('active_only', 'false').lower() == 'true'
+    # 游标分页按ID排序，不支持相关度排序
+    rank_by_relevance = request.args.get('sort') == 'relevance' and 'cursor' not in request.args
 
-    query = Book.query
-    
-    # 改进搜索逻辑
-    if search:
-        # 检查是否是ISBN格式（纯数字或带连字符）
-        is_isbn_like = bool(re.match(r'^[0-9\-]+$', search))
-        
-        if is_isbn_like:
-            # ISBN搜索使用包含匹配，而不是前缀匹配
-            query = query.filter(Book.isbn.like(f'%{search}%'))
-        else:
-            # 一般搜索 - 同时搜索书名、作者和ISBN
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Book.name.ilike(search_term),
-                    Book.author.ilike(search_term),
-                    Book.isbn.ilike(search_term)
-                )
+    query = _filter_books(Book.query, search, active_only, rank=rank_by_relevance)
+
+    # 游标分页：按ID升序，不执行 OFFSET，默认不统计总数
+    if 'cursor' in request.args:
+        try:
+            page_data = keyset_paginate(
+                query, (Book.id,),
+                cursor=request.args.get('cursor'),
+                per_page=per_page,
+                descending=False,
+                with_total=request.args.get('with_total', 'false').lower() == 'true'
             )
-            
-    if active_only:
-        query = query.filter(Book.is_active.is_(True))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        page_data['items'] = BookSchema(many=True).dump(page_data['items'])
+        page_data['per_page'] = per_page
+        return jsonify(page_data)
 
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     books = BookSchema(many=True).dump(pagination.items)
@@ -66,6 +83,94 @@ def list_books():
         'per_page': per_page
     })
 
+@book_bp.route('/export', methods=['GET'])
+@login_required
+def export_books():
+    """
+    导出书籍库存为 CSV
+    ---
+    参数:
+      - search / active_only: 同书籍列表
+      - gzip: 是否压缩输出(可选，默认false)
+    权限: 任何登录用户
+    返回:
+      - 200: 按ID升序流式输出的 CSV
+    """
+    search = request.args.get('search', '', type=str)
+    active_only = request.args.get('active_only', 'false').lower() == 'true'
+    query = _filter_books(db.session.query(
+        Book.id, Book.isbn, Book.name, Book.author, Book.publisher, Book.retail_price, Book.quantity,
+        Book.retail_price * Book.quantity, Book.is_active, Book.updated_at
+    ), search, active_only)
+
+    rows = query.order_by(Book.id).yield_per(EXPORT_CHUNK_SIZE)
+    header = ['ID', 'ISBN', '书名', '作者', '出版社', '零售价', '库存', '库存金额', '是否上架', '更新时间']
+    return csv_response(f"books_{datetime.now():%Y%m%d%H%M%S}.csv", header, rows)
+
+@book_bp.route('/suggest', methods=['GET'])
+@login_required
+def suggest_books():
+    """
+    书名/作者/ISBN 前缀联想 (输入即搜索)
+    ---
+    参数:
+      - q: 输入的前缀
+      - limit: 返回数量(可选，默认10，最多50)
+    权限: 任何登录用户
+    返回:
+      - 200: 返回匹配的上架书籍列表 (使用内存索引，不查询数据库)
+    """
+    q = request.args.get('q', '', type=str)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    return jsonify({'items': get_suggest_index().suggest(q, limit)})
+
+# 一次库存查询最多包含的书籍数
+MAX_STOCK_LOOKUP = 500
+
+@book_bp.route('/stock', methods=['GET'])
+@login_required
+def get_stock():
+    """
+    批量查询书籍库存 (收银台等只读场景)
+    ---
+    参数:
+      - ids: 逗号分隔的书籍ID，最多500个
+    权限: 任何登录用户
+    返回:
+      - 200: items 为各书籍的库存、零售价和上架状态，missing 为不存在的ID (使用内存读模型，不查询数据库；
+             其他工作进程的写入最多滞后 INVENTORY_TTL 秒)
+      - 400: ids 缺失或格式无效
+    """
+    try:
+        book_ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({"error": "ids 必须是逗号分隔的整数"}), 400
+    if not book_ids or len(book_ids) > MAX_STOCK_LOOKUP:
+        return jsonify({"error": f"ids 应包含 1 到 {MAX_STOCK_LOOKUP} 个书籍ID"}), 400
+
+    found = get_inventory().get_many(book_ids)
+    return jsonify({
+        'items': [found[book_id] for book_id in book_ids if book_id in found],
+        'missing': [book_id for book_id in book_ids if book_id not in found],
+    })
+
+@book_bp.route('/stock/consistency', methods=['GET'])
+@admin_required
+def check_stock_consistency():
+    """
+    核对处理本请求的工作进程中的库存读模型与数据库是否一致
+    ---
+    参数:
+      - repair: true 时以数据库为准修正读模型
+    权限: 仅管理员
+    返回:
+      - 200: consistent 和不一致的书籍列表
+    """
+    repair = request.args.get('repair', 'false').lower() == 'true'
+    mismatches = get_inventory().verify(repair=repair)
+    return jsonify({'consistent': not mismatches, 'mismatches': mismatches[:100],
+                    'mismatch_count': len(mismatches), 'repaired': repair and bool(mismatches)})
+
 @book_bp.route('/<isbn_or_id>', methods=['GET'])
 @login_required
 def get_book(isbn_or_id):
@@ -148,8 +253,45 @@ def create_book():
         db.session.rollback()
         return jsonify({"error": f"保存书籍时发生错误: {str(e)}"}), 500
 
+    get_suggest_index().upsert(book)
     return jsonify(BookSchema().dump(book)), 201
 
+# 请求体的 Content-Type 与导入格式的对应关系
+IMPORT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/x-jsonlines': 'jsonl',
+}
+
+@book_bp.route('/import', methods=['POST'])
+@admin_required
+def import_books():
+    """
+    批量导入书籍 (流式解析，按批写入)
+    ---
+    请求体: CSV (首行为列名) 或 JSONL (每行一个对象)，字段同创建书籍，另可包含 is_active
+    参数:
+      - format: csv 或 jsonl(可选，默认按 Content-Type 判断)
+      - on_conflict: ISBN 已存在时 update 覆盖该行提供了的书目字段(默认)，skip 跳过；已有书籍的库存不会被修改，未提供的字段和上架状态保持不变
+      - batch_size: 每批写入的行数(可选，默认5000，范围100-10000)
+    权限: 仅管理员
+    返回:
+      - 200: 导入报告，包含新建/更新/跳过/失败行数和出错行的行号与错误信息
+      - 400: 格式或参数无效
+    """
+    fmt = request.args.get('format') or IMPORT_CONTENT_TYPES.get(request.mimetype)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({"error": "请使用 text/csv 或 application/x-ndjson 请求体，或通过 format 参数指定 csv/jsonl"}), 400
+
+    on_conflict = request.args.get('on_conflict', 'update')
+    if on_conflict not in CONFLICT_MODES:
+        return jsonify({"error": "on_conflict 只能为 update 或 skip"}), 400
+
+    batch_size = min(max(request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int), 100), 10000)
+    report = BookImportService.import_books(request.stream, fmt, on_conflict, batch_size)
+    return jsonify(report)
+
 @book_bp.route('/<isbn_or_id>', methods=['PUT'])
 @admin_required
 def update_book(isbn_or_id):
@@ -209,10 +351,10 @@ def update_book(isbn_or_id):
         db.session.commit()
     except Exception as e:
         db.session.rollback()
-        # 记录更详细的错误日志会更好
-        print(f"Error updating book: {str(e)}") # 临时打印，建议使用日志库
+        logger.exception("更新书籍时发生数据库错误", extra={'book': isbn_or_id})
         return jsonify({"error": f"更新书籍时发生数据库错误"}), 500 # 隐藏具体错误细节
     
+    get_suggest_index().upsert(book)
     return jsonify(BookSchema().dump(book))
 
 @book_bp.route('/<isbn_or_id>', methods=['DELETE'])
@@ -245,16 +387,17 @@ def delete_book(isbn_or_id):
         abort(404, description="要删除的书籍未找到")
     
     # 执行物理删除
+    book_id = book.id
     db.session.delete(book)
     
     try:
         db.session.commit()
     except Exception as e:
         db.session.rollback()
-        # 建议使用日志记录错误
-        print(f"Error deleting book: {str(e)}") 
+        logger.exception("删除书籍时发生数据库错误", extra={'book': isbn_or_id})
         return jsonify({"error": f"删除书籍时发生数据库错误"}), 500
     
+    get_suggest_index().remove(book_id)
     return jsonify({"message": "书籍已成功删除"})
 
 @book_bp.route('/isbn-references/<isbn>', methods=['GET'])
@@ -2,38 +2,28 @@ from flask import Blueprint, request, jsonify, g, abort
 from ..models.transaction import Transaction, TRANSACTION_TYPES
 from ..schemas.transaction_schema import TransactionSchema, TransactionQuerySchema
 from ..utils.decorators import login_required, admin_required
+from ..utils.pagination import keyset_paginate
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
 from ..database import db
 from ..services.finance_service import FinanceService
+from ..models.user import User
+from ..utils.export import csv_response, EXPORT_CHUNK_SIZE
+from marshmallow import EXCLUDE, ValidationError
+import logging
+
+logger = logging.getLogger(__name__)
 
 # 创建蓝图
 finance_bp = Blueprint('finance', __name__)
 
 
-@finance_bp.route('/transactions', methods=['GET'])
-@admin_required
-def get_transactions():
-    """获取财务交易记录列表
+def _filter_transactions(query, query_params):
+    """按交易类型和日期范围过滤交易记录，列表和导出共用
     
-    支持筛选:
-    - 按交易类型
-    - 按日期范围
+    Raises:
+        ValueError: 日期格式无效
     """
-    # 解析查询参数
-    schema = TransactionQuerySchema()
-    try:
-        query_params = schema.load(request.args)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
-    
-    page = query_params.get('page', 1)
-    per_page = query_params.get('per_page', 10)
-    
-    # 构建查询
-    query = Transaction.query
-    
-    # 应用过滤
     if 'transaction_type' in query_params and query_params['transaction_type']:
         query = query.filter(Transaction.type == query_params['transaction_type'])
     
@@ -44,7 +34,7 @@ def get_transactions():
             try:
                 start_date = datetime.strptime(start_date, '%Y-%m-%d')
             except ValueError:
-                return jsonify({'error': '开始日期格式无效，应为YYYY-MM-DD'}), 400
+                raise ValueError('开始日期格式无效，应为YYYY-MM-DD')
         query = query.filter(Transaction.transaction_date >= start_date)
     
     if 'end_date' in query_params:
@@ -53,16 +43,62 @@ def get_transactions():
         if isinstance(end_date, str):
             try:
                 end_date = datetime.strptime(end_date, '%Y-%m-%d')
-                # 设置为当天结束时间
-                end_date = end_date.replace(hour=23, minute=59, second=59)
             except ValueError:
-                return jsonify({'error': '结束日期格式无效，应为YYYY-MM-DD'}), 400
-        else:
-            # 如果已经是datetime对象，仍需设置为一天结束
-            end_date = end_date.replace(hour=23, minute=59, second=59)
-            
+                raise ValueError('结束日期格式无效，应为YYYY-MM-DD')
+        # 设置为当天结束时间
+        end_date = end_date.replace(hour=23, minute=59, second=59)
         query = query.filter(Transaction.transaction_date <= end_date)
     
+    return query
+
+
+@finance_bp.route('/transactions', methods=['GET'])
+@admin_required
+def get_transactions():
+    """获取财务交易记录列表
+    
+    支持筛选:
+    - 按交易类型
+    - 按日期范围
+    
+    支持游标分页: 传 cursor (第一页为空值) 后按 (transaction_date, id) 降序翻页，
+    返回 next_cursor，仅在 with_total=true 时统计总数
+    """
+    # 解析查询参数
+    schema = TransactionQuerySchema()
+    try:
+        query_params = schema.load(request.args)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    
+    page = query_params.get('page', 1)
+    per_page = query_params.get('per_page', 10)
+    
+    # 构建查询
+    try:
+        query = _filter_transactions(Transaction.query, query_params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 游标分页
+    if 'cursor' in query_params:
+        try:
+            page_data = keyset_paginate(
+                query, (Transaction.transaction_date, Transaction.id),
+                cursor=query_params['cursor'],
+                per_page=per_page,
+                with_total=query_params.get('with_total', False)
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        pagination = {'per_page': per_page, 'next_cursor': page_data['next_cursor']}
+        if 'total' in page_data:
+            pagination['total'] = page_data['total']
+        return jsonify({
+            'transactions': TransactionSchema(many=True).dump(page_data['items']),
+            'pagination': pagination
+        })
+    
     # 排序和分页
     query = query.order_by(Transaction.transaction_date.desc())
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
@@ -80,6 +116,28 @@ def get_transactions():
     })
 
 
+@finance_bp.route('/transactions/export', methods=['GET'])
+@admin_required
+def export_transactions():
+    """导出交易记录为 CSV
+    
+    筛选参数同交易记录列表 (transaction_type、start_date、end_date)，
+    按 (transaction_date, id) 升序流式输出全部匹配的记录；gzip=true 时压缩输出
+    """
+    try:
+        query_params = TransactionQuerySchema().load(request.args, unknown=EXCLUDE)
+        query = _filter_transactions(db.session.query(
+            Transaction.id, Transaction.transaction_date, Transaction.type, Transaction.amount,
+            Transaction.reference_type, Transaction.reference_id, Transaction.description, User.username
+        ).outerjoin(User, User.id == Transaction.user_id), query_params)
+    except (ValidationError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = query.order_by(Transaction.transaction_date, Transaction.id).yield_per(EXPORT_CHUNK_SIZE)
+    header = ['ID', '交易日期', '类型', '金额', '单据类型', '单据编号', '说明', '操作人']
+    return csv_response(f"transactions_{datetime.now():%Y%m%d%H%M%S}.csv", header, rows)
+
+
 @finance_bp.route('/summary', methods=['GET'])
 @admin_required
 def get_summary():
@@ -110,108 +168,7 @@ def get_summary():
         except ValueError:
             return jsonify({'error': '结束日期格式无效，应为YYYY-MM-DD'}), 400
     
-    # 当前日期
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    month_start = today.replace(day=1)
-    
-    # 构建查询基础
-    query_income = Transaction.query.filter(Transaction.type == TRANSACTION_TYPES['INCOME'])
-    query_expense = Transaction.query.filter(Transaction.type == TRANSACTION_TYPES['EXPENSE'])
-    
-    # 应用日期过滤
-    if start_date:
-        query_income = query_income.filter(Transaction.transaction_date >= start_date)
-        query_expense = query_expense.filter(Transaction.transaction_date >= start_date)
-    
-    if end_date:
-        query_income = query_income.filter(Transaction.transaction_date <= end_date)
-        query_expense = query_expense.filter(Transaction.transaction_date <= end_date)
-    
-    # 总收入和支出
-    income = query_income.with_entities(func.sum(Transaction.amount)).scalar() or 0
-    expense = query_expense.with_entities(func.sum(Transaction.amount)).scalar() or 0
-    
-    # 今日收入
-    today_income = db.session.query(
-        func.sum(Transaction.amount)
-    ).filter(
-        Transaction.type == TRANSACTION_TYPES['INCOME'],
-        Transaction.transaction_date >= today
-    ).scalar() or 0
-    
-    # 本月收入
-    month_income = db.session.query(
-        func.sum(Transaction.amount)
-    ).filter(
-        Transaction.type == TRANSACTION_TYPES['INCOME'],
-        Transaction.transaction_date >= month_start
-    ).scalar() or 0
-    
-    # 按类型汇总
-    summary_by_type = {}
-    for t_type in TRANSACTION_TYPES.values():
-        query = Transaction.query.filter(Transaction.type == t_type)
-        if start_date:
-            query = query.filter(Transaction.transaction_date >= start_date)
-        if end_date:
-            query = query.filter(Transaction.transaction_date <= end_date)
-        
-        amount = query.with_entities(func.sum(Transaction.amount)).scalar() or 0
-        summary_by_type[t_type] = float(amount)
-    
-    # 计算环比数据
-    comparison = {}
-    
-    if start_date and end_date:
-        # 计算上一个相同时间段
-        period_length = (end_date - start_date).days
-        prev_end = start_date - timedelta(days=1)
-        prev_start = prev_end - timedelta(days=period_length)
-        
-        # 上一时间段收入
-        prev_income = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == TRANSACTION_TYPES['INCOME'],
-            Transaction.transaction_date >= prev_start,
-            Transaction.transaction_date <= prev_end
-        ).scalar() or 0
-        
-        # 上一时间段支出
-        prev_expense = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == TRANSACTION_TYPES['EXPENSE'],
-            Transaction.transaction_date >= prev_start,
-            Transaction.transaction_date <= prev_end
-        ).scalar() or 0
-        
-        # 计算环比变化率
-        income_change_rate = calculate_change_rate(float(income), float(prev_income))
-        expense_change_rate = calculate_change_rate(float(expense), float(prev_expense))
-        profit_change_rate = calculate_change_rate(
-            float(income - expense), 
-            float(prev_income - prev_expense)
-        )
-        
-        comparison = {
-            'income_change_rate': income_change_rate,
-            'expense_change_rate': expense_change_rate,
-            'profit_change_rate': profit_change_rate
-        }
-    
-    return jsonify({
-        'total_income': float(income),
-        'total_expense': float(expense),
-        'net_profit': float(income - expense),
-        'today_income': float(today_income),
-        'month_income': float(month_income),
-        'by_type': summary_by_type,
-        'comparison': comparison
-    })
-
-
-# 辅助函数：计算变化率
-def calculate_change_rate(current, previous):
-    if previous == 0:
-        return 100 if current > 0 else 0
-    return round((current - previous) / previous * 100, 2)
+    return jsonify(FinanceService.get_summary(start_date, end_date))
 
 
 @finance_bp.route('/reports/sales-statistics', methods=['GET'])
@@ -291,7 +248,7 @@ def get_sales_trend():
         
         return jsonify(trend_data)
     except Exception as e:
-        print(f"获取销售趋势数据失败: {str(e)}")
+        logger.exception("获取销售趋势数据失败")
         return jsonify({'error': f'获取销售趋势失败: {str(e)}'}), 500
 
 
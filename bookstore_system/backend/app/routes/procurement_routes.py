@@ -5,11 +5,23 @@ from ..models.transaction import Transaction, TRANSACTION_TYPES
 from ..schemas.purchase_order_schema import (
     PurchaseOrderSchema, PurchaseOrderCreateSchema, PurchaseOrderUpdateSchema, PurchaseOrderQuerySchema
 )
+from ..services.rollup_service import RollupService, PURCHASE_PAYMENT_REFERENCE
+from ..services.procurement_service import ProcurementService, orders_from_csv
+from ..services.suggest_service import get_suggest_index
+from ..services.report_cache import invalidate_reports
 from ..utils.decorators import login_required, admin_required
+from ..utils.idempotency import idempotent
+from ..utils.pagination import keyset_paginate
+from ..utils.metrics import STOCK_IN_TOTAL, STOCK_IN_BOOKS
 from .. import db
 from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload, selectinload
+import csv
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
+import logging
+
+logger = logging.getLogger(__name__)
 
 # 创建蓝图
 procurement_bp = Blueprint('procurement', __name__)
@@ -58,6 +70,46 @@ def create_order():
     return jsonify(PurchaseOrderSchema().dump(order)), 201
 
 
+@procurement_bp.route('/orders/bulk', methods=['POST'])
+@admin_required
+def create_orders_bulk():
+    """
+    批量创建进货订单
+    ---
+    请求体:
+      - application/json: {"orders": [{ref, supplier, remarks, items: [...]}, ...]}，订单项字段同创建订单
+      - text/csv: 每行一个订单项，order_ref 相同的行属于同一订单，supplier/remarks 取该订单第一行
+    权限: 仅管理员
+    返回:
+      - 200: 逐单结果 (index/ref，成功时 id/order_number/total_amount，失败时 errors)；有错误的订单不会创建
+      - 400: 请求体格式无效或订单数超过上限
+    """
+    row_errors = []
+    if request.mimetype == 'text/csv':
+        try:
+            orders, row_errors = orders_from_csv(request.stream)
+        except (UnicodeDecodeError, csv.Error) as e:
+            return jsonify({"error": f"CSV无法解析: {e}"}), 400
+    else:
+        payload = request.get_json(silent=True)
+        orders = payload.get('orders') if isinstance(payload, dict) else None
+        if not isinstance(orders, list):
+            return jsonify({"error": "请求体应为 {\"orders\": [...]} 或 text/csv"}), 400
+
+    try:
+        results = ProcurementService.create_orders(orders, g.user.id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    created = sum(1 for result in results if 'id' in result)
+    return jsonify({
+        'created': created,
+        'failed': len(results) - created,
+        'results': results,
+        'row_errors': row_errors,
+    })
+
+
 @procurement_bp.route('/orders', methods=['GET'])
 @admin_required
 def get_orders():
@@ -71,13 +123,18 @@ def get_orders():
       end_date: 结束日期过滤
       page: 页码
       per_page: 每页条数
+      cursor: 游标分页，传空值获取第一页，之后传上一页返回的 next_cursor
+      with_total: 游标分页时是否返回总数
     """
     # 验证和提取查询参数
     schema = PurchaseOrderQuerySchema()
     params = schema.load(request.args)
     
-    # 构建查询
-    query = PurchaseOrder.query
+    # 构建查询，预加载 PurchaseOrderSchema 需要的用户、订单项和书籍
+    query = PurchaseOrder.query.options(
+        joinedload(PurchaseOrder.user),
+        selectinload(PurchaseOrder.items).joinedload(PurchaseOrderItem.book)
+    )
     
     # 应用过滤条件
     if 'status' in params and params['status']:
@@ -95,6 +152,25 @@ def get_orders():
     page = params.get('page', 1)
     per_page = params.get('per_page', 20)
     
+    # 游标分页：按ID降序，不执行 OFFSET，默认不统计总数
+    if 'cursor' in params:
+        try:
+            page_data = keyset_paginate(
+                query, (PurchaseOrder.id,),
+                cursor=params['cursor'],
+                per_page=per_page,
+                with_total=params.get('with_total', False)
+            )
+        except ValueError as e:
+            abort(400, description=str(e))
+        pagination = {'per_page': per_page, 'next_cursor': page_data['next_cursor']}
+        if 'total' in page_data:
+            pagination['total'] = page_data['total']
+        return jsonify({
+            'orders': PurchaseOrderSchema(many=True).dump(page_data['items']),
+            'pagination': pagination
+        })
+    
     # 排序 - 最新的订单排在前面
     query = query.order_by(PurchaseOrder.created_at.desc())
     
@@ -158,6 +234,7 @@ def update_order(order_id):
 
 @procurement_bp.route('/orders/<int:order_id>/pay', methods=['POST'])
 @admin_required
+@idempotent
 def pay_order(order_id):
     """
     支付进货订单
@@ -175,17 +252,25 @@ def pay_order(order_id):
     order.status = ORDER_STATUS['PAID']
     
     # 创建财务记录
+    now = datetime.now(timezone.utc)
     transaction = Transaction(
         type=TRANSACTION_TYPES['EXPENSE'],
         amount=order.total_amount,
         description=f"支付进货订单 {order.order_number}",
         user_id=g.user.id,
         reference_id=order.id,
-        reference_type='purchase_order'
+        reference_type=PURCHASE_PAYMENT_REFERENCE,
+        transaction_date=now
     )
     
     db.session.add(transaction)
+    
+    # 在同一事务中更新按日财务汇总
+    RollupService.record(now, expense=order.total_amount)
+    RollupService.record(order.order_date, purchase_cost=order.total_amount)
     db.session.commit()
+    # 进货成本计入订单日期，过去日期的报表同样失效
+    invalidate_reports(historical=True)
     
     return jsonify({
         'message': '订单支付成功',
@@ -221,6 +306,7 @@ def return_order(order_id):
 
 @procurement_bp.route('/orders/<int:order_id>/stock-in', methods=['POST'])
 @admin_required
+@idempotent
 def stock_in(order_id):
     """
     图书入库
@@ -234,92 +320,39 @@ def stock_in(order_id):
     if order.status != ORDER_STATUS['PAID']:
         abort(400, description="只有已支付的订单可以进行入库操作")
     
-    # 处理每个订单项
-    for item in order.items:
-        # 如果关联到现有书籍
-        if item.book_id:
-            book = Book.query.get(item.book_id)
-            if book:
-                # 增加库存并可能更新零售价
-                suggested_price = item.suggested_retail_price if item.suggested_retail_price else None
-                book.increase_stock(item.quantity, suggested_price)
-                
-                # 添加日志以便调试
-                print(f"Book {book.id} updated. New quantity: {book.quantity}, Updated at: {book.updated_at}")
-        else:
-            # 创建新书
-            book = Book(
-                isbn=item.isbn,
-                name=item.title,
-                author=item.author,
-                publisher=item.publisher,
-                retail_price=item.suggested_retail_price or item.purchase_price * 1.5,  # 默认零售价是成本的1.5倍
-                quantity=item.quantity,
-                is_active=True
-            )
-            db.session.add(book)
-            
-            # 关联新书到订单项
-            item.book_id = book.id
-    
-    # 更新订单状态
-    order.status = ORDER_STATUS['STOCKED']
+    try:
+        result = ProcurementService.stock_in(order)
+    except ValueError as e:
+        db.session.rollback()
+        abort(400, description=str(e))
+    stocked_quantity = sum(item.quantity for item in order.items)
     
     try:
-        # --- 添加调试代码 ---
-        print("\n--- Debug: Before Commit ---")
-        from sqlalchemy import inspect as sa_inspect
-        dirty_objects = [obj for obj in db.session.dirty]
-        print(f"Dirty objects in session: {dirty_objects}")
-
-        books_to_check = []
-        for item in order.items:
-             if item.book_id:
-                 book_in_session = db.session.get(Book, item.book_id)
-                 if book_in_session:
-                     books_to_check.append(book_in_session)
-                     print(f"Book {book_in_session.id} state: Qty={book_in_session.quantity}, UpdatedAt={book_in_session.updated_at}")
-                     try:
-                         inst_state = sa_inspect(book_in_session)
-                         # 检查对象是否 dirty
-                         is_dirty = bool(inst_state.dirty)
-                         print(f"  Is dirty: {is_dirty}")
-                         # 暂时注释掉打印详细历史记录的部分，避免潜在错误
-                         # if is_dirty:
-                         #     print(f"  Dirty attributes history:")
-                         #     for attr in inst_state.attrs:
-                         #         if attr.history.has_changes():
-                         #             print(f"    {attr.key}: {attr.history}")
-                     except Exception as inspect_err:
-                         print(f"  Error during inspection: {inspect_err}") # 打印检查时发生的错误
-
-        print("--- End Debug ---\n")
-        # --- 调试代码结束 ---
-
-        # 强制刷新会话中的所有变更
-        # db.session.flush() # flush 也可能触发错误，暂时注释掉观察
-        # 提交事务
-        print("Attempting commit...") # 添加提交前的打印
         db.session.commit()
-        print("Commit successful.") # 添加提交后的打印
-
-        # --- 添加提交后验证代码 ---
-        print("Re-fetching books after commit to check updated_at:")
-        for item in order.items:
-            if item.book_id:
-                refreshed_book = db.session.get(Book, item.book_id)
-                if refreshed_book:
-                    print(f"  Book {refreshed_book.id} after commit - Qty: {refreshed_book.quantity}, Updated At: {refreshed_book.updated_at}")
-        # --- 提交后验证代码结束 ---
-
-        return jsonify({
-            'message': '图书已成功入库',
-            'order': PurchaseOrderSchema().dump(order)
-        })
     except Exception as e:
         db.session.rollback()
-        print(f"!!! Error during commit or post-commit: {str(e)}") # 打印提交或之后发生的错误
-        import traceback
-        traceback.print_exc() # 强制打印完整的 Traceback
+        logger.exception("入库操作失败", extra={'order_id': order_id})
         abort(500, description=f"入库操作失败: {str(e)}")
 
+    # 新书和零售价变化同步到联想索引 (索引尚未构建时下次查询会整体构建)
+    suggest_index = get_suggest_index()
+    if suggest_index.is_built and result['book_ids']:
+        for book in Book.query.filter(Book.id.in_(result['book_ids'])):
+            suggest_index.upsert(book)
+
+    invalidate_reports(historical=True)
+    STOCK_IN_TOTAL.inc()
+    STOCK_IN_BOOKS.inc(stocked_quantity)
+    logger.info("订单入库完成", extra={
+        'order_id': order_id, 'books_updated': result['updated'], 'books_created': result['created']
+    })
+
+    order = PurchaseOrder.query.options(
+        joinedload(PurchaseOrder.user),
+        selectinload(PurchaseOrder.items).joinedload(PurchaseOrderItem.book)
+    ).filter(PurchaseOrder.id == order_id).one()
+    return jsonify({
+        'message': '图书已成功入库',
+        'order': PurchaseOrderSchema().dump(order)
+    })
+
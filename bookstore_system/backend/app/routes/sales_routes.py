@@ -1,19 +1,32 @@
 import uuid
+from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify, g, abort
 from werkzeug.exceptions import BadRequest
+from sqlalchemy import and_
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, selectinload
 from .. import db
 from ..models.sale import Sale, SaleItem, SALE_STATUS
 from ..models.book import Book
-from ..models.transaction import Transaction, TRANSACTION_TYPES
+from ..models.user import User
+from ..models.transaction import TRANSACTION_TYPES
 from ..schemas.sale_schema import SaleSchema, SaleCreateSchema, SaleUpdateSchema
+from ..services.rollup_service import RollupService
+from ..services.report_cache import invalidate_reports
+from ..services.ledger_service import LedgerService
+from ..services.sales_service import SalesService, BATCH_STATUS
 from ..utils.decorators import login_required, admin_required
+from ..utils.idempotency import idempotent
+from ..utils.pagination import keyset_paginate
+from ..utils.export import csv_response, EXPORT_CHUNK_SIZE
+from ..utils.metrics import SALES_TOTAL, SALES_REVENUE, SALES_ITEMS, REFUNDS_TOTAL
 
 # 创建蓝图
 sales_bp = Blueprint('sales', __name__, url_prefix='/api/sales')
 
 @sales_bp.route('/', methods=['POST'])
 @login_required
+@idempotent
 def create_sale():
     """
     创建新销售订单
@@ -43,9 +56,11 @@ def create_sale():
     sale_number = f"S{uuid.uuid4().hex[:8].upper()}"
     
     user_id = g.user.id if hasattr(g, 'user') and g.user else None
+    now = datetime.now(timezone.utc)
     
     sale = Sale(
         sale_number=sale_number,
+        sale_date=now,
         customer_name=data.get('customer_name'),
         contact=data.get('contact'),
         payment_method=data.get('payment_method', 'CASH'),
@@ -56,17 +71,25 @@ def create_sale():
     
     db.session.add(sale)
     
+    # 一次性加载本单涉及的所有书籍；按ID排序加锁（PostgreSQL 上为 FOR UPDATE），
+    # 并发销售以固定顺序获取行锁，避免死锁
+    book_ids = sorted({item_data['book_id'] for item_data in data['items']})
+    books = {
+        book.id: book
+        for book in Book.query.filter(Book.id.in_(book_ids)).order_by(Book.id).with_for_update()
+    }
+    
     # 处理销售项并减少库存
     total_amount = 0
     for item_data in data['items']:
-        book = Book.query.get(item_data['book_id'])
+        book = books.get(item_data['book_id'])
         if not book:
             db.session.rollback()
             return jsonify({"error": f"书籍ID {item_data['book_id']} 不存在"}), 404
         
-        # 检查并减少库存
+        # 以条件 UPDATE 原子地检查并减少库存
         try:
-            book.decrease_stock(item_data['quantity'])
+            Book.decrease_stock_atomic(book.id, item_data['quantity'])
         except ValueError as e:
             db.session.rollback()
             return jsonify({"error": str(e)}), 409
@@ -74,6 +97,7 @@ def create_sale():
         # 创建销售项
         sale_item = SaleItem(
             sale=sale,
+            sale_date=sale.sale_date,
             book_id=book.id,
             quantity=item_data['quantity'],
             price=item_data['price']
@@ -84,53 +108,73 @@ def create_sale():
     # 设置订单总金额
     sale.total_amount = total_amount
     
-    # 创建收入交易记录
+    # 创建收入交易记录 (发件箱模式下由账本工作进程异步写入)
     try:
-        transaction = Transaction(
+        LedgerService.record(
             amount=total_amount,
             type=TRANSACTION_TYPES['INCOME'],
             description=f"销售单 {sale_number}",
             reference_id=sale_number,
-            user_id=user_id
+            user_id=user_id,
+            transaction_date=now
         )
-        db.session.add(transaction)
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"创建财务记录失败: {str(e)}"}), 500
     
     try:
+        # 在同一事务中更新按日财务汇总
+        RollupService.record(now, income=total_amount, sale_count=1, sale_revenue=total_amount)
         db.session.commit()
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": f"保存销售订单失败: {str(e)}"}), 500
     
+    invalidate_reports()
+    SALES_TOTAL.inc()
+    SALES_REVENUE.inc(float(total_amount))
+    SALES_ITEMS.inc(sum(item['quantity'] for item in data['items']))
     return jsonify(SaleSchema().dump(sale)), 201
 
-@sales_bp.route('/', methods=['GET'])
+@sales_bp.route('/batch', methods=['POST'])
 @login_required
-def list_sales():
+@idempotent
+def create_sales_batch():
     """
-    获取销售订单列表
+    批量上传离线销售
     ---
-    查询参数:
-      - page: 页码
-      - per_page: 每页数量
-      - status: 订单状态(可选)
-      - start_date: 开始日期(可选)
-      - end_date: 结束日期(可选)
+    请求体: {"sales": [SaleCreateSchema + client_ref (终端生成的单号) + sale_date (可选，实际销售时间)]}
     权限: 任何用户
+    说明: 按数组顺序处理，库存不足时先到先得；同一用户已上传过的 client_ref 不会重复创建
     返回:
-      - 200: 销售订单列表及分页信息
+      - 200: 逐笔结果，status 为 created/duplicate/conflict/invalid
+      - 400: 请求体格式无效或销售数超过上限
     """
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+    payload = request.get_json(silent=True)
+    entries = payload.get('sales') if isinstance(payload, dict) else None
+    if not isinstance(entries, list):
+        return jsonify({"error": "请求体应为 {\"sales\": [...]}"}), 400
+
+    user_id = g.user.id if hasattr(g, 'user') and g.user else None
+    try:
+        results = SalesService.create_batch(entries, user_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({"error": f"保存销售订单失败: {str(e)}"}), 500
+
+    summary = {status: 0 for status in BATCH_STATUS.values()}
+    for result in results:
+        summary[result['status']] += 1
+    return jsonify({**summary, 'results': results})
+
+def _filter_sales(query):
+    """按查询参数 status、start_date、end_date 过滤销售单，非管理员只能看到自己的销售单"""
     status = request.args.get('status')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    query = Sale.query
-    
-    # 应用过滤条件
     if status:
         query = query.filter(Sale.status == status)
     
@@ -143,6 +187,52 @@ def list_sales():
     if hasattr(g, 'user') and g.user and not g.user.is_admin():
         query = query.filter(Sale.user_id == g.user.id)
     
+    return query
+
+@sales_bp.route('/', methods=['GET'])
+@login_required
+def list_sales():
+    """
+    获取销售订单列表
+    ---
+    查询参数:
+      - page: 页码
+      - per_page: 每页数量
+      - status: 订单状态(可选)
+      - start_date: 开始日期(可选)
+      - end_date: 结束日期(可选)
+      - cursor: 游标分页(可选)，传空值获取第一页，之后传上一页返回的 next_cursor
+      - with_total: 游标分页时是否返回总数(可选，默认false)
+    权限: 任何用户
+    返回:
+      - 200: 销售订单列表及分页信息
+    """
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    
+    # 预加载 SaleSchema 需要的关联，避免逐行懒加载用户、销售项和书籍
+    query = Sale.query.options(
+        joinedload(Sale.user),
+        selectinload(Sale.items).joinedload(SaleItem.book)
+    )
+    
+    query = _filter_sales(query)
+    
+    # 游标分页：按 (sale_date, id) 降序，不执行 OFFSET，默认不统计总数
+    if 'cursor' in request.args:
+        try:
+            page_data = keyset_paginate(
+                query, (Sale.sale_date, Sale.id),
+                cursor=request.args.get('cursor'),
+                per_page=per_page,
+                with_total=request.args.get('with_total', 'false').lower() == 'true'
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        page_data['items'] = SaleSchema(many=True).dump(page_data['items'])
+        page_data['per_page'] = per_page
+        return jsonify(page_data)
+    
     # 按日期降序排列
     query = query.order_by(Sale.sale_date.desc())
     
@@ -157,6 +247,32 @@ def list_sales():
         'per_page': per_page
     })
 
+@sales_bp.route('/export', methods=['GET'])
+@login_required
+def export_sales():
+    """
+    导出销售订单及其明细为 CSV (每个销售项一行，没有销售项的订单输出一行空明细)
+    ---
+    查询参数:
+      - status / start_date / end_date: 同销售订单列表
+      - gzip: 是否压缩输出(可选，默认false)
+    权限: 任何用户 (非管理员只导出自己的销售单)
+    返回:
+      - 200: 按 (sale_date, id) 升序流式输出的 CSV
+    """
+    query = _filter_sales(db.session.query(
+        Sale.sale_number, Sale.sale_date, Sale.status, Sale.total_amount, Sale.payment_method,
+        Sale.customer_name, Sale.contact, User.username,
+        Book.isbn, Book.name, SaleItem.quantity, SaleItem.price, SaleItem.quantity * SaleItem.price
+    ).outerjoin(User, User.id == Sale.user_id)
+     .outerjoin(SaleItem, and_(SaleItem.sale_id == Sale.id, SaleItem.sale_date == Sale.sale_date))
+     .outerjoin(Book, Book.id == SaleItem.book_id))
+    
+    rows = query.order_by(Sale.sale_date, Sale.id, SaleItem.id).yield_per(EXPORT_CHUNK_SIZE)
+    header = ['销售单号', '销售日期', '状态', '订单金额', '支付方式', '客户', '联系方式', '销售员',
+              'ISBN', '书名', '数量', '单价', '小计']
+    return csv_response(f"sales_{datetime.now():%Y%m%d%H%M%S}.csv", header, rows)
+
 @sales_bp.route('/<int:sale_id>', methods=['GET'])
 @login_required
 def get_sale(sale_id):
@@ -174,8 +290,21 @@ def get_sale(sale_id):
     
     return jsonify(SaleSchema().dump(sale))
 
+def _restore_stock(sale):
+    """退款/取消时恢复库存
+
+    同一本书可能占多行，先按书籍汇总数量，再以 quantity = quantity + :n 原子递增，
+    避免并发下的读-改-写覆盖。
+    """
+    deltas = {}
+    for item in sale.items:
+        amount, _ = deltas.get(item.book_id, (0, None))
+        deltas[item.book_id] = (amount + item.quantity, None)
+    Book.apply_stock_deltas(deltas)
+
 @sales_bp.route('/<int:sale_id>/refund', methods=['POST'])
 @login_required
+@idempotent
 def refund_sale(sale_id):
     """
     退款处理
@@ -197,28 +326,31 @@ def refund_sale(sale_id):
     # 更新订单状态
     sale.status = SALE_STATUS['REFUNDED']
     
-    # 恢复库存
-    for item in sale.items:
-        book = item.book
-        book.quantity += item.quantity
+    _restore_stock(sale)
     
     user_id = g.user.id if hasattr(g, 'user') and g.user else None
+    now = datetime.now(timezone.utc)
     
-    transaction = Transaction(
+    LedgerService.record(
         amount=sale.total_amount,
         type=TRANSACTION_TYPES['EXPENSE'],
         description=f"销售单 {sale.sale_number} 退款",
         reference_id=sale.sale_number,
-        user_id=user_id
+        user_id=user_id,
+        transaction_date=now
     )
-    db.session.add(transaction)
     
     try:
+        # 在同一事务中更新按日财务汇总：冲减原销售日的销售额，记录当日的支出
+        RollupService.record(sale.sale_date, sale_count=-1, sale_revenue=-sale.total_amount)
+        RollupService.record(now, expense=sale.total_amount, refund_count=1, other_expense=sale.total_amount)
         db.session.commit()
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": f"退款处理失败: {str(e)}"}), 500
     
+    invalidate_reports(historical=True)
+    REFUNDS_TOTAL.inc(kind='refund')
     return jsonify({
         "message": "退款处理成功",
         "sale": SaleSchema().dump(sale)
@@ -226,6 +358,7 @@ def refund_sale(sale_id):
 
 @sales_bp.route('/<int:sale_id>', methods=['DELETE'])
 @login_required
+@idempotent
 def cancel_sale(sale_id):
     """
     取消销售订单
@@ -247,28 +380,31 @@ def cancel_sale(sale_id):
     # 更新订单状态
     sale.status = SALE_STATUS['CANCELLED']
     
-    # 恢复库存
-    for item in sale.items:
-        book = item.book
-        book.quantity += item.quantity
+    _restore_stock(sale)
     
     user_id = g.user.id if hasattr(g, 'user') and g.user else None
+    now = datetime.now(timezone.utc)
     
-    transaction = Transaction(
+    LedgerService.record(
         amount=sale.total_amount,
         type=TRANSACTION_TYPES['EXPENSE'],
         description=f"销售单 {sale.sale_number} 取消",
         reference_id=sale.sale_number,
-        user_id=user_id
+        user_id=user_id,
+        transaction_date=now
     )
-    db.session.add(transaction)
     
     try:
+        # 在同一事务中更新按日财务汇总：冲减原销售日的销售额，记录当日的支出
+        RollupService.record(sale.sale_date, sale_count=-1, sale_revenue=-sale.total_amount)
+        RollupService.record(now, expense=sale.total_amount, refund_count=1, other_expense=sale.total_amount)
         db.session.commit()
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": f"取消订单失败: {str(e)}"}), 500
     
+    invalidate_reports(historical=True)
+    REFUNDS_TOTAL.inc(kind='cancel')
     return jsonify({
         "message": "销售订单已取消",
         "sale": SaleSchema().dump(sale)
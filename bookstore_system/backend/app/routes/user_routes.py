@@ -2,8 +2,12 @@ from flask import Blueprint, request, jsonify, g
 from ..models.user import User
 from ..schemas.user_schema import UserSchema, UserRegistrationSchema
 from ..utils.decorators import admin_required, login_required
+from ..utils.auth import invalidate_user
 from .. import db
 from marshmallow import ValidationError  # 添加导入
+import logging
+
+logger = logging.getLogger(__name__)
 
 # 创建蓝图
 user_bp = Blueprint('users', __name__)
@@ -61,7 +65,7 @@ def create_user():
         # 捕获其他异常，回滚事务
         db.session.rollback()
         # 可以记录详细日志
-        print(f"创建用户时发生错误: {str(e)}")
+        logger.exception("创建用户时发生错误")
         return jsonify({"error": "服务器内部错误"}), 500
 
 @user_bp.route('/', methods=['GET'])
@@ -93,8 +97,8 @@ def update_profile():
     返回:
     {更新后的用户信息}
     """
-    # 获取当前用户
-    user = g.user
+    # 获取当前用户 (g.user 只是快照，需加载完整的用户对象)
+    user = db.session.get(User, g.user.id)
     
     # 获取请求数据
     data = request.get_json()
@@ -163,6 +167,8 @@ def update_user(user_id):
         
         # 保存更改
         db.session.commit()
+        # 角色等信息变更后，已缓存的令牌需要重新校验
+        invalidate_user(user.id)
         
         # 返回更新后的用户信息
         schema = UserSchema()
@@ -170,7 +176,7 @@ def update_user(user_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"更新用户时发生错误: {str(e)}")
+        logger.exception("更新用户时发生错误", extra={'user_id': user_id})
         return jsonify({"error": "更新用户失败"}), 500
 
 @user_bp.route('/<int:user_id>', methods=['DELETE'])
@@ -186,9 +192,10 @@ def delete_user(user_id):
         user = User.query.get_or_404(user_id)
         db.session.delete(user)
         db.session.commit()
+        invalidate_user(user_id)
         return jsonify({"message": "用户已删除"})
     except Exception as e:
         db.session.rollback()
-        print(f"删除用户时发生错误: {str(e)}")
+        logger.exception("删除用户时发生错误", extra={'user_id': user_id})
         return jsonify({"error": "删除用户失败"}), 500
 
@@ -49,6 +49,26 @@ class BookCreateSchema(ma.Schema):
         if value < 0:
             raise ValidationError('库存数量不能为负数')
 
+class BookImportSchema(ma.Schema):
+    """批量导入的单行书籍数据
+
+    ISBN 是否已存在由导入服务按批次一次查询，这里不逐行查询数据库。
+    CSV 中的空字符串视为未提供。
+    """
+    class Meta:
+        unknown = EXCLUDE
+
+    isbn = fields.String(required=True, validate=validate.Length(min=1, max=20))
+    name = fields.String(required=True, validate=validate.Length(min=1, max=200))
+    publisher = fields.String(allow_none=True, validate=validate.Length(max=100))
+    author = fields.String(allow_none=True, validate=validate.Length(max=100))
+    retail_price = fields.Decimal(required=True, places=2, as_string=False,
+                                  validate=validate.Range(min=decimal.Decimal('0.01'), max=decimal.Decimal('99999999.99'),
+                                                          error='零售价格必须为正数且不超过99999999.99'))
+    quantity = fields.Integer(load_default=0, validate=validate.Range(min=0, error='库存数量不能为负数'))
+    # 不设默认值：新建书籍时默认上架，更新已有书籍时未提供则保持原状态
+    is_active = fields.Boolean()
+
 class BookUpdateSchema(ma.Schema):
     """用于更新书籍的Schema"""
     # 添加Meta类配置，设置unknown=EXCLUDE来忽略未知字段
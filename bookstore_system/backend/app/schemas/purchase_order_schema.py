@@ -87,6 +87,25 @@ class PurchaseOrderCreateSchema(Schema):
         # 其他验证逻辑...
 
 
+class BulkPurchaseOrderItemSchema(PurchaseOrderItemSchema):
+    """批量创建订单的订单项
+
+    book_id 是否存在由批量创建服务对所有订单一次查询，这里不逐行查询数据库。
+    """
+
+    def validate_book_exists(self, value, **kwargs):
+        pass
+
+
+class BulkPurchaseOrderSchema(Schema):
+    """批量创建中的单个订单；ref 为调用方的订单标识，原样出现在结果中"""
+    ref = fields.String(allow_none=True)
+    supplier = fields.String(allow_none=True)
+    remarks = fields.String(allow_none=True)
+    items = fields.List(fields.Nested(BulkPurchaseOrderItemSchema), required=True,
+                        validate=validate.Length(min=1, error='订单必须包含至少一个商品'))
+
+
 class PurchaseOrderUpdateSchema(Schema):
     """用于更新进货订单的 Schema"""
     supplier = fields.String(allow_none=True)
@@ -99,4 +118,6 @@ class PurchaseOrderQuerySchema(Schema):
     start_date = fields.Date()
     end_date = fields.Date()
     page = fields.Integer(load_default=1, validate=validate.Range(min=1)) # <--- 修改这里
-    per_page = fields.Integer(load_default=10, validate=validate.Range(min=1, max=100)) # <--- 修改这里
\ No newline at end of file
+    per_page = fields.Integer(load_default=10, validate=validate.Range(min=1, max=100)) # <--- 修改这里
+    cursor = fields.String()  # 游标分页，空字符串表示第一页
+    with_total = fields.Boolean(load_default=False)  # 游标分页时是否统计总数
\ No newline at end of file
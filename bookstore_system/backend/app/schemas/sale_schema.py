@@ -1,4 +1,4 @@
-from marshmallow import Schema, fields, validates, ValidationError, validates_schema, post_dump
+from marshmallow import Schema, fields, validate, validates, ValidationError, validates_schema, post_dump
 from ..models.sale import SALE_STATUS
 from ..models.book import Book
 from ..database import db
@@ -13,7 +13,7 @@ class SaleItemSchema(Schema):
     """销售订单项的序列化Schema"""
     id = fields.Int(dump_only=True)  # 添加ID字段用于唯一标识
     book_id = fields.Integer(required=True)  # 确保是整数
-    quantity = fields.Integer(required=True, validate=lambda x: x > 0)  # 确保是正整数
+    quantity = fields.Integer(required=True, validate=validate.Range(min=1))  # 确保是正整数
     price = fields.Decimal(places=2, required=True)  # 确保是小数
     
     # 添加关联的书籍信息
@@ -29,13 +29,28 @@ class SaleCreateSchema(Schema):
     items = fields.List(
         fields.Nested(SaleItemSchema), 
         required=True, 
-        validate=lambda x: len(x) > 0
+        validate=validate.Length(min=1)
     )
 
 
+class SaleBatchEntrySchema(SaleCreateSchema):
+    """离线批量上传中的单笔销售
+
+    client_ref 为收银终端生成的单号，同一用户重复上传时按它去重；
+    sale_date 为离线时的实际销售时间，未提供时使用上传时间。
+    """
+    client_ref = fields.Str(required=True, validate=validate.Length(min=1, max=64))
+    sale_date = fields.AwareDateTime(default_timezone=timezone.utc, load_default=None)
+
+    @validates('sale_date')
+    def validate_sale_date(self, value, **kwargs):
+        if value is not None and value > datetime.now(timezone.utc):
+            raise ValidationError('销售时间不能晚于当前时间')
+
+
 class SaleUpdateSchema(Schema):
     """更新销售订单状态的Schema"""
-    status = fields.Str(required=True, validate=lambda x: x in SALE_STATUS.values())
+    status = fields.Str(required=True, validate=validate.OneOf(SALE_STATUS.values()))
 
 
 class SaleSchema(Schema):
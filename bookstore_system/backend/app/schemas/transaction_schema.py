@@ -28,6 +28,8 @@ class TransactionQuerySchema(Schema):
     end_date = fields.String(validate=validate.Length(min=1))    # 允许字符串格式的日期
     page = fields.Integer(validate=validate.Range(min=1), load_default=1)
     per_page = fields.Integer(validate=validate.Range(min=1, max=100), load_default=20)
+    cursor = fields.String()  # 游标分页，空字符串表示第一页
+    with_total = fields.Boolean(load_default=False)  # 游标分页时是否统计总数
     
     @post_load
     def process_dates(self, data, **kwargs):
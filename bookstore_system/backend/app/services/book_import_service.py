@@ -0,0 +1,232 @@
+"""书籍批量导入
+
+请求体按行流式解析 (CSV 或 JSONL)，每凑满一批就校验、用一条 IN 查询找出已存在的 ISBN，
+再以 INSERT ... ON CONFLICT (isbn) 批量写入并提交。内存占用只与批次大小和报告的错误条数有关，
+与文件大小无关。
+"""
+import codecs
+import csv
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime
+from marshmallow import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from ..models.book import Book, CST, mark_books_changed
+from ..schemas.book_schema import BookImportSchema
+from ..database import db
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# ISBN 已存在时的处理方式：update 覆盖书目信息，skip 保留原有书籍
+CONFLICT_MODES = ('update', 'skip')
+
+DEFAULT_BATCH_SIZE = 5000
+
+# 报告中最多列出的错误行数，超出部分只计数
+MAX_REPORTED_ERRORS = 1000
+
+# ISBN 已存在时可覆盖的字段，只覆盖该行提供了的字段 (CSV 空单元格、JSONL 缺少的键不覆盖)；
+# 库存只在新建书籍时设置，已有书籍的库存通过进货入库调整
+UPDATE_FIELDS = ('name', 'publisher', 'author', 'retail_price', 'is_active')
+
+
+def iter_csv_rows(stream):
+    """逐行解析 CSV (首行为列名)，生成 (行号, 数据, 错误)；空单元格视为未提供"""
+    reader = csv.DictReader(codecs.getreader('utf-8-sig')(stream))
+    for row in reader:
+        if None in row:
+            yield reader.line_num, None, '列数多于表头'
+            continue
+        data = {key.strip(): value.strip() for key, value in row.items()
+                if key and value is not None and value.strip()}
+        yield reader.line_num, data, None
+
+
+def iter_jsonl_rows(stream):
+    """逐行解析 JSONL (每行一个 JSON 对象)，生成 (行号, 数据, 错误)；跳过空行"""
+    for line_number, line in enumerate(codecs.getreader('utf-8-sig')(stream), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield line_number, None, '不是有效的JSON'
+            continue
+        if not isinstance(data, dict):
+            yield line_number, None, '每行必须是一个JSON对象'
+            continue
+        yield line_number, data, None
+
+
+class ImportReport:
+    """导入结果统计和逐行错误"""
+
+    def __init__(self):
+        self.total = 0
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+        self.aborted = None
+
+    def fail(self, line, isbn, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'isbn': isbn, 'errors': errors})
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'aborted': self.aborted,
+        }
+
+
+class BookImportService:
+    """书籍批量导入服务"""
+
+    @staticmethod
+    def import_books(stream, fmt, on_conflict='update', batch_size=DEFAULT_BATCH_SIZE):
+        """从二进制流导入书籍，每批单独提交
+
+        Args:
+            stream: 请求体等可读的二进制流
+            fmt: 'csv' 或 'jsonl'
+            on_conflict: ISBN 已存在时 'update' 覆盖书目信息，'skip' 跳过
+            batch_size: 每批写入的行数
+
+        Returns:
+            dict: 导入报告 (各类行数、出错行的行号/ISBN/错误信息)；
+                  文件在中途无法解析时 aborted 为原因，此前的批次已经提交
+        """
+        if fmt not in IMPORT_FORMATS:
+            raise ValueError(f"不支持的导入格式: {fmt}")
+        if on_conflict not in CONFLICT_MODES:
+            raise ValueError(f"无效的冲突处理方式: {on_conflict}")
+
+        report = ImportReport()
+        schema = BookImportSchema()
+        rows = iter_csv_rows(stream) if fmt == 'csv' else iter_jsonl_rows(stream)
+        batch = []
+        try:
+            for line, data, error in rows:
+                report.total += 1
+                if error:
+                    report.fail(line, None, error)
+                    continue
+                try:
+                    batch.append((line, schema.load(data)))
+                except ValidationError as err:
+                    report.fail(line, data.get('isbn'), err.messages)
+                    continue
+                if len(batch) >= batch_size:
+                    BookImportService._write_batch(batch, on_conflict, report)
+                    batch = []
+        except (UnicodeDecodeError, csv.Error) as e:
+            report.aborted = f"第 {report.total + 1} 行附近无法解析: {e}"
+
+        if batch:
+            BookImportService._write_batch(batch, on_conflict, report)
+
+        if report.created or report.updated:
+            from .suggest_service import get_suggest_index
+            get_suggest_index().invalidate()
+
+        logger.info("书籍批量导入完成", extra={
+            'format': fmt, 'rows': report.total, 'rows_created': report.created,
+            'rows_updated': report.updated, 'rows_skipped': report.skipped, 'rows_failed': report.failed,
+        })
+        return report.to_dict()
+
+    @staticmethod
+    def _write_batch(batch, on_conflict, report):
+        """写入一批已校验的行并提交"""
+        # 同一批中重复的 ISBN 只保留最后一行 (一条 ON CONFLICT DO UPDATE 不能修改同一行两次)
+        latest = {}
+        for line, book in batch:
+            previous = latest.get(book['isbn'])
+            if previous is not None:
+                report.fail(previous[0], book['isbn'], f"与第 {line} 行的ISBN重复，以后者为准")
+            latest[book['isbn']] = (line, book)
+
+        existing = dict(db.session.query(Book.isbn, Book.id).filter(Book.isbn.in_(list(latest))).all())
+        if on_conflict == 'skip':
+            report.skipped += sum(1 for isbn in latest if isbn in existing)
+            latest = {isbn: item for isbn, item in latest.items() if isbn not in existing}
+        if not latest:
+            return
+
+        # 按提供了哪些字段分组，每组一条 INSERT ... ON CONFLICT，冲突时只覆盖这些字段
+        now = datetime.now(CST)
+        groups = defaultdict(list)
+        for _, book in latest.values():
+            fields = tuple(field for field in UPDATE_FIELDS if field in book)
+            groups[fields].append({
+                'isbn': book['isbn'],
+                'name': book['name'],
+                'publisher': book.get('publisher'),
+                'author': book.get('author'),
+                'retail_price': book['retail_price'],
+                'quantity': book['quantity'],
+                'is_active': book.get('is_active', True),
+                'created_at': now,
+                'updated_at': now,
+            })
+
+        try:
+            for fields, rows in groups.items():
+                BookImportService._upsert(rows, fields, on_conflict, existing)
+            mark_books_changed()
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.exception("书籍批量导入写入失败", extra={'rows': len(latest)})
+            for line, book in latest.values():
+                report.fail(line, book['isbn'], f"保存失败: {e.__class__.__name__}")
+            return
+
+        updated = sum(1 for isbn in latest if isbn in existing)
+        report.updated += updated
+        report.created += len(latest) - updated
+
+    @staticmethod
+    def _upsert(rows, fields, on_conflict, existing):
+        """写入一组行；ISBN 已存在且 on_conflict 为 update 时只覆盖 fields 中的字段"""
+        table = Book.__table__
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect in ('postgresql', 'sqlite'):
+            dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = dialect_insert(table)
+            if on_conflict == 'update':
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.isbn],
+                    set_={field: stmt.excluded[field] for field in fields + ('updated_at',)}
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.isbn])
+            db.session.execute(stmt, rows)
+            return
+
+        # 其他数据库：按批次开始时查到的已有 ISBN 分别插入和更新
+        new_rows = [row for row in rows if row['isbn'] not in existing]
+        if new_rows:
+            db.session.execute(insert(table), new_rows)
+        if on_conflict == 'update':
+            changed = [{'id': existing[row['isbn']], **{field: row[field] for field in fields},
+                        'updated_at': row['updated_at']}
+                       for row in rows if row['isbn'] in existing]
+            if changed:
+                db.session.execute(update(Book), changed)
@@ -1 +1,130 @@
- 
+import re
+from flask import current_app
+from sqlalchemy import or_, case, func, text, desc
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import table, column
+from ..models.book import Book
+from ..database import db
+
+
+def is_isbn_like(term):
+    """检查搜索词是否是ISBN格式（纯数字或带连字符）"""
+    return bool(re.match(r'^[0-9\-]+$', term))
+
+
+class LikeSearchBackend:
+    """基于 LIKE/ILIKE 的通用搜索，任何数据库都可用，但无法利用索引"""
+    name = 'like'
+
+    def apply(self, query, term, rank=False):
+        if is_isbn_like(term):
+            # ISBN搜索使用包含匹配，而不是前缀匹配
+            query = query.filter(Book.isbn.like(f'%{term}%'))
+        else:
+            # 一般搜索 - 同时搜索书名、作者和ISBN
+            search_term = f"%{term}%"
+            query = query.filter(
+                or_(
+                    Book.name.ilike(search_term),
+                    Book.author.ilike(search_term),
+                    Book.isbn.ilike(search_term)
+                )
+            )
+
+        if rank:
+            # 书名前缀匹配优先，其次书名包含，再次作者匹配
+            query = query.order_by(case(
+                (Book.name.ilike(f'{term}%'), 0),
+                (Book.name.ilike(f'%{term}%'), 1),
+                (Book.author.ilike(f'%{term}%'), 2),
+                else_=3
+            ), Book.id)
+        return query
+
+
+class PostgresTrigramBackend(LikeSearchBackend):
+    """PostgreSQL pg_trgm 搜索
+
+    ILIKE '%term%' 可以直接使用 gin_trgm_ops 索引，相关度按三元组相似度排序。
+    """
+    name = 'pg_trgm'
+
+    def apply(self, query, term, rank=False):
+        query = super().apply(query, term, rank=False)
+        if rank:
+            query = query.order_by(desc(func.greatest(
+                func.similarity(Book.name, term),
+                func.similarity(func.coalesce(Book.author, ''), term),
+                func.similarity(Book.isbn, term)
+            )), Book.id)
+        return query
+
+
+# SQLite FTS5 外部内容表，由迁移 8c3d1e6f2b90 创建，触发器与 books 表保持同步
+books_fts = table('books_fts', column('rowid'), column('rank'))
+
+
+class SqliteFtsBackend(LikeSearchBackend):
+    """SQLite FTS5 搜索
+
+    使用 trigram 分词器，支持任意位置的子串匹配（包括中文），相关度按书名前缀匹配和 bm25 排序。
+    少于3个字符的搜索词无法构成三元组，回退到 LIKE。
+    """
+    name = 'fts5'
+
+    @staticmethod
+    def installed():
+        """全文索引表是否已由迁移创建"""
+        return db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+        )).first() is not None
+
+    def apply(self, query, term, rank=False):
+        if len(term) < 3:
+            return super().apply(query, term, rank)
+
+        phrase = '"' + term.replace('"', '""') + '"'
+        # ISBN 格式的搜索词只匹配 isbn 列
+        match = f'isbn : {phrase}' if is_isbn_like(term) else phrase
+
+        query = query.join(books_fts, books_fts.c.rowid == Book.id)\
+            .filter(text('books_fts MATCH :fts_query').bindparams(fts_query=match))
+        if rank:
+            # 书名前缀匹配优先，其余按 bm25 排序
+            query = query.order_by(
+                case((Book.name.ilike(f'{term}%'), 0), else_=1),
+                books_fts.c.rank, Book.id
+            )
+        return query
+
+
+def _detect_search_backend():
+    """根据数据库类型和可用扩展选择搜索后端"""
+    if current_app.config.get('BOOK_SEARCH_BACKEND', 'auto') == 'like':
+        return LikeSearchBackend()
+
+    dialect = db.session.get_bind().dialect.name
+    try:
+        if dialect == 'postgresql':
+            installed = db.session.execute(text(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )).first()
+            if installed:
+                return PostgresTrigramBackend()
+        elif dialect == 'sqlite':
+            if SqliteFtsBackend.installed():
+                return SqliteFtsBackend()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.warning(f"全文搜索不可用，回退到 LIKE 搜索: {e}")
+
+    return LikeSearchBackend()
+
+
+def get_search_backend():
+    """获取当前应用的书籍搜索后端（每个应用只检测一次）"""
+    backend = current_app.extensions.get('book_search_backend')
+    if backend is None:
+        backend = _detect_search_backend()
+        current_app.extensions['book_search_backend'] = backend
+    return backend
@@ -1,15 +1,158 @@
-from sqlalchemy import func, desc, extract
-from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, desc, extract, case, and_, or_
+from datetime import date, datetime, time, timedelta
 from ..models.transaction import Transaction, TRANSACTION_TYPES
 from ..models.sale import Sale, SALE_STATUS
 from ..models.book import Book
-from ..models.purchase_order import PurchaseOrder, ORDER_STATUS
+from ..models.purchase_order import PurchaseOrder
+from ..models.finance_rollup import DailyFinanceRollup
 from ..database import db
+from .rollup_service import PAID_ORDER_STATUSES, OTHER_EXPENSE_CONDITION
+from .report_cache import cached_report
+
+def calculate_change_rate(current, previous):
+    """计算环比变化率"""
+    if previous == 0:
+        return 100 if current > 0 else 0
+    return round((current - previous) / previous * 100, 2)
+
 
 class FinanceService:
     """财务服务类，用于处理财务相关的业务逻辑和数据分析"""
     
     @staticmethod
+    def _rollup_days(start_date=None, end_date=None):
+        """判断日期范围能否由按日汇总表回答
+        
+        开始时间为零点、结束时间为 23:59:59 (或不限) 时视为整天范围。
+        
+        Returns:
+            tuple -- (起始日, 结束日)，不限的一端为 None；不能使用汇总表时返回 None
+        """
+        if not current_app.config.get('FINANCE_ROLLUP_ENABLED', False):
+            return None
+        if start_date is not None and start_date.time() != time.min:
+            return None
+        if end_date is not None and end_date.time() < time(23, 59, 59):
+            return None
+        return (
+            start_date.date() if start_date is not None else None,
+            end_date.date() if end_date is not None else None
+        )
+    
+    @staticmethod
+    def _rollup_query(days, *columns):
+        """构建限定在整天范围内的汇总表查询"""
+        query = db.session.query(*columns)
+        start_day, end_day = days
+        if start_day:
+            query = query.filter(DailyFinanceRollup.date >= start_day)
+        if end_day:
+            query = query.filter(DailyFinanceRollup.date <= end_day)
+        return query
+    
+    @staticmethod
+    def get_summary(start_date=None, end_date=None, today=None):
+        """获取财务摘要
+        
+        总收支、今日收入、本月收入、按类型汇总以及上一周期的收支
+        在同一条 SELECT 中通过条件聚合计算，只扫描一次所需日期窗口的并集。
+        
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            today: 当天零点，默认为当前日期
+            
+        Returns:
+            dict: 财务摘要
+        """
+        if today is None:
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        month_start = today.replace(day=1)
+        
+        # 上一个相同长度的时间段，紧邻开始日期之前
+        prev_start = None
+        if start_date and end_date:
+            period_days = (end_date - start_date).days + 1
+            prev_start = start_date - timedelta(days=period_days)
+        
+        if FinanceService._rollup_days(start_date, end_date):
+            date_column = DailyFinanceRollup.date
+            to_bound = lambda value: value.date()
+            income_amount = DailyFinanceRollup.income
+            expense_amount = DailyFinanceRollup.expense
+        else:
+            date_column = Transaction.transaction_date
+            to_bound = lambda value: value
+            income_amount = case((Transaction.type == TRANSACTION_TYPES['INCOME'], Transaction.amount), else_=0)
+            expense_amount = case((Transaction.type == TRANSACTION_TYPES['EXPENSE'], Transaction.amount), else_=0)
+        
+        def window(lower=None, upper=None, upper_inclusive=True):
+            conditions = []
+            if lower is not None:
+                conditions.append(date_column >= to_bound(lower))
+            if upper is not None:
+                conditions.append(date_column <= to_bound(upper) if upper_inclusive else date_column < to_bound(upper))
+            return and_(*conditions) if conditions else None
+        
+        def windowed_sum(amount, condition):
+            if condition is None:
+                return func.sum(amount)
+            return func.sum(case((condition, amount), else_=0))
+        
+        main_window = window(start_date, end_date)
+        month_window = window(month_start)
+        columns = [
+            windowed_sum(income_amount, main_window).label('income'),
+            windowed_sum(expense_amount, main_window).label('expense'),
+            windowed_sum(income_amount, window(today)).label('today_income'),
+            windowed_sum(income_amount, month_window).label('month_income')
+        ]
+        windows = [main_window, month_window]
+        
+        if prev_start is not None:
+            prev_window = window(prev_start, start_date, upper_inclusive=False)
+            columns += [
+                windowed_sum(income_amount, prev_window).label('prev_income'),
+                windowed_sum(expense_amount, prev_window).label('prev_expense')
+            ]
+            windows.append(prev_window)
+        
+        query = db.session.query(*columns)
+        # 主窗口不限范围时需要扫描全部数据，否则只扫描各窗口的并集
+        if main_window is not None:
+            query = query.filter(or_(*windows))
+        row = query.one()
+        
+        income = float(row.income or 0)
+        expense = float(row.expense or 0)
+        
+        # 计算环比数据
+        comparison = {}
+        if prev_start is not None:
+            prev_income = float(row.prev_income or 0)
+            prev_expense = float(row.prev_expense or 0)
+            comparison = {
+                'income_change_rate': calculate_change_rate(income, prev_income),
+                'expense_change_rate': calculate_change_rate(expense, prev_expense),
+                'profit_change_rate': calculate_change_rate(income - expense, prev_income - prev_expense)
+            }
+        
+        return {
+            'total_income': income,
+            'total_expense': expense,
+            'net_profit': income - expense,
+            'today_income': float(row.today_income or 0),
+            'month_income': float(row.month_income or 0),
+            'by_type': {
+                TRANSACTION_TYPES['INCOME']: income,
+                TRANSACTION_TYPES['EXPENSE']: expense
+            },
+            'comparison': comparison
+        }
+    
+    @staticmethod
+    @cached_report
     def get_sales_statistics(start_date=None, end_date=None):
         """获取销售统计数据
         
@@ -20,6 +163,18 @@ class FinanceService:
         Returns:
             dict: 销售统计数据
         """
+        days = FinanceService._rollup_days(start_date, end_date)
+        if days:
+            result = FinanceService._rollup_query(
+                days,
+                func.sum(DailyFinanceRollup.sale_count).label('total_sales'),
+                func.sum(DailyFinanceRollup.sale_revenue).label('total_revenue')
+            ).first()
+            return {
+                'total_sales': int(result.total_sales or 0),
+                'total_revenue': float(result.total_revenue or 0)
+            }
+        
         query = db.session.query(
             func.count(Sale.id).label('total_sales'),
             func.sum(Sale.total_amount).label('total_revenue')
@@ -39,9 +194,76 @@ class FinanceService:
         }
     
     @staticmethod
+    def _period_bucket_expr(period_type, column):
+        """构建按周期分桶的SQL表达式，返回值为桶的键字符串
+
+        日: 'YYYY-MM-DD'；周: 该周星期一的 'YYYY-MM-DD'；月: 'YYYY-MM'
+        """
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect == 'sqlite':
+            if period_type == 'daily':
+                return func.strftime('%Y-%m-%d', column)
+            if period_type == 'weekly':
+                # 先回退6天，再前进到最近的星期一，即得到所在周的星期一
+                return func.date(column, '-6 days', 'weekday 1')
+            return func.strftime('%Y-%m', column)
+
+        # PostgreSQL: date_trunc('week') 以星期一作为一周的开始
+        if period_type == 'daily':
+            return func.to_char(func.date_trunc('day', column), 'YYYY-MM-DD')
+        if period_type == 'weekly':
+            return func.to_char(func.date_trunc('week', column), 'YYYY-MM-DD')
+        return func.to_char(func.date_trunc('month', column), 'YYYY-MM')
+
+    @staticmethod
+    def _trend_buckets(period_type, start_date, end_date):
+        """生成覆盖日期范围的所有桶
+
+        Returns:
+            list -- (桶起始日期, 桶键, 显示标签) 列表，以及范围的上界（不含）
+        """
+        buckets = []
+
+        if period_type == 'daily':
+            current = start_date.date()
+            while current <= end_date.date():
+                key = current.strftime('%Y-%m-%d')
+                buckets.append((current, key, key))
+                current += timedelta(days=1)
+            upper = current
+
+        elif period_type == 'weekly':
+            # 找到起始周的星期一
+            current = start_date.date() - timedelta(days=start_date.weekday())
+            while current <= end_date.date():
+                week_end = current + timedelta(days=6)  # 星期日
+                key = current.strftime('%Y-%m-%d')
+                buckets.append((current, key, f"{key} ~ {week_end.strftime('%Y-%m-%d')}"))
+                current += timedelta(weeks=1)
+            upper = current
+
+        else:  # monthly
+            current = date(start_date.year, start_date.month, 1)
+            while current <= end_date.date():
+                key = current.strftime('%Y-%m')
+                buckets.append((current, key, key))
+                if current.month == 12:
+                    current = date(current.year + 1, 1, 1)
+                else:
+                    current = date(current.year, current.month + 1, 1)
+            upper = current
+
+        return buckets, upper
+
+    @staticmethod
+    @cached_report
     def get_sales_trend(period_type, limit=30, start_date=None, end_date=None):
         """获取销售趋势
         
+        使用一条分组查询统计所有周期的收入与支出，空周期在Python中补零，
+        查询次数与周期数量无关。
+        
         Arguments:
             period_type {str} -- 周期类型: 'daily', 'weekly', 或 'monthly'
             limit {int} -- 返回数据点的数量上限
@@ -70,116 +292,76 @@ class FinanceService:
                     month += 12
                 start_date = datetime(year, month, 1)
         
-        # 根据不同的周期类型构建查询
-        result = []
+        buckets, upper = FinanceService._trend_buckets(period_type, start_date, end_date)
+        if not buckets:
+            return []
+        
+        # 桶边界总是整天，启用汇总表时直接按日汇总行聚合
+        if FinanceService._rollup_days():
+            return FinanceService._sales_trend_from_rollup(period_type, buckets, upper)
+        
+        lower = datetime.combine(buckets[0][0], datetime.min.time())
+        upper = datetime.combine(upper, datetime.min.time())
+        
+        # 单次扫描：按周期分组，条件聚合收入与支出
+        bucket = FinanceService._period_bucket_expr(period_type, Transaction.transaction_date).label('bucket')
+        rows = db.session.query(
+            bucket,
+            func.sum(case(
+                (Transaction.type == TRANSACTION_TYPES['INCOME'], Transaction.amount),
+                else_=0
+            )).label('income'),
+            func.sum(case(
+                (Transaction.type == TRANSACTION_TYPES['EXPENSE'], Transaction.amount),
+                else_=0
+            )).label('expense')
+        ).filter(
+            Transaction.transaction_date >= lower,
+            Transaction.transaction_date < upper
+        ).group_by(bucket).all()
         
-        if period_type == 'daily':
-            # 日期序列
-            current_date = start_date
-            while current_date <= end_date:
-                date_str = current_date.strftime('%Y-%m-%d')
-                next_date = current_date + timedelta(days=1)
-                
-                # 收入：获取该日期的所有收入
-                income = db.session.query(func.sum(Transaction.amount))\
-                    .filter(Transaction.type == TRANSACTION_TYPES['INCOME'])\
-                    .filter(Transaction.transaction_date >= current_date)\
-                    .filter(Transaction.transaction_date < next_date)\
-                    .scalar() or 0
-                
-                # 支出：获取该日期的所有支出
-                expense = db.session.query(func.sum(Transaction.amount))\
-                    .filter(Transaction.type == TRANSACTION_TYPES['EXPENSE'])\
-                    .filter(Transaction.transaction_date >= current_date)\
-                    .filter(Transaction.transaction_date < next_date)\
-                    .scalar() or 0
-                
-                result.append({
-                    'period': date_str,
-                    'income': float(income),
-                    'expense': float(expense)
-                })
-                
-                current_date = next_date
-            
-        elif period_type == 'weekly':
-            # 按周统计
-            # 找到起始周的星期一
-            start_week = start_date - timedelta(days=start_date.weekday())
-            current_week = start_week
-            
-            while current_week <= end_date:
-                week_end = current_week + timedelta(days=6)  # 星期日
-                week_str = f"{current_week.strftime('%Y-%m-%d')} ~ {week_end.strftime('%Y-%m-%d')}"
-                next_week = current_week + timedelta(days=7)
-                
-                # 收入：获取该周的所有收入
-                income = db.session.query(func.sum(Transaction.amount))\
-                    .filter(Transaction.type == TRANSACTION_TYPES['INCOME'])\
-                    .filter(Transaction.transaction_date >= current_week)\
-                    .filter(Transaction.transaction_date <= week_end)\
-                    .scalar() or 0
-                
-                # 支出：获取该周的所有支出
-                expense = db.session.query(func.sum(Transaction.amount))\
-                    .filter(Transaction.type == TRANSACTION_TYPES['EXPENSE'])\
-                    .filter(Transaction.transaction_date >= current_week)\
-                    .filter(Transaction.transaction_date <= week_end)\
-                    .scalar() or 0
-                
-                result.append({
-                    'period': week_str,
-                    'income': float(income),
-                    'expense': float(expense)
-                })
-                
-                current_week = next_week
-                
-        else:  # monthly
-            # 按月统计
-            # 找到起始月的第一天
-            current_month = datetime(start_date.year, start_date.month, 1)
-            
-            while current_month <= end_date:
-                # 确定月末
-                if current_month.month == 12:
-                    month_end = datetime(current_month.year + 1, 1, 1) - timedelta(days=1)
-                else:
-                    month_end = datetime(current_month.year, current_month.month + 1, 1) - timedelta(days=1)
-                
-                month_str = current_month.strftime('%Y-%m')
-                
-                # 下一个月
-                if current_month.month == 12:
-                    next_month = datetime(current_month.year + 1, 1, 1)
-                else:
-                    next_month = datetime(current_month.year, current_month.month + 1, 1)
-                
-                # 收入：获取该月的所有收入
-                income = db.session.query(func.sum(Transaction.amount))\
-                    .filter(Transaction.type == TRANSACTION_TYPES['INCOME'])\
-                    .filter(Transaction.transaction_date >= current_month)\
-                    .filter(Transaction.transaction_date <= month_end)\
-                    .scalar() or 0
-                
-                # 支出：获取该月的所有支出
-                expense = db.session.query(func.sum(Transaction.amount))\
-                    .filter(Transaction.type == TRANSACTION_TYPES['EXPENSE'])\
-                    .filter(Transaction.transaction_date >= current_month)\
-                    .filter(Transaction.transaction_date <= month_end)\
-                    .scalar() or 0
-                
-                result.append({
-                    'period': month_str,
-                    'income': float(income),
-                    'expense': float(expense)
-                })
-                
-                current_month = next_month
+        totals = {row.bucket: row for row in rows}
+        
+        # 补齐没有交易的周期
+        result = []
+        for _, key, label in buckets:
+            row = totals.get(key)
+            result.append({
+                'period': label,
+                'income': float(row.income or 0) if row else 0.0,
+                'expense': float(row.expense or 0) if row else 0.0
+            })
             
         return result
     
     @staticmethod
+    def _sales_trend_from_rollup(period_type, buckets, upper):
+        """基于按日汇总表计算销售趋势"""
+        rows = FinanceService._rollup_query(
+            (buckets[0][0], upper - timedelta(days=1)),
+            DailyFinanceRollup.date,
+            DailyFinanceRollup.income,
+            DailyFinanceRollup.expense
+        ).all()
+        
+        totals = {key: [0.0, 0.0] for _, key, _ in buckets}
+        for row in rows:
+            if period_type == 'daily':
+                key = row.date.strftime('%Y-%m-%d')
+            elif period_type == 'weekly':
+                key = (row.date - timedelta(days=row.date.weekday())).strftime('%Y-%m-%d')
+            else:
+                key = row.date.strftime('%Y-%m')
+            totals[key][0] += float(row.income or 0)
+            totals[key][1] += float(row.expense or 0)
+        
+        return [
+            {'period': label, 'income': totals[key][0], 'expense': totals[key][1]}
+            for _, key, label in buckets
+        ]
+    
+    @staticmethod
+    @cached_report
     def get_top_selling_books(start_date=None, end_date=None, limit=10):
         """获取畅销书籍排名
         
@@ -204,16 +386,17 @@ class FinanceService:
         ).join(
             SaleItem, SaleItem.book_id == Book.id
         ).join(
-            Sale, Sale.id == SaleItem.sale_id
+            Sale, and_(Sale.id == SaleItem.sale_id, Sale.sale_date == SaleItem.sale_date)
         ).filter(
             Sale.status == SALE_STATUS['COMPLETED']
         )
         
+        # 两张表都带上分区键的范围条件，PostgreSQL 只扫描相关月份的分区
         if start_date:
-            query = query.filter(Sale.sale_date >= start_date)
+            query = query.filter(Sale.sale_date >= start_date, SaleItem.sale_date >= start_date)
         
         if end_date:
-            query = query.filter(Sale.sale_date <= end_date)
+            query = query.filter(Sale.sale_date <= end_date, SaleItem.sale_date <= end_date)
             
         query = query.group_by(Book.id).order_by(desc('total_quantity')).limit(limit)
         
@@ -234,6 +417,7 @@ class FinanceService:
         return top_books
     
     @staticmethod
+    @cached_report
     def get_revenue_by_category(start_date=None, end_date=None):
         """按分类获取销售收入统计
         
@@ -256,16 +440,17 @@ class FinanceService:
         ).join(
             SaleItem, SaleItem.book_id == Book.id
         ).join(
-            Sale, Sale.id == SaleItem.sale_id
+            Sale, and_(Sale.id == SaleItem.sale_id, Sale.sale_date == SaleItem.sale_date)
         ).filter(
             Sale.status == SALE_STATUS['COMPLETED']
         )
         
+        # 两张表都带上分区键的范围条件，PostgreSQL 只扫描相关月份的分区
         if start_date:
-            query = query.filter(Sale.sale_date >= start_date)
+            query = query.filter(Sale.sale_date >= start_date, SaleItem.sale_date >= start_date)
         
         if end_date:
-            query = query.filter(Sale.sale_date <= end_date)
+            query = query.filter(Sale.sale_date <= end_date, SaleItem.sale_date <= end_date)
             
         query = query.group_by(Book.publisher).order_by(desc('total_revenue'))
         
@@ -283,16 +468,8 @@ class FinanceService:
         return categories
     
     @staticmethod
-    def get_profit_analysis(start_date=None, end_date=None):
-        """利润分析
-        
-        Args:
-            start_date: 开始日期
-            end_date: 结束日期
-            
-        Returns:
-            dict: 利润分析数据
-        """
+    def _revenue_and_cost(start_date=None, end_date=None):
+        """从明细表计算销售额与进货成本"""
         # 获取收入（销售额）
         sales_query = db.session.query(
             func.sum(Sale.total_amount).label('total_revenue')
@@ -306,10 +483,10 @@ class FinanceService:
             
         total_revenue = sales_query.scalar() or 0
         
-        # 获取支出（采购成本）
+        # 获取支出（采购成本），已入库的订单同样已经付款
         purchase_query = db.session.query(
             func.sum(PurchaseOrder.total_amount).label('total_cost')
-        ).filter(PurchaseOrder.status == ORDER_STATUS['PAID'])
+        ).filter(PurchaseOrder.status.in_(PAID_ORDER_STATUSES))
         
         if start_date:
             purchase_query = purchase_query.filter(PurchaseOrder.order_date >= start_date)
@@ -319,22 +496,46 @@ class FinanceService:
             
         total_cost = purchase_query.scalar() or 0
         
-        # 计算其他支出（从Transaction表获取）
-        other_expense_query = db.session.query(
-            func.sum(Transaction.amount).label('total_expense')
-        ).filter(
-            Transaction.type == TRANSACTION_TYPES['EXPENSE'],
-            # 不包括采购支出，避免重复计算
-            Transaction.reference_type != 'PURCHASE'
-        )
-        
-        if start_date:
-            other_expense_query = other_expense_query.filter(Transaction.transaction_date >= start_date)
+        return total_revenue, total_cost
+    
+    @staticmethod
+    @cached_report
+    def get_profit_analysis(start_date=None, end_date=None):
+        """利润分析
         
-        if end_date:
-            other_expense_query = other_expense_query.filter(Transaction.transaction_date <= end_date)
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
             
-        other_expenses = other_expense_query.scalar() or 0
+        Returns:
+            dict: 利润分析数据
+        """
+        days = FinanceService._rollup_days(start_date, end_date)
+        if days:
+            totals = FinanceService._rollup_query(
+                days,
+                func.sum(DailyFinanceRollup.sale_revenue),
+                func.sum(DailyFinanceRollup.purchase_cost),
+                func.sum(DailyFinanceRollup.other_expense)
+            ).first()
+            total_revenue = totals[0] or 0
+            total_cost = totals[1] or 0
+            other_expenses = totals[2] or 0
+        else:
+            total_revenue, total_cost = FinanceService._revenue_and_cost(start_date, end_date)
+            
+            # 计算其他支出（从Transaction表获取），不包括进货付款，避免与采购成本重复计算
+            other_expense_query = db.session.query(
+                func.sum(Transaction.amount).label('total_expense')
+            ).filter(OTHER_EXPENSE_CONDITION)
+            
+            if start_date:
+                other_expense_query = other_expense_query.filter(Transaction.transaction_date >= start_date)
+            
+            if end_date:
+                other_expense_query = other_expense_query.filter(Transaction.transaction_date <= end_date)
+                
+            other_expenses = other_expense_query.scalar() or 0
         
         # 计算毛利和净利
         gross_profit = float(total_revenue) - float(total_cost)
@@ -0,0 +1,326 @@
+"""书籍库存的内存读模型
+
+以书籍ID为下标的定长数组保存库存、零售价 (分) 和上架状态，启动时一次扫描 books 表构建，
+之后由会话事件增量维护：
+
+- 原子扣减和 PostgreSQL 上的批量增减库存从 RETURNING 记录写入后的值，ORM 新建的 Book 在 flush 时记录
+- ORM 修改或删除的 Book 在 flush 时记录ID，其他 Core 语句 (SQLite 上的批量增减库存等) 通过
+  mark_books_changed 记录ID；这些书籍在提交前 (before_commit) 用本事务的连接重新读取一次
+- 提交后 (after_commit) 直接把记录的值写入数组，不访问数据库，也不另外占用连接池中的连接
+- 回滚时丢弃记录，读模型不会看到未提交的修改
+
+每个条目带有提交序号 (在 before_commit 中分配)，只有更新的序号才能覆盖条目：同一本书的两个事务
+因行锁依次提交，后提交的事务在前一个提交之后才读到写入后的值，序号也更大，因此即使两者的
+after_commit 乱序执行，也不会留下旧值。
+
+陈旧时间：同一进程内的写操作在提交后、请求返回前就已写入读模型；
+多进程部署时其他进程的写入不会通知到本进程，读模型超过 INVENTORY_TTL 秒后由一个请求重建
+(其他请求在重建期间继续读取旧的数组)，因此跨进程的陈旧时间约为 INVENTORY_TTL。
+`flask check-inventory` 和 GET /api/books/stock/consistency 可以核对读模型与数据库是否一致。
+"""
+import itertools
+import logging
+import threading
+import time
+from array import array
+from decimal import Decimal
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from ..models.book import Book, CHANGED_BOOKS_KEY
+from ..database import db
+
+logger = logging.getLogger(__name__)
+
+# 上架状态数组中的取值
+ABSENT, INACTIVE, ACTIVE = -1, 0, 1
+
+# session.info 中待提交后写入读模型的条目: (读模型, 提交序号, {书籍ID: 条目})，条目为 None 表示整体重建
+PENDING_KEY = 'inventory_pending'
+
+# 已删除的书籍
+DELETED = (0, 0, ABSENT)
+
+
+def _cents(price):
+    return int((Decimal(price) * 100).to_integral_value())
+
+
+def _entry(quantity, price, is_active):
+    return quantity, _cents(price), ACTIVE if is_active else INACTIVE
+
+
+class InventoryReadModel:
+    """书籍ID -> (库存, 零售价, 是否上架) 的数组映射，查询不访问数据库"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # 同一时间只有一个线程扫描 books 表
+        self._build_lock = threading.Lock()
+        self._sequence = itertools.count(1)
+        self._quantity = array('q')
+        self._price = array('q')
+        self._active = array('b')
+        self._seq = array('q')
+        self._built_at = None
+        # 已分配序号但尚未提交或回滚的事务
+        self._in_flight = set()
+        # 构建期间写入的书籍，构建完成后保留这些条目而不是扫描到的值
+        self._touched = None
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    @staticmethod
+    def _rows(connection, book_ids=None):
+        """读取书籍的库存字段"""
+        stmt = select(Book.id, Book.quantity, Book.retail_price, Book.is_active)
+        if book_ids is not None:
+            stmt = stmt.where(Book.id.in_(book_ids))
+        return connection.execute(stmt).all()
+
+    @staticmethod
+    def _set(arrays, book_id, quantity, price, active, seq):
+        quantities, prices, flags, seqs = arrays
+        if book_id >= len(flags):
+            grow = max(book_id + 1 - len(flags), len(flags) // 2, 1024)
+            quantities.extend(array('q', bytes(8 * grow)))
+            prices.extend(array('q', bytes(8 * grow)))
+            flags.extend(array('b', [ABSENT]) * grow)
+            seqs.extend(array('q', bytes(8 * grow)))
+        quantities[book_id] = quantity
+        prices[book_id] = price
+        flags[book_id] = active
+        seqs[book_id] = seq
+
+    def _arrays(self):
+        return self._quantity, self._price, self._active, self._seq
+
+    def build(self):
+        """一次扫描 books 表构建读模型"""
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        with self._lock:
+            # 扫描开始时仍未提交的事务，它们的结果之后写入时要能覆盖扫描到的值
+            floor = min(self._in_flight, default=next(self._sequence)) - 1
+            self._touched = set()
+        try:
+            rows = self._rows(db.session.connection())
+        except BaseException:
+            with self._lock:
+                self._touched = None
+            raise
+
+        old_seq = self._seq
+        arrays = (array('q'), array('q'), array('b'), array('q'))
+        for book_id, quantity, price, is_active in rows:
+            # 保留已有条目的序号，之前已提交事务的迟到写入不能覆盖扫描到的值
+            seq = max(floor, old_seq[book_id]) if book_id < len(old_seq) else floor
+            self._set(arrays, book_id, *_entry(quantity, price, is_active), seq)
+
+        with self._lock:
+            old = self._arrays()
+            for book_id in self._touched:
+                self._set(arrays, book_id, old[0][book_id], old[1][book_id], old[2][book_id], old[3][book_id])
+            self._quantity, self._price, self._active, self._seq = arrays
+            self._built_at = time.monotonic()
+            self._touched = None
+        logger.info("库存读模型已构建", extra={'books': len(rows)})
+
+    def _ensure_built(self):
+        """未构建或已失效时等待构建；超过 TTL 时由一个线程重建，其他线程继续读取旧的数组"""
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self._build()
+        elif self.ttl is not None and time.monotonic() - self._built_at > self.ttl:
+            if self._build_lock.acquire(blocking=False):
+                try:
+                    self._build()
+                finally:
+                    self._build_lock.release()
+
+    def begin_commit(self):
+        """为即将提交的事务分配序号"""
+        with self._lock:
+            seq = next(self._sequence)
+            self._in_flight.add(seq)
+        return seq
+
+    def end_commit(self, seq, entries=None):
+        """事务结束：提交时 entries 为 {书籍ID: 条目} 并写入读模型，回滚时为 None"""
+        with self._lock:
+            self._in_flight.discard(seq)
+            if not entries:
+                return
+            arrays = self._arrays()
+            for book_id, entry in entries.items():
+                if book_id < len(self._seq) and self._seq[book_id] >= seq:
+                    continue
+                self._set(arrays, book_id, *entry, seq)
+                if self._touched is not None:
+                    self._touched.add(book_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _lookup_locked(self, book_id):
+        if book_id < 0 or book_id >= len(self._active) or self._active[book_id] == ABSENT:
+            return None
+        return {
+            'book_id': book_id,
+            'quantity': self._quantity[book_id],
+            'retail_price': self._price[book_id] / 100,
+            'is_active': self._active[book_id] == ACTIVE,
+        }
+
+    def get_many(self, book_ids):
+        """返回 {书籍ID: 库存信息}，不存在的书籍不在结果中"""
+        self._ensure_built()
+        with self._lock:
+            found = {}
+            for book_id in book_ids:
+                item = self._lookup_locked(book_id)
+                if item is not None:
+                    found[book_id] = item
+            return found
+
+    def get(self, book_id):
+        return self.get_many((book_id,)).get(book_id)
+
+    def verify(self, repair=False):
+        """与数据库逐本比较，返回不一致的书籍列表；repair=True 时以数据库为准修正读模型"""
+        self._ensure_built()
+        rows = self._rows(db.session.connection())
+        mismatches = []
+        with self._lock:
+            seen = set()
+            seq = next(self._sequence)
+            arrays = self._arrays()
+            for book_id, quantity, price, is_active in rows:
+                seen.add(book_id)
+                expected = {'book_id': book_id, 'quantity': quantity,
+                            'retail_price': _cents(price) / 100, 'is_active': bool(is_active)}
+                actual = self._lookup_locked(book_id)
+                if actual != expected:
+                    mismatches.append({'book_id': book_id, 'expected': expected, 'actual': actual})
+                    if repair:
+                        self._set(arrays, book_id, *_entry(quantity, price, is_active), seq)
+            for book_id in range(len(self._active)):
+                if self._active[book_id] != ABSENT and book_id not in seen:
+                    mismatches.append({'book_id': book_id, 'expected': None, 'actual': self._lookup_locked(book_id)})
+                    if repair:
+                        self._set(arrays, book_id, *DELETED, seq)
+        return mismatches
+
+
+def get_inventory():
+    """获取当前应用的库存读模型 (首次查询时才从数据库构建)"""
+    model = current_app.extensions.get('inventory_read_model')
+    if model is None:
+        model = InventoryReadModel(ttl=current_app.config.get('INVENTORY_TTL'))
+        current_app.extensions['inventory_read_model'] = model
+    return model
+
+
+def _inserted_state(book):
+    """新建的 ORM 对象在 flush 后的库存字段，取不到时返回 None (提交前重新读取)
+
+    已有书籍只修改了部分字段时，对象中其他字段可能是本事务加锁前读到的旧值，因此一律重新读取。
+    """
+    state = inspect(book).dict
+    try:
+        quantity, price = state['quantity'], state['retail_price']
+        if not isinstance(quantity, int):
+            return None
+        return quantity, Decimal(str(price)), state.get('is_active')
+    except (KeyError, TypeError, ArithmeticError):
+        return None
+
+
+def _track_flushed_books(session, flush_context):
+    changed = None
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Book) and obj.id is not None:
+            if changed is None:
+                changed = session.info.setdefault(CHANGED_BOOKS_KEY, {})
+            if obj in session.deleted:
+                changed[obj.id] = DELETED
+            else:
+                changed[obj.id] = _inserted_state(obj) if obj in session.new else None
+
+
+def _capture_before_commit(session):
+    """提交前确定本事务写入后的库存字段，必要时用本事务的连接重新读取"""
+    if any(isinstance(obj, Book) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.flush()
+    changed = session.info.pop(CHANGED_BOOKS_KEY, None)
+    if not changed or not has_app_context():
+        return
+    model = current_app.extensions.get('inventory_read_model')
+    if model is None:
+        return
+    if None in changed:
+        session.info[PENDING_KEY] = (model, None, None)
+        return
+
+    unknown = [book_id for book_id, state in changed.items() if state is None]
+    if unknown:
+        for book_id, *state in InventoryReadModel._rows(session.connection(), unknown):
+            changed[book_id] = state
+    entries = {
+        book_id: DELETED if state is None or state is DELETED else _entry(*state)
+        for book_id, state in changed.items()
+    }
+    # 在读取之后分配序号：同一本书的下一个事务要等本事务提交才能写入并读取，序号一定更大
+    session.info[PENDING_KEY] = (model, model.begin_commit(), entries)
+
+
+def _apply_after_commit(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending is None:
+        return
+    model, seq, entries = pending
+    if seq is None:
+        model.invalidate()
+    else:
+        model.end_commit(seq, entries)
+
+
+def _discard_after_rollback(session):
+    session.info.pop(CHANGED_BOOKS_KEY, None)
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending is not None and pending[1] is not None:
+        pending[0].end_commit(pending[1])
+
+
+_listeners_lock = threading.Lock()
+_listeners_registered = False
+
+
+def init_inventory(app):
+    """注册会话事件；INVENTORY_PRELOAD 为真时在启动时构建读模型"""
+    global _listeners_registered
+    with _listeners_lock:
+        if not _listeners_registered:
+            event.listen(Session, 'after_flush', _track_flushed_books)
+            event.listen(Session, 'before_commit', _capture_before_commit)
+            event.listen(Session, 'after_commit', _apply_after_commit)
+            event.listen(Session, 'after_rollback', _discard_after_rollback)
+            _listeners_registered = True
+
+    if app.config.get('INVENTORY_PRELOAD'):
+        with app.app_context():
+            try:
+                get_inventory().build()
+            except SQLAlchemyError as e:
+                # 例如尚未执行迁移；第一次查询时再构建
+                logger.warning("启动时构建库存读模型失败，将在第一次查询时构建", extra={'error': e.__class__.__name__})
+            finally:
+                db.session.rollback()
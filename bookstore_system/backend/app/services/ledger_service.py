@@ -0,0 +1,163 @@
+"""财务账本写入
+
+默认情况下销售、退款和取消在请求事务中直接插入 Transaction。启用 LEDGER_OUTBOX_ENABLED 后改为
+事务性发件箱：请求事务只插入一条 LedgerOutbox，由账本工作进程 (应用内线程或 `flask ledger-worker`
+独立进程) 批量生成 Transaction。按日汇总表仍在请求事务中更新，因此读取汇总表的报表
+(整天日期范围) 不受积压影响；直接扫描 transactions 的查询 (交易明细列表、非整天范围或关闭
+FINANCE_ROLLUP_ENABLED 时的报表) 会滞后最多一个轮询周期。每批提交后使报表缓存失效，
+避免这些报表在缓存有效期内继续返回积压前的结果。
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import delete, func, insert
+from ..models.ledger_outbox import LedgerOutbox
+from ..models.transaction import Transaction
+from ..database import db
+from ..utils.metrics import LEDGER_PROCESSED
+from .report_cache import invalidate_reports
+
+logger = logging.getLogger(__name__)
+
+# 发件箱记录复制到 Transaction 的字段
+LEDGER_FIELDS = ('amount', 'type', 'description', 'reference_id', 'reference_type', 'transaction_date', 'user_id')
+
+
+class LedgerService:
+    """账本写入与发件箱处理"""
+
+    @staticmethod
+    def outbox_enabled():
+        return current_app.config.get('LEDGER_OUTBOX_ENABLED', False)
+
+    @staticmethod
+    def record(**fields):
+        """在当前事务中记录一笔交易 (发件箱模式下为发件箱记录)，调用方负责提交"""
+        model = LedgerOutbox if LedgerService.outbox_enabled() else Transaction
+        entry = model(**fields)
+        db.session.add(entry)
+        return entry
+
+    @staticmethod
+    def record_many(entries):
+        """在当前事务中以一条多行 INSERT 记录多笔交易，entries 为字段字典列表，调用方负责提交"""
+        if not entries:
+            return
+        model = LedgerOutbox if LedgerService.outbox_enabled() else Transaction
+        db.session.execute(insert(model.__table__), entries)
+
+    @staticmethod
+    def process_batch(batch_size=500):
+        """把最早的一批发件箱记录写入 transactions 并删除，返回处理的条数
+
+        插入交易和删除发件箱记录在同一事务中提交。PostgreSQL 上用 FOR UPDATE SKIP LOCKED
+        让多个工作进程领取不同的记录；其他数据库上如果删除的行数少于读取的行数
+        (已被另一个工作进程处理)，整批回滚。因此每条发件箱记录恰好生成一笔交易。
+        """
+        query = db.session.query(LedgerOutbox).order_by(LedgerOutbox.id).limit(batch_size)
+        if db.session.get_bind().dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        entries = query.all()
+        if not entries:
+            db.session.rollback()
+            return 0
+
+        ids = [entry.id for entry in entries]
+        # 交易时间以不带时区的 UTC 保存；积压跨过零点时过去日期的报表同样失效
+        today = datetime.now(timezone.utc).date()
+        historical = any(entry.transaction_date.date() < today for entry in entries)
+        try:
+            db.session.execute(insert(Transaction), [
+                {field: getattr(entry, field) for field in LEDGER_FIELDS} for entry in entries
+            ])
+            deleted = db.session.execute(
+                delete(LedgerOutbox).where(LedgerOutbox.id.in_(ids)).execution_options(synchronize_session=False)
+            ).rowcount
+            if deleted != len(ids):
+                db.session.rollback()
+                logger.warning("发件箱记录已被其他工作进程处理，本批回滚", extra={'batch': len(ids), 'deleted': deleted})
+                return 0
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        invalidate_reports(historical=historical)
+        LEDGER_PROCESSED.inc(len(ids))
+        return len(ids)
+
+    @staticmethod
+    def drain(batch_size=500):
+        """处理发件箱直到清空，返回处理的总条数"""
+        total = 0
+        while True:
+            processed = LedgerService.process_batch(batch_size)
+            total += processed
+            if processed < batch_size:
+                return total
+
+    @staticmethod
+    def lag():
+        """发件箱积压：(待处理条数, 最早一条已等待的秒数)"""
+        pending, oldest = db.session.query(func.count(LedgerOutbox.id), func.min(LedgerOutbox.created_at)).one()
+        if oldest is None:
+            return 0, 0.0
+        age = datetime.now(timezone.utc).replace(tzinfo=None) - oldest
+        return pending, max(age.total_seconds(), 0.0)
+
+
+class LedgerWorker:
+    """应用内的账本工作线程，每隔 interval 秒清空一次发件箱"""
+
+    def __init__(self, app, batch_size=500, interval=1.0):
+        self.app = app
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """在当前进程中启动线程 (fork 出的工作进程不会继承父进程的线程)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='ledger-worker', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self._pid = None
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(self.interval)
+            try:
+                with self.app.app_context():
+                    LedgerService.drain(self.batch_size)
+            except Exception:
+                logger.exception("账本工作线程处理发件箱失败")
+            if stopping:
+                return
+
+
+def init_ledger(app):
+    """发件箱模式且 LEDGER_WORKER_MODE=thread 时，在处理第一个请求前启动应用内工作线程"""
+    if not app.config.get('LEDGER_OUTBOX_ENABLED') or app.config.get('LEDGER_WORKER_MODE', 'thread') != 'thread':
+        return
+
+    worker = LedgerWorker(app, app.config.get('LEDGER_BATCH_SIZE', 500), app.config.get('LEDGER_POLL_INTERVAL', 1.0))
+    app.extensions['ledger_worker'] = worker
+
+    @app.before_request
+    def start_ledger_worker():
+        worker.ensure_started()
@@ -0,0 +1,178 @@
+"""交易和销售表的按月分区维护 (仅 PostgreSQL)
+
+transactions、sales、sale_items 在 PostgreSQL 上按日期列 RANGE 分区，每月一个分区，
+命名为 <表名>_YYYY_MM，另有 <表名>_default 接收没有对应月份分区的行。
+报表查询带上分区键的范围条件后，规划器只扫描相关月份的分区 (partition pruning)。
+
+其他数据库上这些表保持为普通表，本模块的方法不做任何操作。
+"""
+import re
+from datetime import date
+from sqlalchemy import text
+from ..database import db
+
+# 分区表及其分区键，顺序即创建分区的顺序 (被引用的 sales 先于 sale_items)
+PARTITIONED_TABLES = {
+    'transactions': 'transaction_date',
+    'sales': 'sale_date',
+    'sale_items': 'sale_date',
+}
+
+# 归档分区移入的 schema
+ARCHIVE_SCHEMA = 'archive'
+
+
+def month_start(value):
+    """所在月份的第一天"""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_{month:%Y_%m}'
+
+
+def _parse_month(table, name):
+    """从分区名解析月份，默认分区或不符合命名规则时返回 None"""
+    match = re.fullmatch(rf'{re.escape(table)}_(\d{{4}})_(\d{{2}})', name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(conn, table):
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {'table': table}
+    ).scalar()
+    return relkind == 'p'
+
+
+def list_partitions(conn, table):
+    """返回 [(分区名, 月份或 None), ...]，按名称排序"""
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+    ), {'table': table})
+    return [(name, _parse_month(table, name)) for name, in rows]
+
+
+def create_month_partition(conn, table, month):
+    """创建某个月的分区，已存在时返回 False
+
+    默认分区中已有该月的行时 (例如没有提前创建分区)，先建普通表并把这些行移过去，
+    再 ATTACH 为分区；调用方需要在同一事务中先 SET CONSTRAINTS ALL DEFERRED，
+    使 sale_items 对 sales 的外键在提交时才检查。
+    """
+    name = partition_name(table, month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar() is not None:
+        return False
+
+    key = PARTITIONED_TABLES[table]
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    bounds = f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    default = f'{table}_default'
+    in_range = f"{key} >= '{lower}' AND {key} < '{upper}'"
+
+    has_default = conn.execute(text("SELECT to_regclass(:name)"), {'name': default}).scalar() is not None
+    if has_default and conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})")).scalar():
+        conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+        conn.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}"))
+        conn.execute(text(f"DELETE FROM {default} WHERE {in_range}"))
+        conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} {bounds}"))
+    else:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {table} {bounds}"))
+    return True
+
+
+def create_default_partition(conn, table):
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+
+
+class PartitionService:
+    """分区的创建和归档"""
+
+    @staticmethod
+    def supported():
+        """当前数据库上这些表是否已分区"""
+        conn = db.session.connection()
+        return conn.dialect.name == 'postgresql' and all(
+            is_partitioned(conn, table) for table in PARTITIONED_TABLES
+        )
+
+    @staticmethod
+    def list_partitions():
+        """各分区表的分区列表 {表名: [(分区名, 月份或 None), ...]}"""
+        if not PartitionService.supported():
+            return {}
+        conn = db.session.connection()
+        return {table: list_partitions(conn, table) for table in PARTITIONED_TABLES}
+
+    @staticmethod
+    def create_partitions(months_ahead=3, today=None):
+        """确保从本月起到之后 months_ahead 个月的分区都已存在
+
+        Returns:
+            list: 新创建的分区名
+        """
+        if not PartitionService.supported():
+            return []
+
+        current = month_start(today or date.today())
+        conn = db.session.connection()
+        conn.execute(text("SET CONSTRAINTS ALL DEFERRED"))
+        created = []
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            for table in PARTITIONED_TABLES:
+                if create_month_partition(conn, table, month):
+                    created.append(partition_name(table, month))
+        db.session.commit()
+        return created
+
+    @staticmethod
+    def archive_partitions(before, mode='detach', tablespace=None):
+        """处理 before 所在月份之前的全部月分区
+
+        Args:
+            before: 日期，早于其所在月份的分区会被处理
+            mode: 'detach' 只从分区表上分离，保留在原 schema 中；
+                  'archive' 分离后移入 archive schema，指定 tablespace 时同时移到该表空间
+            tablespace: 归档表使用的表空间 (例如放在压缩文件系统上)
+
+        Returns:
+            list: 被处理的分区名 (archive 模式下为 archive.<分区名>)
+        """
+        if mode not in ('detach', 'archive'):
+            raise ValueError(f"无效的归档方式: {mode}")
+        if not PartitionService.supported():
+            return []
+
+        cutoff = month_start(before)
+        conn = db.session.connection()
+        if mode == 'archive':
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+
+        processed = []
+        # 先分离引用方 sale_items，再分离被引用的 sales
+        for table in reversed(list(PARTITIONED_TABLES)):
+            for name, month in list_partitions(conn, table):
+                if month is None or month >= cutoff:
+                    continue
+                conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                if table == 'sale_items':
+                    # 分离后的表仍保留指向 sales 的外键，会阻止随后分离同月的 sales 分区
+                    for constraint, in conn.execute(text(
+                        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:name) "
+                        "AND contype = 'f' AND confrelid = 'sales'::regclass"
+                    ), {'name': name}).all():
+                        conn.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+                if mode == 'archive':
+                    conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+                    name = f'{ARCHIVE_SCHEMA}.{name}'
+                    if tablespace:
+                        conn.execute(text(f'ALTER TABLE {name} SET TABLESPACE "{tablespace}"'))
+                processed.append(name)
+        db.session.commit()
+        return processed
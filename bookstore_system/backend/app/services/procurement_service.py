@@ -1 +1,249 @@
- 
+"""进货订单批量创建与入库
+
+批量创建时先逐单校验字段，再对所有订单引用的 book_id 和 ISBN 执行一条 IN 查询，
+订单和订单项各以一条多行 INSERT (executemany) 写入。
+
+入库按集合执行，语句数与订单行数无关：
+一条 IN 查询找出新书 ISBN 中已存在的书籍，一条 UPDATE ... FROM (VALUES ...) 增加库存和更新零售价，
+一条多行 INSERT ... RETURNING id 创建新书，再以一条批量 UPDATE 把订单项关联到书籍。
+"""
+import logging
+import uuid
+from decimal import Decimal
+from datetime import datetime, timezone
+from marshmallow import ValidationError
+from sqlalchemy import insert, update, or_
+from ..models.book import Book, CST, mark_books_changed
+from ..models.purchase_order import PurchaseOrder, PurchaseOrderItem, ORDER_STATUS
+from ..schemas.purchase_order_schema import BulkPurchaseOrderSchema
+from .book_import_service import iter_csv_rows
+from ..database import db
+
+logger = logging.getLogger(__name__)
+
+# 未提供建议零售价时，新书零售价为进货价的倍数
+DEFAULT_MARKUP = Decimal('1.5')
+
+# 一次批量创建请求最多包含的订单数
+MAX_BULK_ORDERS = 200
+
+# CSV 中属于订单 (而不是订单项) 的列，order_ref 相同的行属于同一订单
+ORDER_CSV_FIELDS = ('supplier', 'remarks')
+
+
+def orders_from_csv(stream):
+    """把 CSV (每行一个订单项) 按 order_ref 分组为订单
+
+    supplier/remarks 取该订单第一行的值，其余列为订单项字段。
+
+    Returns:
+        tuple: (订单列表, 无法归入订单的行的错误列表)
+    """
+    orders, errors = {}, []
+    for line, data, error in iter_csv_rows(stream):
+        ref = data.pop('order_ref', None) if data else None
+        if error or not ref:
+            errors.append({'line': line, 'errors': error or '缺少 order_ref'})
+            continue
+        order = orders.get(ref)
+        if order is None:
+            order = orders[ref] = {'ref': ref, 'items': []}
+            order.update({field: data[field] for field in ORDER_CSV_FIELDS if field in data})
+        order['items'].append({key: value for key, value in data.items() if key not in ORDER_CSV_FIELDS})
+    return list(orders.values()), errors
+
+
+class ProcurementService:
+    """进货订单服务"""
+
+    @staticmethod
+    def create_orders(orders, user_id):
+        """批量创建进货订单并提交，有错误的订单不会创建，不影响其他订单
+
+        Args:
+            orders: 订单数据列表 (同 BulkPurchaseOrderSchema)
+            user_id: 创建订单的用户ID
+
+        Returns:
+            list: 按输入顺序的逐单结果，成功时包含 id/order_number/total_amount，失败时包含 errors
+
+        Raises:
+            ValueError: 订单数超过 MAX_BULK_ORDERS
+        """
+        if len(orders) > MAX_BULK_ORDERS:
+            raise ValueError(f"一次最多创建 {MAX_BULK_ORDERS} 个订单")
+
+        schema = BulkPurchaseOrderSchema()
+        results = []
+        loaded = []
+        for index, raw in enumerate(orders):
+            result = {'index': index, 'ref': raw.get('ref') if isinstance(raw, dict) else None}
+            results.append(result)
+            try:
+                loaded.append((result, schema.load(raw)))
+            except ValidationError as err:
+                result['errors'] = err.messages
+
+        # 所有订单引用的书籍一次查询：book_id 必须存在，未指定 book_id 但 ISBN 已存在的关联到已有书籍
+        book_ids = {item['book_id'] for _, order in loaded for item in order['items'] if item.get('book_id')}
+        isbns = {item['isbn'] for _, order in loaded for item in order['items']
+                 if not item.get('book_id') and item.get('isbn')}
+        known_ids, isbn_ids = set(), {}
+        if book_ids or isbns:
+            for book_id, isbn in db.session.query(Book.id, Book.isbn)\
+                    .filter(or_(Book.id.in_(book_ids), Book.isbn.in_(isbns))):
+                known_ids.add(book_id)
+                isbn_ids[isbn] = book_id
+
+        now = datetime.now(timezone.utc)
+        valid = []
+        for result, order in loaded:
+            item_errors = {}
+            for position, item in enumerate(order['items']):
+                if item.get('book_id'):
+                    if item['book_id'] not in known_ids:
+                        item_errors[position] = {'book_id': ['指定的书籍不存在']}
+                elif item.get('isbn') in isbn_ids:
+                    item['book_id'] = isbn_ids[item['isbn']]
+            if item_errors:
+                result['errors'] = {'items': item_errors}
+                continue
+            order['order_number'] = f"PO-{uuid.uuid4().hex[:8].upper()}"
+            order['total_amount'] = sum(item['purchase_price'] * item['quantity'] for item in order['items'])
+            valid.append((result, order))
+
+        if not valid:
+            return results
+
+        order_table = PurchaseOrder.__table__
+        inserted = db.session.execute(
+            insert(order_table).returning(order_table.c.id, order_table.c.order_number),
+            [{
+                'order_number': order['order_number'],
+                'order_date': now,
+                'status': ORDER_STATUS['UNPAID'],
+                'total_amount': order['total_amount'],
+                'supplier': order.get('supplier'),
+                'remarks': order.get('remarks'),
+                'user_id': user_id,
+                'created_at': now,
+                'updated_at': now,
+            } for _, order in valid]
+        )
+        order_ids = {number: order_id for order_id, number in inserted}
+
+        db.session.execute(insert(PurchaseOrderItem.__table__), [{
+            'purchase_order_id': order_ids[order['order_number']],
+            'book_id': item.get('book_id'),
+            'isbn': item.get('isbn'),
+            'title': item.get('title'),
+            'author': item.get('author'),
+            'publisher': item.get('publisher'),
+            'quantity': item['quantity'],
+            'purchase_price': item['purchase_price'],
+            'suggested_retail_price': item.get('suggested_retail_price'),
+            'created_at': now,
+            'updated_at': now,
+        } for _, order in valid for item in order['items']])
+        db.session.commit()
+
+        for result, order in valid:
+            result.update({
+                'id': order_ids[order['order_number']],
+                'order_number': order['order_number'],
+                'total_amount': float(order['total_amount']),
+                'items': len(order['items']),
+            })
+        logger.info("批量创建进货订单", extra={
+            'orders': len(orders), 'orders_created': len(valid),
+            'items': sum(len(order['items']) for _, order in valid),
+        })
+        return results
+
+    @staticmethod
+    def stock_in(order):
+        """在当前事务中将已支付的订单入库，调用方负责提交
+
+        订单状态以条件 UPDATE (status = PAID) 改为已入库，并发的重复入库只有一个能成功。
+        没有关联书籍、但 ISBN 已存在的订单项按已有书籍入库；同一 ISBN 的多行新书合并为一本。
+
+        Args:
+            order: 进货订单
+
+        Returns:
+            dict: updated 增加库存的已有书籍数，created 新建书籍数，book_ids 涉及的书籍ID
+
+        Raises:
+            ValueError: 订单状态不是已支付，或新书缺少 ISBN
+        """
+        items = order.items
+        new_items = [item for item in items if not item.book_id]
+        if any(not item.isbn for item in new_items):
+            raise ValueError("新书缺少ISBN，无法入库")
+
+        claimed = db.session.execute(
+            update(PurchaseOrder.__table__)
+            .where(PurchaseOrder.__table__.c.id == order.id,
+                   PurchaseOrder.__table__.c.status == ORDER_STATUS['PAID'])
+            .values(status=ORDER_STATUS['STOCKED'], updated_at=datetime.now(timezone.utc))
+        ).rowcount
+        if not claimed:
+            raise ValueError("只有已支付的订单可以进行入库操作")
+
+        # 订单项ID -> 书籍ID，只记录需要回写 book_id 的订单项
+        links = {}
+        existing = {}
+        if new_items:
+            isbns = {item.isbn for item in new_items}
+            existing = dict(db.session.query(Book.isbn, Book.id).filter(Book.isbn.in_(isbns)).all())
+
+        deltas = {}
+        new_books = {}
+        for item in items:
+            book_id = item.book_id or existing.get(item.isbn)
+            if book_id:
+                amount, price = deltas.get(book_id, (0, None))
+                deltas[book_id] = (amount + item.quantity, item.suggested_retail_price or price)
+                if not item.book_id:
+                    links[item.id] = book_id
+            elif item.isbn in new_books:
+                new_books[item.isbn]['quantity'] += item.quantity
+            else:
+                new_books[item.isbn] = {
+                    'isbn': item.isbn,
+                    'name': item.title,
+                    'author': item.author,
+                    'publisher': item.publisher,
+                    'retail_price': item.suggested_retail_price
+                                    or (item.purchase_price * DEFAULT_MARKUP).quantize(Decimal('0.01')),
+                    'quantity': item.quantity,
+                    'is_active': True,
+                }
+
+        Book.apply_stock_deltas(deltas)
+
+        created = {}
+        if new_books:
+            now = datetime.now(CST)
+            rows = [{**book, 'created_at': now, 'updated_at': now} for book in new_books.values()]
+            table = Book.__table__
+            result = db.session.execute(
+                insert(table).returning(table.c.id, table.c.isbn), rows
+            )
+            created = {isbn: book_id for book_id, isbn in result}
+            mark_books_changed(created.values())
+            for item in new_items:
+                if item.isbn in created:
+                    links[item.id] = created[item.isbn]
+
+        if links:
+            db.session.execute(
+                update(PurchaseOrderItem),
+                [{'id': item_id, 'book_id': book_id} for item_id, book_id in links.items()]
+            )
+
+        return {
+            'updated': len(deltas),
+            'created': len(created),
+            'book_ids': list(deltas) + list(created.values()),
+        }
@@ -0,0 +1,202 @@
+"""财务报表结果缓存
+
+报表结果按 (方法名, 规范化参数, 数据版本) 缓存。写操作提交后调用 invalidate_reports 增加版本号，
+旧版本的条目不再被读取，随过期或 LRU 淘汰。版本号分两类：
+
+- current: 新的销售只影响包含今天 (UTC) 的日期范围
+- history: 退款、取消、进货付款/退货/入库会修改过去日期的数据，所有范围都失效
+
+结束日期早于今天的范围只依赖 history 版本，使用较长的 REPORT_CACHE_HISTORICAL_TTL。
+
+后端由 REPORT_CACHE_BACKEND 选择：memory (进程内 LRU)、sqlite (REPORT_CACHE_PATH 指定的文件，
+多个工作进程共享条目和版本号) 或 none (不缓存)。
+"""
+import functools
+import inspect
+import json
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timezone
+from flask import current_app, has_app_context
+from ..utils.cache import TTLCache
+
+VERSION_CURRENT = 'current'
+VERSION_HISTORY = 'history'
+
+
+class MemoryReportBackend:
+    """进程内 LRU 缓存，多进程部署时各进程的条目和版本号互相独立"""
+
+    def __init__(self, maxsize, max_ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=max_ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl)
+
+    def get_version(self, name):
+        return self._versions.get(name, 0)
+
+    def bump_version(self, name):
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class SqliteReportBackend:
+    """基于 SQLite 文件的共享缓存，同一台机器上的多个工作进程共享条目和版本号"""
+
+    # 每写入多少次清理一次过期条目
+    PURGE_EVERY = 100
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS report_cache '
+                         '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS report_versions '
+                         '(name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM report_cache WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('INSERT OR REPLACE INTO report_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                     (key, json.dumps(value, ensure_ascii=False, default=str), now + ttl))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM report_cache WHERE expires_at <= ?', (now,))
+
+    def get_version(self, name):
+        row = self._connect().execute('SELECT version FROM report_versions WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, name):
+        self._connect().execute(
+            'INSERT INTO report_versions (name, version) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET version = version + 1', (name,)
+        )
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM report_cache').fetchone()[0]
+
+
+class ReportCache:
+    """报表缓存，hits/misses 会出现在 /metrics 的缓存指标中"""
+
+    def __init__(self, backend, ttl, historical_ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.historical_ttl = historical_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.backend)
+
+    def invalidate(self, historical=False):
+        self.backend.bump_version(VERSION_HISTORY if historical else VERSION_CURRENT)
+
+    def get_or_compute(self, name, arguments, compute):
+        """arguments 为已绑定默认值的参数字典"""
+        end_date = arguments.get('end_date')
+        # 销售和交易时间以不带时区的 UTC 保存，“今天”同样按 UTC 计算
+        today = datetime.now(timezone.utc).date()
+        historical = end_date is not None and _as_date(end_date) < today
+
+        versions = [self.backend.get_version(VERSION_HISTORY)]
+        if not historical:
+            # 结果依赖当天的数据 (以及未指定日期时的“今天”)
+            versions += [self.backend.get_version(VERSION_CURRENT), today.isoformat()]
+        key = json.dumps([name, versions, {k: _normalize(v) for k, v in arguments.items()}],
+                         ensure_ascii=False, sort_keys=True)
+
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        self.backend.set(key, value, self.historical_ttl if historical else self.ttl)
+        return value
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _normalize(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def create_report_cache(config):
+    backend_name = config.get('REPORT_CACHE_BACKEND', 'memory')
+    ttl = config.get('REPORT_CACHE_TTL', 60)
+    historical_ttl = config.get('REPORT_CACHE_HISTORICAL_TTL', 86400)
+    if backend_name == 'none' or ttl <= 0:
+        return None
+    if backend_name == 'memory':
+        backend = MemoryReportBackend(config.get('REPORT_CACHE_SIZE', 256), max(ttl, historical_ttl))
+    elif backend_name == 'sqlite':
+        if not config.get('REPORT_CACHE_PATH'):
+            raise ValueError('REPORT_CACHE_BACKEND=sqlite 时需要设置 REPORT_CACHE_PATH')
+        backend = SqliteReportBackend(config['REPORT_CACHE_PATH'])
+    else:
+        raise ValueError(f"未知的报表缓存后端: {backend_name}")
+    return ReportCache(backend, ttl, historical_ttl)
+
+
+def get_report_cache():
+    """获取当前应用的报表缓存，未启用时返回 None"""
+    extensions = current_app.extensions
+    if 'report_cache' not in extensions:
+        extensions['report_cache'] = create_report_cache(current_app.config)
+    return extensions['report_cache']
+
+
+def invalidate_reports(historical=False):
+    """写操作提交后调用；historical=True 表示修改了过去日期的数据"""
+    cache = get_report_cache()
+    if cache is not None:
+        cache.invalidate(historical)
+
+
+def cached_report(func):
+    """缓存 FinanceService 报表方法的结果 (需在 @staticmethod 之下)"""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = get_report_cache() if has_app_context() else None
+        if cache is None:
+            return func(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return cache.get_or_compute(func.__qualname__, dict(bound.arguments), lambda: func(*args, **kwargs))
+
+    return wrapper
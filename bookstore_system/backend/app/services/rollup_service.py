@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, case, insert, and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from ..models.finance_rollup import DailyFinanceRollup
+from ..models.transaction import Transaction, TRANSACTION_TYPES
+from ..models.sale import Sale, SALE_STATUS
+from ..models.purchase_order import PurchaseOrder, ORDER_STATUS
+from ..database import db
+
+# 汇总表中可累加的指标列
+ROLLUP_METRICS = ('income', 'expense', 'sale_count', 'sale_revenue', 'refund_count', 'purchase_cost',
+                  'other_expense')
+
+# 计入进货成本的订单状态（入库后的订单同样已经付款）
+PAID_ORDER_STATUSES = (ORDER_STATUS['PAID'], ORDER_STATUS['STOCKED'])
+
+# 进货付款交易的关联单据类型，其金额已按订单计入进货成本
+PURCHASE_PAYMENT_REFERENCE = 'purchase_order'
+
+# 其他支出：进货付款以外的支出交易 (退款、取消等)
+OTHER_EXPENSE_CONDITION = and_(
+    Transaction.type == TRANSACTION_TYPES['EXPENSE'],
+    or_(Transaction.reference_type.is_(None), Transaction.reference_type != PURCHASE_PAYMENT_REFERENCE)
+)
+
+
+class RollupService:
+    """按日财务汇总表的维护服务"""
+
+    @staticmethod
+    def record(day, **deltas):
+        """在当前事务中累加某一天的汇总指标
+
+        使用 INSERT ... ON CONFLICT DO UPDATE 原子地累加，调用方负责提交事务。
+
+        Args:
+            day: 日期 (date 或 datetime)
+            **deltas: 指标增量，例如 income=100, sale_count=1
+        """
+        if isinstance(day, datetime):
+            day = day.date()
+
+        values = {metric: deltas.get(metric, 0) for metric in ROLLUP_METRICS}
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect in ('postgresql', 'sqlite'):
+            dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            table = DailyFinanceRollup.__table__
+            stmt = dialect_insert(table).values(date=day, updated_at=datetime.now(timezone.utc), **values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.date],
+                set_={
+                    **{metric: table.c[metric] + stmt.excluded[metric] for metric in ROLLUP_METRICS},
+                    'updated_at': stmt.excluded.updated_at
+                }
+            )
+            db.session.execute(stmt)
+            return
+
+        # 其他数据库：先加锁读取再更新
+        rollup = db.session.query(DailyFinanceRollup).filter_by(date=day).with_for_update().first()
+        if rollup is None:
+            db.session.add(DailyFinanceRollup(date=day, **values))
+        else:
+            for metric, delta in values.items():
+                setattr(rollup, metric, getattr(rollup, metric) + delta)
+
+    @staticmethod
+    def rebuild(start_day=None, end_day=None):
+        """根据 transactions / sales / purchase_orders 重新计算汇总表
+
+        Args:
+            start_day: 起始日期(含)，为空表示不限
+            end_day: 结束日期(含)，为空表示不限
+
+        Returns:
+            int: 写入的汇总行数
+        """
+        # 避免循环导入
+        from .finance_service import FinanceService
+
+        lower = datetime.combine(start_day, datetime.min.time()) if start_day else None
+        upper = datetime.combine(end_day + timedelta(days=1), datetime.min.time()) if end_day else None
+
+        def day_range(query, column):
+            if lower is not None:
+                query = query.filter(column >= lower)
+            if upper is not None:
+                query = query.filter(column < upper)
+            return query
+
+        rows = {}
+
+        def accumulate(day_key, **metrics):
+            row = rows.setdefault(day_key, dict.fromkeys(ROLLUP_METRICS, 0))
+            for metric, value in metrics.items():
+                row[metric] += value or 0
+
+        # 1. 交易收入、支出与其他支出
+        day = FinanceService._period_bucket_expr('daily', Transaction.transaction_date).label('day')
+        query = db.session.query(
+            day,
+            func.sum(case((Transaction.type == TRANSACTION_TYPES['INCOME'], Transaction.amount), else_=0)),
+            func.sum(case((Transaction.type == TRANSACTION_TYPES['EXPENSE'], Transaction.amount), else_=0)),
+            func.sum(case((OTHER_EXPENSE_CONDITION, Transaction.amount), else_=0))
+        )
+        for day_key, income, expense, other_expense in day_range(query, Transaction.transaction_date).group_by(day):
+            accumulate(day_key, income=income, expense=expense, other_expense=other_expense)
+
+        # 2. 已完成销售单
+        day = FinanceService._period_bucket_expr('daily', Sale.sale_date).label('day')
+        query = db.session.query(day, func.count(Sale.id), func.sum(Sale.total_amount))\
+            .filter(Sale.status == SALE_STATUS['COMPLETED'])
+        for day_key, count, revenue in day_range(query, Sale.sale_date).group_by(day):
+            accumulate(day_key, sale_count=count, sale_revenue=revenue)
+
+        # 3. 退款/取消：以关联销售单的支出交易日期为准
+        day = FinanceService._period_bucket_expr('daily', Transaction.transaction_date).label('day')
+        query = db.session.query(day, func.count(Transaction.id))\
+            .join(Sale, Sale.sale_number == Transaction.reference_id)\
+            .filter(Transaction.type == TRANSACTION_TYPES['EXPENSE'])
+        for day_key, count in day_range(query, Transaction.transaction_date).group_by(day):
+            accumulate(day_key, refund_count=count)
+
+        # 4. 已付款进货单成本
+        day = FinanceService._period_bucket_expr('daily', PurchaseOrder.order_date).label('day')
+        query = db.session.query(day, func.sum(PurchaseOrder.total_amount))\
+            .filter(PurchaseOrder.status.in_(PAID_ORDER_STATUSES))
+        for day_key, cost in day_range(query, PurchaseOrder.order_date).group_by(day):
+            accumulate(day_key, purchase_cost=cost)
+
+        # 替换范围内的旧汇总数据
+        delete_query = db.session.query(DailyFinanceRollup)
+        if start_day:
+            delete_query = delete_query.filter(DailyFinanceRollup.date >= start_day)
+        if end_day:
+            delete_query = delete_query.filter(DailyFinanceRollup.date <= end_day)
+        delete_query.delete(synchronize_session=False)
+
+        if rows:
+            db.session.execute(insert(DailyFinanceRollup), [
+                {'date': datetime.strptime(day_key, '%Y-%m-%d').date(), **metrics}
+                for day_key, metrics in rows.items()
+            ])
+
+        db.session.commit()
+        return len(rows)
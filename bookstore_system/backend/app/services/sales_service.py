@@ -1 +1,199 @@
- 
+"""离线收银批量同步
+
+收银终端断网期间在本地排队的销售，恢复网络后按发生顺序一次上传。整批在一个事务中处理：
+
+1. 逐笔校验，按ID顺序对所有涉及的书籍加锁读取库存 (PostgreSQL 上为 FOR UPDATE)
+2. 按 (用户, client_ref) 一次查询找出已经上传过的销售
+3. 按上传顺序在内存中扣减库存，库存不足或书籍不存在的销售标记为冲突，不影响其他销售
+4. 每本书的扣减量汇总后以一条 UPDATE 写入，sales/sale_items/transactions 各以一条多行 INSERT 写入，
+   按日汇总表按销售日期各更新一次
+"""
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from marshmallow import ValidationError
+from sqlalchemy import insert
+from ..models.book import Book
+from ..models.sale import Sale, SaleItem, SALE_STATUS
+from ..models.transaction import TRANSACTION_TYPES
+from ..schemas.sale_schema import SaleBatchEntrySchema
+from .ledger_service import LedgerService
+from .rollup_service import RollupService
+from .report_cache import invalidate_reports
+from ..utils.metrics import SALES_TOTAL, SALES_REVENUE, SALES_ITEMS
+from ..database import db
+
+logger = logging.getLogger(__name__)
+
+# 一次批量上传最多包含的销售数
+MAX_BATCH_SALES = 2000
+
+# 逐笔结果状态
+BATCH_STATUS = {
+    'CREATED': 'created',      # 已创建
+    'DUPLICATE': 'duplicate',  # client_ref 已上传过 (或在本批中重复)，未重复创建
+    'CONFLICT': 'conflict',    # 书籍不存在或库存不足，未创建
+    'INVALID': 'invalid',      # 数据校验失败，未创建
+}
+
+
+class SalesService:
+    """销售服务"""
+
+    @staticmethod
+    def create_batch(entries, user_id):
+        """按顺序创建一批离线销售并提交
+
+        Args:
+            entries: 销售数据列表 (同 SaleBatchEntrySchema)，顺序即发生顺序，库存不足时先到先得
+            user_id: 上传的用户ID
+
+        Returns:
+            list: 与输入顺序一致的逐笔结果 (client_ref, status，成功时 id/sale_number/total_amount，
+                  重复时已有销售的 id/sale_number，失败时 error/errors)
+
+        Raises:
+            ValueError: 销售数超过 MAX_BATCH_SALES
+        """
+        if len(entries) > MAX_BATCH_SALES:
+            raise ValueError(f"一次最多上传 {MAX_BATCH_SALES} 笔销售")
+
+        schema = SaleBatchEntrySchema()
+        results = []
+        loaded = []
+        seen_refs = set()
+        for raw in entries:
+            result = {'client_ref': raw.get('client_ref') if isinstance(raw, dict) else None}
+            results.append(result)
+            try:
+                data = schema.load(raw)
+            except ValidationError as err:
+                result.update(status=BATCH_STATUS['INVALID'], errors=err.messages)
+                continue
+            if data['client_ref'] in seen_refs:
+                result.update(status=BATCH_STATUS['DUPLICATE'], error='与本批中前面的销售重复')
+                continue
+            seen_refs.add(data['client_ref'])
+            loaded.append((result, data))
+
+        # 一次加锁读取所有涉及的书籍，按ID排序与单笔销售的加锁顺序一致；
+        # 重复上传同一批销售的并发请求会在这里排队，之后的去重查询能看到先提交的销售
+        book_ids = sorted({item['book_id'] for _, data in loaded for item in data['items']})
+        stock = dict(
+            db.session.query(Book.id, Book.quantity).filter(Book.id.in_(book_ids)).order_by(Book.id).with_for_update()
+        ) if book_ids else {}
+
+        # 已经上传过的销售 (例如上一次上传的响应丢失后重传)
+        existing = {}
+        if seen_refs:
+            existing = {
+                client_ref: (sale_id, sale_number)
+                for client_ref, sale_id, sale_number in db.session.query(Sale.client_ref, Sale.id, Sale.sale_number)
+                .filter(Sale.user_id == user_id, Sale.client_ref.in_(seen_refs))
+            }
+        pending = []
+        for result, data in loaded:
+            if data['client_ref'] in existing:
+                sale_id, sale_number = existing[data['client_ref']]
+                result.update(status=BATCH_STATUS['DUPLICATE'], id=sale_id, sale_number=sale_number)
+            else:
+                pending.append((result, data))
+
+        now = datetime.now(timezone.utc)
+        accepted = []
+        for result, data in pending:
+            required = defaultdict(int)
+            for item in data['items']:
+                required[item['book_id']] += item['quantity']
+            error = None
+            for book_id, quantity in required.items():
+                if book_id not in stock:
+                    error = f"书籍ID {book_id} 不存在"
+                    break
+                if stock[book_id] < quantity:
+                    error = f"库存不足: 书籍ID {book_id} 当前库存{stock[book_id]}, 请求数量{quantity}"
+                    break
+            if error:
+                result.update(status=BATCH_STATUS['CONFLICT'], error=error)
+                continue
+            for book_id, quantity in required.items():
+                stock[book_id] -= quantity
+            data['sale_number'] = f"S{uuid.uuid4().hex[:8].upper()}"
+            # 与其他销售一致，以不带时区的 UTC 时间保存和按日汇总
+            data['sale_date'] = (data['sale_date'] or now).astimezone(timezone.utc).replace(tzinfo=None)
+            data['total_amount'] = sum(item['price'] * item['quantity'] for item in data['items'])
+            accepted.append((result, data))
+
+        if not accepted:
+            db.session.rollback()  # 释放书籍行锁
+            return results
+
+        deltas = defaultdict(int)
+        for _, data in accepted:
+            for item in data['items']:
+                deltas[item['book_id']] -= item['quantity']
+        Book.apply_stock_deltas({book_id: (delta, None) for book_id, delta in deltas.items()})
+
+        sale_table = Sale.__table__
+        inserted = db.session.execute(
+            insert(sale_table).returning(sale_table.c.id, sale_table.c.sale_number),
+            [{
+                'sale_number': data['sale_number'],
+                'sale_date': data['sale_date'],
+                'status': SALE_STATUS['COMPLETED'],
+                'total_amount': data['total_amount'],
+                'customer_name': data.get('customer_name'),
+                'contact': data.get('contact'),
+                'payment_method': data.get('payment_method', 'CASH'),
+                'remarks': data.get('remarks'),
+                'client_ref': data['client_ref'],
+                'user_id': user_id,
+            } for _, data in accepted]
+        )
+        sale_ids = {sale_number: sale_id for sale_id, sale_number in inserted}
+
+        db.session.execute(insert(SaleItem.__table__), [{
+            'sale_id': sale_ids[data['sale_number']],
+            'sale_date': data['sale_date'],
+            'book_id': item['book_id'],
+            'quantity': item['quantity'],
+            'price': item['price'],
+        } for _, data in accepted for item in data['items']])
+
+        LedgerService.record_many([{
+            'amount': data['total_amount'],
+            'type': TRANSACTION_TYPES['INCOME'],
+            'description': f"销售单 {data['sale_number']}",
+            'reference_id': data['sale_number'],
+            'user_id': user_id,
+            'transaction_date': data['sale_date'],
+        } for _, data in accepted])
+
+        daily = defaultdict(lambda: {'income': 0, 'sale_count': 0, 'sale_revenue': 0})
+        for _, data in accepted:
+            day = daily[data['sale_date'].date()]
+            day['income'] += data['total_amount']
+            day['sale_count'] += 1
+            day['sale_revenue'] += data['total_amount']
+        for day, deltas_of_day in sorted(daily.items()):
+            RollupService.record(day, **deltas_of_day)
+
+        db.session.commit()
+
+        for result, data in accepted:
+            result.update(
+                status=BATCH_STATUS['CREATED'],
+                id=sale_ids[data['sale_number']],
+                sale_number=data['sale_number'],
+                total_amount=float(data['total_amount']),
+            )
+        # 离线销售可能发生在今天之前，这时过去日期的报表也要失效
+        invalidate_reports(historical=any(data['sale_date'].date() < now.date() for _, data in accepted))
+        SALES_TOTAL.inc(len(accepted))
+        SALES_REVENUE.inc(float(sum(data['total_amount'] for _, data in accepted)))
+        SALES_ITEMS.inc(sum(item['quantity'] for _, data in accepted for item in data['items']))
+        logger.info("离线销售批量同步完成", extra={
+            'user_id': user_id, 'sales': len(entries), 'sales_created': len(accepted),
+        })
+        return results
@@ -0,0 +1,134 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from flask import current_app
+from ..models.book import Book
+from ..database import db
+
+
+class BookSuggestIndex:
+    """书名、作者和ISBN的内存前缀索引（排序数组 + 二分查找）
+
+    entries 按 (小写前缀键, 书籍ID) 排序，查询时二分定位到第一个以 q 开头的键，
+    然后顺序扫描直到凑满 limit 本有效书籍，不访问数据库。
+    只收录上架 (is_active) 的书籍，写操作提交后调用 upsert/remove 增量维护。
+    多进程部署时各进程的索引互相独立，超过 ttl 秒后在下一次查询时整体重建，以限制陈旧时间。
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._entries = []
+        self._books = {}  # 书籍ID -> 返回给客户端的字段
+        self._keys = {}   # 书籍ID -> 该书在 entries 中的键
+        self._built_at = None
+
+    @staticmethod
+    def _index_keys(book):
+        """生成一本书的前缀键：书名、作者、ISBN 整体，以及书名/作者中的各个单词"""
+        keys = set()
+        for value in (book.name, book.author, book.isbn):
+            if not value:
+                continue
+            value = value.strip().lower()
+            keys.add(value)
+            keys.update(word for word in value.split() if word)
+        return keys
+
+    @staticmethod
+    def _payload(book):
+        return {
+            'id': book.id,
+            'isbn': book.isbn,
+            'name': book.name,
+            'author': book.author,
+            'retail_price': float(book.retail_price) if book.retail_price is not None else None
+        }
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    def _is_stale(self):
+        return not self.is_built or (self.ttl is not None and time.monotonic() - self._built_at > self.ttl)
+
+    def build(self):
+        """从数据库全量构建索引"""
+        rows = db.session.query(Book.id, Book.isbn, Book.name, Book.author, Book.retail_price)\
+            .filter(Book.is_active.is_(True)).all()
+
+        entries, books, keys = [], {}, {}
+        for row in rows:
+            book_keys = self._index_keys(row)
+            books[row.id] = self._payload(row)
+            keys[row.id] = book_keys
+            entries.extend((key, row.id) for key in book_keys)
+        entries.sort()
+
+        with self._lock:
+            self._entries, self._books, self._keys = entries, books, keys
+            self._built_at = time.monotonic()
+
+    def _remove_locked(self, book_id):
+        for key in self._keys.pop(book_id, ()):
+            i = bisect_left(self._entries, (key, book_id))
+            if i < len(self._entries) and self._entries[i] == (key, book_id):
+                del self._entries[i]
+        self._books.pop(book_id, None)
+
+    def upsert(self, book):
+        """书籍新增或修改后更新索引（下架的书籍会被移除）"""
+        if not self.is_built:
+            return
+        with self._lock:
+            self._remove_locked(book.id)
+            if not book.is_active:
+                return
+            book_keys = self._index_keys(book)
+            self._books[book.id] = self._payload(book)
+            self._keys[book.id] = book_keys
+            for key in book_keys:
+                insort(self._entries, (key, book.id))
+
+    def remove(self, book_id):
+        """书籍删除后从索引中移除"""
+        if not self.is_built:
+            return
+        with self._lock:
+            self._remove_locked(book_id)
+
+    def invalidate(self):
+        """批量修改书籍后丢弃索引，下一次查询时整体重建"""
+        with self._lock:
+            self._built_at = None
+
+    def suggest(self, prefix, limit=10):
+        """返回键以 prefix 开头的前 limit 本书籍（按匹配键的字典序）"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        if self._is_stale():
+            self.build()
+
+        results, seen = [], set()
+        with self._lock:
+            entries = self._entries
+            i = bisect_left(entries, (prefix,))
+            while i < len(entries) and len(results) < limit:
+                key, book_id = entries[i]
+                if not key.startswith(prefix):
+                    break
+                if book_id not in seen:
+                    seen.add(book_id)
+                    results.append(self._books[book_id])
+                i += 1
+        return results
+
+
+def get_suggest_index():
+    """获取当前应用的书籍联想索引（首次查询时才从数据库构建）"""
+    index = current_app.extensions.get('book_suggest_index')
+    if index is None:
+        index = BookSuggestIndex(ttl=current_app.config.get('BOOK_SUGGEST_TTL'))
+        current_app.extensions['book_suggest_index'] = index
+    return index
@@ -1,7 +1,11 @@
+import hashlib
 import jwt
 from datetime import datetime, timedelta, timezone # 导入 timezone
 from flask import current_app
-import sys # Add sys for stderr printing
+import logging
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 def generate_token(user_id, role):
     """
@@ -23,8 +27,7 @@ def generate_token(user_id, role):
     }
     
     secret_key = current_app.config.get('SECRET_KEY')
-    # Debug print: 显示正在使用的密钥（部分）
-    print(f"Generating token with key: {secret_key[:5]}...{secret_key[-5:]}", file=sys.stderr) 
+    logger.debug("生成令牌", extra={'user_id': user_id, 'role': role})
     
     # 使用应用的SECRET_KEY签名
     token = jwt.encode(
@@ -46,9 +49,6 @@ def verify_token(token):
         payload: 解码后的令牌内容，失败则返回None
     """
     secret_key = current_app.config.get('SECRET_KEY')
-    # Debug print: 显示正在验证的令牌（部分）和使用的密钥（部分）
-    print(f"\nVerifying token: {token[:10]}...", file=sys.stderr) 
-    print(f"Using key: {secret_key[:5]}...{secret_key[-5:]}", file=sys.stderr) 
     
     try:
         # 解码并验证令牌
@@ -57,22 +57,67 @@ def verify_token(token):
             secret_key,
             algorithms=['HS256']
         )
-        # Debug print: 验证成功及负载内容
-        print(f"Token verified successfully. Payload: {payload}", file=sys.stderr) 
+        logger.debug("令牌验证成功", extra={'sub': payload.get('sub')})
         return payload
     except jwt.ExpiredSignatureError:
         # 令牌已过期
-        # Debug print: 验证失败原因
-        print("Token verification failed: ExpiredSignatureError", file=sys.stderr) 
+        logger.info("令牌验证失败: 令牌已过期")
         return None
     except jwt.InvalidTokenError as e:
         # 令牌无效
-        # Debug print: 验证失败原因
-        print(f"Token verification failed: InvalidTokenError - {e}", file=sys.stderr) 
+        logger.info("令牌验证失败: %s", e)
         return None
-    except Exception as e:
+    except Exception:
         # 其他潜在错误
-        # Debug print: 验证失败原因
-        print(f"Token verification failed: Unexpected error - {e}", file=sys.stderr) 
+        logger.exception("令牌验证时发生未知错误")
         return None
 
+
+
+class UserSnapshot:
+    """login_required 附加到 g.user 的轻量用户信息（不绑定数据库会话）
+
+    需要完整用户资料的接口应通过 db.session.get(User, g.user.id) 重新加载。
+    """
+    __slots__ = ('id', 'role', 'username')
+
+    def __init__(self, id, role, username):
+        self.id = id
+        self.role = role
+        self.username = username
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.role, user.username)
+
+    def is_admin(self):
+        """检查用户是否具有管理员权限（与 User.is_admin 一致）"""
+        return self.role in ['ADMIN', 'SUPER_ADMIN']
+
+    def __repr__(self):
+        return f"<User {self.username}>"
+
+
+def get_auth_cache():
+    """获取当前应用的令牌缓存 (令牌摘要 -> (payload, UserSnapshot))"""
+    cache = current_app.extensions.get('auth_cache')
+    if cache is None:
+        cache = TTLCache(
+            maxsize=current_app.config.get('AUTH_CACHE_SIZE', 1024),
+            ttl=current_app.config.get('AUTH_CACHE_TTL', 60)
+        )
+        current_app.extensions['auth_cache'] = cache
+    return cache
+
+
+def token_digest(token):
+    """缓存键使用令牌的 SHA-256 摘要，避免在内存中保存原始令牌"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def invalidate_user(user_id):
+    """用户信息、角色变更或删除后，清除该用户所有令牌的缓存
+
+    只影响当前进程；其他工作进程中的缓存最长在 AUTH_CACHE_TTL 秒后失效。
+    """
+    return get_auth_cache().delete_where(lambda entry: entry[1].id == user_id)
@@ -0,0 +1,85 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from flask import Response, request, stream_with_context
+
+# 每次从数据库游标取出的行数，同时也是写出一个响应块的行数
+EXPORT_CHUNK_SIZE = 1000
+
+# 以这些字符开头的单元格会被 Excel 当作公式执行 (CSV 注入)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, Decimal):
+        return format(value, 'f')
+    if isinstance(value, bool):
+        return '是' if value else '否'
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # 客户名、备注等用户输入的文本加单引号前缀，Excel 按文本显示
+        return "'" + value
+    return value
+
+
+def iter_csv_chunks(header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """把行迭代器编码为 CSV 字节块，每块最多 chunk_size 行
+
+    首块带 UTF-8 BOM，Excel 打开时可以正确识别中文。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('﻿')
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow([_cell(value) for value in row])
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks):
+    """流式 gzip 压缩"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(filename, header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """返回逐块生成的 CSV 下载响应
+
+    rows 应是数据库流式结果 (yield_per)，生成器在请求上下文中执行，
+    内存中只保留当前一块。查询参数 gzip=true 时以 gzip 压缩输出 (<filename>.gz)。
+
+    Args:
+        filename: 下载文件名 (不含 .gz)
+        header: 列名
+        rows: 行迭代器，每行为值的序列
+    """
+    chunks = iter_csv_chunks(header, rows, chunk_size)
+    if request.args.get('gzip', 'false').lower() == 'true':
+        chunks = gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    else:
+        mimetype = 'text/csv'
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    if mimetype == 'text/csv':
+        response.charset = 'utf-8'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # 禁止反向代理缓冲，客户端可以边生成边接收
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,163 @@
+"""写操作的幂等键支持
+
+客户端在重试可能已经成功的写请求时带上相同的 Idempotency-Key 请求头。首个请求先在
+idempotency_keys 中预留 (用户, 键)，执行成功 (2xx) 后保存响应；之后的重放直接返回保存的响应，
+不再修改库存或财务记录。重放先查进程内的短期缓存，未命中时只执行一次唯一索引查询。
+
+- 相同的键用于不同的请求 (方法、路径或请求体不同) 返回 422
+- 首个请求仍在处理中时，并发的重试返回 409；预留超过 IDEMPOTENCY_LEASE 秒仍未完成
+  (例如工作进程在处理中退出) 视为已放弃，相同请求的重试可以接管该键重新执行
+- 失败的请求 (非 2xx) 不保存响应并释放预留，客户端可以用同一个键重试
+"""
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import request, abort, g, current_app
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from .cache import TTLCache
+from .metrics import IDEMPOTENT_REPLAYS
+from ..models.idempotency_key import IdempotencyKey
+from ..database import db
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 100
+
+
+def get_idempotency_cache():
+    """获取当前应用的幂等响应缓存 ((用户ID, 键) -> (请求指纹, 状态码, 响应体))"""
+    cache = current_app.extensions.get('idempotency_cache')
+    if cache is None:
+        cache = TTLCache(
+            maxsize=current_app.config.get('IDEMPOTENCY_CACHE_SIZE', 10000),
+            ttl=current_app.config.get('IDEMPOTENCY_CACHE_TTL', 300)
+        )
+        current_app.extensions['idempotency_cache'] = cache
+    return cache
+
+
+def request_fingerprint():
+    """请求方法、路径、查询参数和请求体的 SHA-256"""
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}?'.encode('utf-8'))
+    digest.update(request.query_string)
+    digest.update(b'\n')
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _replay(fingerprint, stored_fingerprint, status_code, body):
+    if stored_fingerprint != fingerprint:
+        abort(422, description=f"{IDEMPOTENCY_HEADER} 已用于其他请求")
+    if status_code is None:
+        abort(409, description=f"相同 {IDEMPOTENCY_HEADER} 的请求正在处理")
+    IDEMPOTENT_REPLAYS.inc(endpoint=request.endpoint)
+    response = current_app.response_class(body, status=status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _owned(record_id, reserved_at):
+    """仍由本请求持有的预留 (预留被其他重试接管后 created_at 会改变)"""
+    return (IdempotencyKey.id == record_id) & (IdempotencyKey.created_at == reserved_at)
+
+
+def _release(record_id, reserved_at):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(_owned(record_id, reserved_at)))
+    db.session.commit()
+
+
+def idempotent(f):
+    """
+    使写操作支持 Idempotency-Key 请求头 (放在 login_required/admin_required 之下)
+
+    未带请求头时照常执行。键按用户区分，保存 IDEMPOTENCY_TTL 秒。
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            abort(400, description=f"{IDEMPOTENCY_HEADER} 长度不能超过 {MAX_KEY_LENGTH}")
+
+        user_id = g.user.id
+        fingerprint = request_fingerprint()
+        cache = get_idempotency_cache()
+        cached = cache.get((user_id, key))
+        if cached is not None:
+            return _replay(fingerprint, *cached)
+
+        ttl = current_app.config.get('IDEMPOTENCY_TTL', 86400)
+        lease = current_app.config.get('IDEMPOTENCY_LEASE', 300)
+        now = _utcnow()
+        record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+        if record is not None and record.created_at > now - timedelta(seconds=ttl):
+            abandoned = (record.status_code is None and record.fingerprint == fingerprint
+                         and record.created_at <= now - timedelta(seconds=lease))
+            if not abandoned:
+                if record.status_code is not None:
+                    cache.set((user_id, key), (record.fingerprint, record.status_code, record.response_body))
+                return _replay(fingerprint, record.fingerprint, record.status_code, record.response_body)
+
+            # 接管已放弃的预留：以 created_at 作为版本号，并发的重试只有一个能更新成功
+            taken = db.session.execute(
+                update(IdempotencyKey)
+                .where(_owned(record.id, record.created_at), IdempotencyKey.status_code.is_(None))
+                .values(created_at=now)
+            ).rowcount
+            db.session.commit()
+            if not taken:
+                abort(409, description=f"相同 {IDEMPOTENCY_HEADER} 的请求正在处理")
+            logger.warning("接管超时未完成的幂等键", extra={'user_id': user_id, 'endpoint': request.endpoint})
+            record_id = record.id
+        else:
+            # 预留键：并发的相同请求只有一个能插入成功
+            try:
+                if record is not None:
+                    db.session.delete(record)
+                    db.session.flush()
+                record = IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint, created_at=now)
+                db.session.add(record)
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                abort(409, description=f"相同 {IDEMPOTENCY_HEADER} 的请求正在处理")
+            record_id = record.id
+
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            _release(record_id, now)
+            raise
+
+        if not 200 <= response.status_code < 300:
+            _release(record_id, now)
+            return response
+
+        body = response.get_data(as_text=True)
+        db.session.execute(
+            update(IdempotencyKey).where(_owned(record_id, now))
+            .values(status_code=response.status_code, response_body=body)
+        )
+        db.session.commit()
+        cache.set((user_id, key), (fingerprint, response.status_code, body))
+        return response
+
+    return decorated_function
+
+
+def purge_expired_keys():
+    """删除超过 IDEMPOTENCY_TTL 的幂等键，返回删除数量"""
+    cutoff = _utcnow() - timedelta(seconds=current_app.config.get('IDEMPOTENCY_TTL', 86400))
+    result = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+    db.session.commit()
+    return result.rowcount
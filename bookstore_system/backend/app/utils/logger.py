@@ -0,0 +1,181 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# 应用日志的根记录器；各模块使用 logging.getLogger(__name__)，名称均为 app.xxx
+ROOT_LOGGER = 'app'
+
+# LogRecord 自带的属性，其余属性视为 extra 字段输出
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+class RequestIdFilter(logging.Filter):
+    """为日志记录附加当前请求的 request_id，便于关联同一请求的所有日志"""
+
+    def filter(self, record):
+        record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """按调用位置限流：每个位置每秒最多输出 rate 条低于 WARNING 级别的日志
+
+    使用令牌桶 (容量 burst)，WARNING 及以上级别始终输出。被丢弃的条数会附加在
+    该位置下一条输出的日志上 (sampled_out 字段)。
+    """
+
+    def __init__(self, rate=10, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or rate
+        self._buckets = {}  # (记录器, 文件, 行号) -> [令牌数, 上次时间, 丢弃数]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False
+            bucket[0] = tokens - 1
+            if bucket[2]:
+                record.sampled_out = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # 经过 AppQueueHandler 入队的记录，异常堆栈已格式化为文本
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AppQueueHandler(logging.handlers.QueueHandler):
+    """入队前合并消息参数并把异常堆栈格式化到 exc_text，message 中不包含堆栈
+
+    标准库的 prepare() 会把堆栈拼接到 message 并清除 exc_info，JSON 日志因此丢失独立的
+    exc_info 字段。traceback 对象不在线程间传递，这里同样清除 exc_info。
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+
+_listener = None
+
+
+def _parse_module_levels(value):
+    """解析 'app.routes=DEBUG,app.utils.auth=WARNING' 形式的模块日志级别"""
+    levels = {}
+    for part in (value or '').split(','):
+        if '=' in part:
+            name, level = part.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(app):
+    """配置应用日志
+
+    - LOG_LEVEL: app.* 记录器的默认级别
+    - LOG_LEVELS: 按模块覆盖级别，dict 或 'app.routes=DEBUG,...' 字符串
+    - LOG_FORMAT: json 或 text
+    - LOG_SAMPLE_RATE: 每个调用位置每秒最多输出的 DEBUG/INFO 日志条数，0 表示不限流
+    - LOG_ASYNC: 通过队列在后台线程写出日志，请求线程不阻塞在 stderr 上
+    """
+    global _listener
+
+    root = logging.getLogger(ROOT_LOGGER)
+    # 重复创建应用 (例如测试) 时替换之前安装的处理器
+    for handler in list(root.handlers):
+        if handler is default_handler or getattr(handler, '_app_logging', False):
+            root.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    root.propagate = False
+    module_levels = app.config.get('LOG_LEVELS') or {}
+    if isinstance(module_levels, str):
+        module_levels = _parse_module_levels(module_levels)
+    for name, level in module_levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if app.config.get('LOG_FORMAT', 'json') == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    # request_id 在请求线程中获取，采样也在请求线程中完成，避免无用的入队
+    if app.config.get('LOG_ASYNC', True):
+        handler = AppQueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(handler.queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        handler = stream_handler
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(SamplingFilter(rate=app.config.get('LOG_SAMPLE_RATE', 10)))
+    handler._app_logging = True
+    root.addHandler(handler)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+    @app.after_request
+    def add_request_id_header(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+
+@atexit.register
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,314 @@
+"""进程内指标与 Prometheus 文本格式输出
+
+计数器和直方图保存在进程内存中，每次记录只需一次加锁的字典更新。
+多个 gunicorn 工作进程时设置 METRICS_MULTIPROC_DIR：各进程定期把自己的快照写入该目录，
+/metrics 读取所有快照文件求和后输出。
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, current_app, g, request, abort
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 快照文件超过该时间未更新，视为进程已退出，不再输出其瞬时值 (gauge)
+STALE_SNAPSHOT_SECONDS = 120
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """当前进程所有计数器和直方图的可序列化快照"""
+        with self.lock:
+            return {name: {json.dumps(key): value if metric.type == 'counter' else list(value)
+                           for key, value in metric.values.items()}
+                    for name, metric in self.metrics.items()}
+
+    def clear(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.values.clear()
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._registry = registry
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # 标签 -> [各桶计数 (非累计)..., +Inf 桶计数, sum, count]
+        self._registry = registry
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._registry.lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+
+# --- HTTP 指标 ---
+HTTP_REQUESTS = Counter('bookstore_http_requests_total', '请求数', ('blueprint', 'endpoint', 'method', 'status'))
+HTTP_ERRORS = Counter('bookstore_http_request_errors_total', '错误响应数 (4xx/5xx)', ('blueprint', 'endpoint', 'status_class'))
+HTTP_LATENCY = Histogram('bookstore_http_request_duration_seconds', '请求处理耗时', ('blueprint', 'endpoint'))
+
+# --- 业务指标 (每分钟销售数可用 rate(bookstore_sales_total[1m]) * 60 计算) ---
+SALES_TOTAL = Counter('bookstore_sales_total', '完成的销售单数')
+SALES_REVENUE = Counter('bookstore_sales_revenue_total', '销售收入')
+SALES_ITEMS = Counter('bookstore_sales_items_total', '售出的图书册数')
+REFUNDS_TOTAL = Counter('bookstore_sale_refunds_total', '退款/取消的销售单数', ('kind',))
+STOCK_IN_TOTAL = Counter('bookstore_stock_in_total', '入库操作次数')
+STOCK_IN_BOOKS = Counter('bookstore_stock_in_books_total', '入库的图书册数')
+LEDGER_PROCESSED = Counter('bookstore_ledger_outbox_processed_total', '账本发件箱中已写入 transactions 的记录数')
+IDEMPOTENT_REPLAYS = Counter('bookstore_idempotent_replays_total', '按 Idempotency-Key 直接返回已保存响应的请求数', ('endpoint',))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def merge_snapshots(snapshots):
+    """按标签对多个进程的快照求和"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            target = merged.setdefault(name, {})
+            for key, value in series.items():
+                if isinstance(value, list):
+                    current = target.get(key)
+                    target[key] = value[:] if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    target[key] = target.get(key, 0) + value
+    return merged
+
+
+def render(snapshot, gauges, registry=REGISTRY):
+    """输出 Prometheus 文本格式"""
+    lines = []
+    for name, metric in registry.metrics.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for key, value in sorted(snapshot.get(name, {}).items()):
+            label_values = json.loads(key)
+            if metric.type == 'counter':
+                lines.append(f'{name}{_labels(metric.labelnames, label_values)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value[:-2]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, label_values, {"le": le})} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric.labelnames, label_values)} {_format_value(value[-2])}')
+            lines.append(f'{name}_count{_labels(metric.labelnames, label_values)} {value[-1]}')
+
+    documented = set()
+    for name, documentation, samples in gauges:
+        if name not in documented:
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            documented.add(name)
+        for labels, value in samples:
+            lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class MultiprocessStore:
+    """多进程模式：每个进程把快照写入 <目录>/metrics_<pid>.json，抓取时汇总所有文件"""
+
+    def __init__(self, directory, collect_gauges, flush_interval=5.0, registry=REGISTRY):
+        self.directory = directory
+        self.collect_gauges = collect_gauges
+        self.flush_interval = flush_interval
+        self.registry = registry
+        self._last_flush = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        data = {
+            'counters': self.registry.snapshot(),
+            'gauges': self.collect_gauges(),
+        }
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def collect(self):
+        """读取所有进程的快照：计数器求和，瞬时值按 pid 区分，只保留仍在更新的进程"""
+        self.flush(force=True)
+        snapshots, gauges = [], []
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+                modified = os.path.getmtime(path)
+            except (OSError, ValueError):
+                continue
+            snapshots.append(data['counters'])
+            if now - modified <= STALE_SNAPSHOT_SECONDS:
+                pid = filename[len('metrics_'):-len('.json')]
+                gauges.extend(
+                    (name, documentation, [({**labels, 'pid': pid}, value) for labels, value in samples])
+                    for name, documentation, samples in data['gauges']
+                )
+        return merge_snapshots(snapshots), gauges
+
+
+def _pool_gauges(engine):
+    """连接池状态 (仅 QueuePool 等提供这些方法的连接池)"""
+    pool = engine.pool
+    if not all(hasattr(pool, attr) for attr in ('size', 'checkedout', 'overflow', 'checkedin')):
+        return []
+    return [
+        ('bookstore_db_pool_size', '连接池大小', [({}, pool.size())]),
+        ('bookstore_db_pool_checked_out', '已借出的连接数', [({}, pool.checkedout())]),
+        ('bookstore_db_pool_checked_in', '池中空闲的连接数', [({}, pool.checkedin())]),
+        ('bookstore_db_pool_overflow', '超出连接池大小的连接数', [({}, pool.overflow())]),
+    ]
+
+
+def _cache_gauges(app):
+    """应用内缓存的命中情况 (app.extensions 中具有 hits/misses 属性的缓存)"""
+    samples = {'hits': [], 'misses': [], 'ratio': [], 'size': []}
+    for name, cache in list(app.extensions.items()):
+        if not (hasattr(cache, 'hits') and hasattr(cache, 'misses')):
+            continue
+        labels = {'cache': name}
+        total = cache.hits + cache.misses
+        samples['hits'].append((labels, cache.hits))
+        samples['misses'].append((labels, cache.misses))
+        samples['ratio'].append((labels, cache.hits / total if total else 0.0))
+        if hasattr(cache, '__len__'):
+            samples['size'].append((labels, len(cache)))
+    return [
+        ('bookstore_cache_hits', '缓存命中次数', samples['hits']),
+        ('bookstore_cache_misses', '缓存未命中次数', samples['misses']),
+        ('bookstore_cache_hit_ratio', '缓存命中率', samples['ratio']),
+        ('bookstore_cache_entries', '缓存条目数', samples['size']),
+    ]
+
+
+def _ledger_gauges(app):
+    """账本发件箱积压 (仅 LEDGER_OUTBOX_ENABLED 时)"""
+    if not app.config.get('LEDGER_OUTBOX_ENABLED'):
+        return []
+    from ..services.ledger_service import LedgerService
+    pending, lag = LedgerService.lag()
+    return [
+        ('bookstore_ledger_outbox_pending', '发件箱中待写入的记录数', [({}, pending)]),
+        ('bookstore_ledger_outbox_lag_seconds', '最早一条待写入记录已等待的秒数', [({}, lag)]),
+    ]
+
+
+def init_metrics(app):
+    """注册请求计时钩子和 /metrics 接口 (METRICS_ENABLED 关闭时不生效)"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    from ..database import db
+
+    with app.app_context():
+        engine = db.engine
+
+    def collect_gauges():
+        """抓取时的瞬时值：[(名称, 说明, [(标签dict, 值), ...]), ...]"""
+        return _pool_gauges(engine) + _cache_gauges(app) + _ledger_gauges(app)
+
+    store = None
+    if app.config.get('METRICS_MULTIPROC_DIR'):
+        store = MultiprocessStore(app.config['METRICS_MULTIPROC_DIR'], collect_gauges,
+                                  app.config.get('METRICS_FLUSH_INTERVAL', 5.0))
+    app.extensions['metrics_store'] = store
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None or request.endpoint == 'metrics':
+            return response
+        blueprint = request.blueprint or 'app'
+        endpoint = request.endpoint or 'none'
+        HTTP_LATENCY.observe(time.perf_counter() - start, blueprint=blueprint, endpoint=endpoint)
+        HTTP_REQUESTS.inc(blueprint=blueprint, endpoint=endpoint, method=request.method, status=response.status_code)
+        if response.status_code >= 400:
+            HTTP_ERRORS.inc(blueprint=blueprint, endpoint=endpoint, status_class=f'{response.status_code // 100}xx')
+        if store is not None:
+            store.flush()
+        return response
+
+    @app.route('/metrics', endpoint='metrics')
+    def metrics():
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401, description="无效的指标访问令牌")
+        if store is not None:
+            snapshot, gauges = store.collect()
+        else:
+            snapshot, gauges = REGISTRY.snapshot(), collect_gauges()
+        return Response(render(snapshot, gauges), mimetype='text/plain; version=0.0.4')
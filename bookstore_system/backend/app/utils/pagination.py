@@ -0,0 +1,99 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, DateTime, Integer
+
+
+def encode_cursor(values):
+    """将排序键的值编码为不透明的游标字符串"""
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """解码游标字符串
+
+    Args:
+        cursor: encode_cursor 生成的游标
+        columns: 排序列，用于还原日期时间类型
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError('无效的分页游标') from e
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('无效的分页游标')
+
+    return [_decode_value(column, value) for column, value in zip(columns, values)]
+
+
+def _decode_value(column, value):
+    """按列类型检查并还原游标中的单个值，类型不符时抛出 ValueError"""
+    if isinstance(column.type, DateTime):
+        if not isinstance(value, str):
+            raise ValueError('无效的分页游标')
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError) as e:
+            raise ValueError('无效的分页游标') from e
+    if isinstance(column.type, Integer):
+        # bool 是 int 的子类，同样拒绝
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError('无效的分页游标')
+        return value
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ValueError('无效的分页游标')
+    return value
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=20, descending=True, with_total=False):
+    """基于组合排序键的游标分页 (keyset pagination)
+
+    按 columns (最后一列须唯一，通常为主键) 排序，通过 WHERE 条件定位到上一页末尾之后，
+    不使用 OFFSET，翻到多深的页面耗时都相同；默认不执行 COUNT(*)。
+
+    Args:
+        query: 已应用过滤条件的查询 (不要预先排序)
+        columns: 排序列，例如 (Sale.sale_date, Sale.id)
+        cursor: 上一页返回的 next_cursor，为空表示第一页
+        per_page: 每页数量
+        descending: 是否降序
+        with_total: 是否额外统计总数
+
+    Returns:
+        dict: items, next_cursor (没有下一页时为 None), total (仅 with_total 时)
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    result = {}
+    if with_total:
+        result['total'] = query.enable_eagerloads(False).order_by(None).count()
+
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        # (a, b) < (:a, :b) 展开为 a < :a OR (a = :a AND b < :b)
+        conditions = []
+        for i, column in enumerate(columns):
+            equals = [columns[j] == values[j] for j in range(i)]
+            compare = column < values[i] if descending else column > values[i]
+            conditions.append(and_(*equals, compare))
+        query = query.filter(or_(*conditions))
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+
+    result['items'] = rows
+    result['next_cursor'] = next_cursor
+    return result
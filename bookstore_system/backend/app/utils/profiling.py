@@ -0,0 +1,71 @@
+import logging
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# 慢查询日志中参数的最大长度
+MAX_PARAMS_LENGTH = 500
+
+
+def _route():
+    """当前请求的路由描述，例如 'GET /api/sales/<int:sale_id>'"""
+    rule = request.url_rule.rule if request.url_rule else request.path
+    return f"{request.method} {rule}"
+
+
+def init_profiling(app):
+    """按请求统计SQL语句数和数据库耗时 (SQL_PROFILING_ENABLED 开启时生效)
+
+    - 响应头 X-DB-Queries / X-DB-Time (毫秒)
+    - 单条语句超过 SQL_SLOW_QUERY_MS 时记录 WARNING，包含语句、参数和路由
+    - 单个请求的语句数超过 SQL_QUERY_COUNT_WARN 时记录 WARNING，用于发现 N+1 查询
+    """
+    if not app.config.get('SQL_PROFILING_ENABLED'):
+        return
+
+    from ..database import db
+
+    slow_ms = app.config.get('SQL_SLOW_QUERY_MS', 100)
+    count_warn = app.config.get('SQL_QUERY_COUNT_WARN', 30)
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+        in_request = has_request_context()
+        if in_request:
+            g.db_queries = g.get('db_queries', 0) + 1
+            g.db_time = g.get('db_time', 0.0) + elapsed_ms
+
+        if elapsed_ms >= slow_ms:
+            logger.warning("慢查询", extra={
+                'duration_ms': round(elapsed_ms, 2),
+                'statement': statement,
+                'parameters': repr(parameters)[:MAX_PARAMS_LENGTH],
+                'route': _route() if in_request else None,
+            })
+
+    @app.before_request
+    def reset_query_stats():
+        g.db_queries = 0
+        g.db_time = 0.0
+
+    @app.after_request
+    def add_query_headers(response):
+        queries = g.get('db_queries', 0)
+        response.headers['X-DB-Queries'] = str(queries)
+        response.headers['X-DB-Time'] = f"{g.get('db_time', 0.0):.2f}"
+        if queries > count_warn:
+            logger.warning("单个请求执行的SQL语句过多，可能存在N+1查询", extra={
+                'queries': queries,
+                'route': _route(),
+            })
+        return response
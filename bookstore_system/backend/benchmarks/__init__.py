@@ -0,0 +1,18 @@
+"""书店管理系统的基准测试套件
+
+用法 (在 backend 目录下):
+
+    # 生成数据，scale 为书籍数量，其他表按比例生成
+    python -m benchmarks generate --scale 10000
+
+    # 在进程内通过 Flask 测试客户端执行全部场景
+    python -m benchmarks run --iterations 200 --output results.json
+
+    # 对本地运行的服务器执行指定场景
+    python -m benchmarks run --base-url http://127.0.0.1:5000 --scenarios login,checkout
+
+    # 对比报表查询在有/无报表索引时的执行计划
+    python -m benchmarks explain
+
+数据库由 BENCHMARK_DATABASE_URL 指定 (默认 backend/benchmark.db)，也可以使用 --database-url。
+"""
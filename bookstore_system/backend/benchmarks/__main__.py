@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import sys
+from app import create_app, db
+from .datagen import generate, row_counts
+from .explain import compare
+from .runner import FlaskClientAdapter, HttpAdapter, run
+from .scenarios import SCENARIOS
+
+
+def _create_app(database_url):
+    if database_url:
+        os.environ['BENCHMARK_DATABASE_URL'] = database_url
+    return create_app('benchmark')
+
+
+def cmd_generate(args):
+    app = _create_app(args.database_url)
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        print(f"生成数据: {json.dumps(row_counts(args.scale))}", file=sys.stderr)
+        counts = generate(scale=args.scale, seed=args.seed, days=args.days, chunk_size=args.chunk_size,
+                          echo=lambda message: print(message, file=sys.stderr))
+    print(json.dumps(counts, ensure_ascii=False))
+
+
+def cmd_run(args):
+    names = args.scenarios.split(',') if args.scenarios != 'all' else None
+    if args.base_url:
+        client = HttpAdapter(args.base_url)
+        metadata = {'base_url': args.base_url}
+    else:
+        app = _create_app(args.database_url)
+        client = FlaskClientAdapter(app)
+        with app.app_context():
+            metadata = {'database': db.engine.dialect.name}
+
+    try:
+        results = run(client, names, iterations=args.iterations, warmup=args.warmup,
+                      concurrency=args.concurrency, seed=args.seed, metadata=metadata)
+    finally:
+        client.close()
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+def cmd_explain(args):
+    app = _create_app(args.database_url)
+    with app.app_context():
+        results = compare(days=args.days, repeat=args.repeat)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='书店管理系统基准测试')
+    parser.add_argument('--database-url', help='数据库URL (默认读取 BENCHMARK_DATABASE_URL)')
+    parser.add_argument('--seed', type=int, default=42)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    gen = subparsers.add_parser('generate', help='生成合成数据')
+    gen.add_argument('--scale', type=int, default=10000, help='书籍数量 (其他表按比例生成)')
+    gen.add_argument('--days', type=int, default=365, help='数据日期分布的天数')
+    gen.add_argument('--chunk-size', type=int, default=5000, help='每批插入的行数')
+    gen.add_argument('--reset', action='store_true', help='生成前删除并重建所有表')
+    gen.set_defaults(func=cmd_generate)
+
+    bench = subparsers.add_parser('run', help='执行基准场景')
+    bench.add_argument('--scenarios', default='all', help=f"逗号分隔，可选: {', '.join(SCENARIOS)}")
+    bench.add_argument('--iterations', type=int, default=100)
+    bench.add_argument('--warmup', type=int, default=5)
+    bench.add_argument('--concurrency', type=int, default=1)
+    bench.add_argument('--base-url', help='对运行中的服务器发起HTTP请求，而不是使用进程内测试客户端')
+    bench.add_argument('--output', help='结果JSON文件路径 (默认输出到标准输出)')
+    bench.set_defaults(func=cmd_run)
+
+    explain = subparsers.add_parser('explain', help='对比报表查询在有/无报表索引时的执行计划和耗时')
+    explain.add_argument('--days', type=int, default=30, help='报表日期范围的天数')
+    explain.add_argument('--repeat', type=int, default=5, help='每个查询执行的次数')
+    explain.set_defaults(func=cmd_explain)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""合成基准测试数据
+
+按 scale (书籍数量) 等比例生成用户、书籍、销售单、进货单和交易记录，
+分块批量插入，除书籍价格数组外内存占用与 scale 无关。要求目标数据库中这些表为空。
+"""
+import random
+from array import array
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from sqlalchemy import insert, text
+from app import db, bcrypt
+from app.models.user import User
+from app.models.book import Book
+from app.models.sale import Sale, SaleItem, SALE_STATUS
+from app.models.purchase_order import PurchaseOrder, PurchaseOrderItem, ORDER_STATUS
+from app.models.transaction import Transaction, TRANSACTION_TYPES, REFERENCE_TYPES
+from app.services.rollup_service import RollupService
+
+BENCH_ADMIN = ('bench_admin', 'bench123')
+
+TOPICS = ['Python', 'Java', '数据结构', '算法', '机器学习', '经济学', '中国历史', '哲学', '设计模式', '网络',
+          '数据库', '小说', '诗集', '心理学', '管理学', 'Linux', 'JavaScript', '统计学', '艺术史', '天文学']
+SUFFIXES = ['入门', '实战', '原理', '精要', '指南', '导论', '案例', '进阶', '手册', '简史']
+SURNAMES = ['王', '李', '张', '刘', '陈', '杨', 'Smith', 'Brown', 'Knuth', 'Martin']
+GIVEN_NAMES = ['伟', '芳', '娜', '敏', '静', '强', 'John', 'Alice', 'Donald', 'Robert']
+PUBLISHERS = ['人民邮电出版社', '机械工业出版社', '清华大学出版社', '电子工业出版社', "O'Reilly"]
+
+# 每本书对应的其他表行数
+SALES_PER_BOOK = 1
+ITEMS_PER_SALE = 2
+ORDERS_PER_BOOK = 0.1
+ITEMS_PER_ORDER = 2
+REFUND_RATE = 0.05
+
+
+def row_counts(scale):
+    """给定 scale 时各表的大致行数"""
+    sales = int(scale * SALES_PER_BOOK)
+    orders = max(1, int(scale * ORDERS_PER_BOOK))
+    return {
+        'users': max(5, scale // 10000),
+        'books': scale,
+        'sales': sales,
+        'sale_items': sales * ITEMS_PER_SALE,
+        'purchase_orders': orders,
+        'purchase_order_items': orders * ITEMS_PER_ORDER,
+        'transactions': sales + int(sales * REFUND_RATE) + orders,
+    }
+
+
+def _flush_rows(table, rows):
+    if rows:
+        db.session.execute(insert(table), rows)
+        rows.clear()
+
+
+class _ChunkedInserter:
+    """按表缓存待插入的行，达到 chunk_size 后批量写入"""
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.pending = {}
+
+    def add(self, table, row):
+        rows = self.pending.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        # 所有表一起按外键依赖顺序写入，子表的行不会先于父表插入
+        for table in db.metadata.sorted_tables:
+            _flush_rows(table, self.pending.get(table, []))
+        db.session.commit()
+
+
+def _reset_sequences():
+    """显式指定ID插入后，同步 PostgreSQL 序列"""
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for model in (User, Book, Sale, SaleItem, PurchaseOrder, PurchaseOrderItem, Transaction):
+        table = model.__tablename__
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+        ))
+    db.session.commit()
+
+
+def generate(scale=10000, seed=42, days=365, chunk_size=5000, echo=None):
+    """生成基准数据
+
+    Args:
+        scale: 书籍数量，其他表按比例生成 (见 row_counts)
+        seed: 随机种子，相同参数生成相同数据
+        days: 销售/交易日期分布在最近多少天内
+        chunk_size: 每批插入的行数
+        echo: 可选的进度输出函数
+
+    Returns:
+        dict: 各表生成的行数
+    """
+    echo = echo or (lambda message: None)
+    rng = random.Random(seed)
+    counts = row_counts(scale)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    inserter = _ChunkedInserter(chunk_size)
+
+    def random_date():
+        return now - timedelta(seconds=rng.randrange(days * 86400))
+
+    # 用户：所有用户共用一个密码哈希，避免重复计算 bcrypt
+    password_hash = bcrypt.generate_password_hash(BENCH_ADMIN[1]).decode('utf-8')
+    user_ids = list(range(1, counts['users'] + 1))
+    for user_id in user_ids:
+        inserter.add(User.__table__, {
+            'id': user_id,
+            'username': BENCH_ADMIN[0] if user_id == 1 else f'cashier{user_id:05d}',
+            'hashed_password': password_hash,
+            'full_name': f'基准用户{user_id}',
+            'employee_id': f'BENCH{user_id:06d}',
+            'role': 'SUPER_ADMIN' if user_id == 1 else 'NORMAL_ADMIN',
+            'created_at': now,
+            'updated_at': now,
+        })
+    inserter.flush()
+    echo(f"users: {len(user_ids)}")
+
+    # 书籍
+    price_cents = array('l', [0])  # 按书籍ID索引的零售价(分)
+    for book_id in range(1, scale + 1):
+        price_cents.append(rng.randrange(1000, 20000))
+        price = Decimal(price_cents[book_id]) / 100
+        inserter.add(Book.__table__, {
+            'id': book_id,
+            'isbn': f'978{book_id:010d}',
+            'name': f'{rng.choice(TOPICS)}{rng.choice(SUFFIXES)} 第{book_id}卷',
+            'author': rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES),
+            'publisher': rng.choice(PUBLISHERS),
+            'retail_price': price,
+            'quantity': 1000000,
+            'is_active': True,
+            'created_at': now,
+            'updated_at': now,
+        })
+    inserter.flush()
+    echo(f"books: {scale}")
+
+    # 销售单、销售明细和收入/退款交易
+    item_id = transaction_id = 0
+    for sale_id in range(1, counts['sales'] + 1):
+        sale_date = random_date()
+        sale_number = f'B{sale_id:011d}'
+        user_id = rng.choice(user_ids)
+        refunded = rng.random() < REFUND_RATE
+        total = Decimal('0')
+        for _ in range(ITEMS_PER_SALE):
+            book_id = rng.randrange(1, scale + 1)
+            quantity = rng.randint(1, 3)
+            price = Decimal(price_cents[book_id]) / 100
+            total += price * quantity
+            item_id += 1
+            inserter.add(SaleItem.__table__, {
+                'id': item_id, 'sale_id': sale_id, 'sale_date': sale_date, 'book_id': book_id,
+                'quantity': quantity, 'price': price,
+                'created_at': sale_date, 'updated_at': sale_date,
+            })
+        inserter.add(Sale.__table__, {
+            'id': sale_id, 'sale_number': sale_number, 'sale_date': sale_date,
+            'status': SALE_STATUS['REFUNDED'] if refunded else SALE_STATUS['COMPLETED'],
+            'total_amount': total, 'payment_method': rng.choice(['CASH', 'CARD', 'MOBILE']),
+            'user_id': user_id, 'created_at': sale_date, 'updated_at': sale_date,
+        })
+        transaction_id += 1
+        inserter.add(Transaction.__table__, {
+            'id': transaction_id, 'amount': total, 'type': TRANSACTION_TYPES['INCOME'],
+            'description': f'销售单 {sale_number}', 'reference_id': sale_number,
+            'reference_type': REFERENCE_TYPES['SALE'], 'transaction_date': sale_date,
+            'user_id': user_id, 'created_at': sale_date, 'updated_at': sale_date,
+        })
+        if refunded:
+            refund_date = min(sale_date + timedelta(days=rng.randint(0, 7)), now)
+            transaction_id += 1
+            inserter.add(Transaction.__table__, {
+                'id': transaction_id, 'amount': total, 'type': TRANSACTION_TYPES['EXPENSE'],
+                'description': f'销售单 {sale_number} 退款', 'reference_id': sale_number,
+                'reference_type': REFERENCE_TYPES['SALE_REFUND'], 'transaction_date': refund_date,
+                'user_id': user_id, 'created_at': refund_date, 'updated_at': refund_date,
+            })
+    inserter.flush()
+    echo(f"sales: {counts['sales']}")
+
+    # 进货单 (已入库) 及其付款交易
+    item_id = 0
+    for order_id in range(1, counts['purchase_orders'] + 1):
+        order_date = random_date()
+        order_number = f'BP{order_id:010d}'
+        total = Decimal('0')
+        for _ in range(ITEMS_PER_ORDER):
+            book_id = rng.randrange(1, scale + 1)
+            quantity = rng.randint(10, 100)
+            price = Decimal(price_cents[book_id]) / 100
+            purchase_price = (price * Decimal('0.6')).quantize(Decimal('0.01'))
+            total += purchase_price * quantity
+            item_id += 1
+            inserter.add(PurchaseOrderItem.__table__, {
+                'id': item_id, 'purchase_order_id': order_id, 'book_id': book_id,
+                'isbn': f'978{book_id:010d}', 'quantity': quantity,
+                'purchase_price': purchase_price, 'suggested_retail_price': price,
+                'created_at': order_date, 'updated_at': order_date,
+            })
+        inserter.add(PurchaseOrder.__table__, {
+            'id': order_id, 'order_number': order_number, 'order_date': order_date,
+            'status': ORDER_STATUS['STOCKED'], 'total_amount': total, 'supplier': rng.choice(PUBLISHERS),
+            'user_id': 1, 'created_at': order_date, 'updated_at': order_date,
+        })
+        transaction_id += 1
+        inserter.add(Transaction.__table__, {
+            'id': transaction_id, 'amount': total, 'type': TRANSACTION_TYPES['EXPENSE'],
+            'description': f'进货单 {order_number} 付款', 'reference_id': order_number,
+            'reference_type': REFERENCE_TYPES['PURCHASE'], 'transaction_date': order_date,
+            'user_id': 1, 'created_at': order_date, 'updated_at': order_date,
+        })
+    inserter.flush()
+    echo(f"purchase_orders: {counts['purchase_orders']}")
+
+    _reset_sequences()
+    RollupService.rebuild()
+    echo("rollups rebuilt")
+
+    counts['transactions'] = transaction_id
+    return counts
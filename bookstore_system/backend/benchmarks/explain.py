@@ -0,0 +1,112 @@
+"""报表查询的执行计划与耗时对比
+
+对财务/销售报表的典型查询分别在有、无报表索引时执行 EXPLAIN 并计时。
+“无索引”一轮先删除这些索引，结束后按模型定义重新创建。
+"""
+import statistics
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, text
+from app import db
+from app.models.sale import Sale, SaleItem
+from app.models.transaction import Transaction
+
+# 报表索引 (与 migrations/versions/a7f3c2d9e514_add_report_indexes.py 一致)
+REPORT_INDEXES = {
+    Transaction.__table__: ('ix_transactions_type_transaction_date', 'ix_transactions_transaction_date'),
+    Sale.__table__: ('ix_sales_status_sale_date', 'ix_sales_user_id_sale_date'),
+    SaleItem.__table__: ('ix_sale_items_book_id_sale_id',),
+}
+
+QUERIES = {
+    'ledger_type_range': (
+        "SELECT SUM(amount) FROM transactions "
+        "WHERE type = :type AND transaction_date >= :start AND transaction_date <= :end"
+    ),
+    'ledger_summary_range': (
+        "SELECT SUM(CASE WHEN type = 'INCOME' THEN amount ELSE 0 END), "
+        "SUM(CASE WHEN type = 'EXPENSE' THEN amount ELSE 0 END) FROM transactions "
+        "WHERE transaction_date >= :start AND transaction_date <= :end"
+    ),
+    'sales_status_range': (
+        "SELECT COUNT(*), SUM(total_amount) FROM sales "
+        "WHERE status = :status AND sale_date >= :start AND sale_date <= :end"
+    ),
+    'top_selling_books': (
+        "SELECT si.book_id, SUM(si.quantity) AS qty FROM sale_items si JOIN sales s ON s.id = si.sale_id "
+        "WHERE s.status = :status AND s.sale_date >= :start AND s.sale_date <= :end "
+        "GROUP BY si.book_id ORDER BY qty DESC LIMIT 10"
+    ),
+    'book_sale_lookup': "SELECT COUNT(*) FROM sale_items WHERE book_id = :book_id",
+    'list_sales_for_user': "SELECT id FROM sales WHERE user_id = :user_id ORDER BY sale_date DESC, id DESC LIMIT 20",
+}
+
+
+def _params(days):
+    end = datetime.now()
+    return {'type': 'INCOME', 'status': 'COMPLETED', 'start': end - timedelta(days=days), 'end': end,
+            'book_id': 1, 'user_id': 2}
+
+
+def _plan(conn, sql, params):
+    if conn.dialect.name == 'postgresql':
+        return [row[0] for row in conn.execute(text('EXPLAIN ' + sql), params)]
+    if conn.dialect.name == 'sqlite':
+        return [row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params)]
+    return []
+
+
+def _measure(conn, params, repeat):
+    results = {}
+    for name, sql in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(text(sql), params).all()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {'plan': _plan(conn, sql, params), 'median_ms': round(statistics.median(timings), 3)}
+    return results
+
+
+def _analyze(conn):
+    if conn.dialect.name in ('postgresql', 'sqlite'):
+        for table in REPORT_INDEXES:
+            conn.execute(text(f'ANALYZE {table.name}'))
+
+
+def compare(days=30, repeat=5):
+    """返回每个查询在有/无报表索引时的执行计划和中位耗时"""
+    engine = db.engine
+    existing = {table: {index['name'] for index in inspect(engine).get_indexes(table.name)}
+                for table in REPORT_INDEXES}
+    indexes = [index for table, names in REPORT_INDEXES.items()
+               for index in table.indexes if index.name in names and index.name in existing[table]]
+    missing = sorted(name for table, names in REPORT_INDEXES.items() for name in names
+                     if name not in existing[table])
+
+    params = _params(days)
+    with engine.begin() as conn:
+        _analyze(conn)
+    with engine.connect() as conn:
+        with_indexes = _measure(conn, params, repeat)
+
+    try:
+        with engine.begin() as conn:
+            for index in indexes:
+                index.drop(conn)
+            _analyze(conn)
+        with engine.connect() as conn:
+            without_indexes = _measure(conn, params, repeat)
+    finally:
+        with engine.begin() as conn:
+            for index in indexes:
+                index.create(conn, checkfirst=True)
+            _analyze(conn)
+
+    return {
+        'meta': {'database': engine.dialect.name, 'days': days, 'repeat': repeat, 'missing_indexes': missing},
+        'queries': {
+            name: {'with_indexes': with_indexes[name], 'without_indexes': without_indexes[name]}
+            for name in QUERIES
+        },
+    }
@@ -0,0 +1,184 @@
+"""场景执行器与结果统计"""
+import json
+import math
+import platform
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from sqlalchemy import event
+from app import db
+from .scenarios import BenchmarkContext, SCENARIOS
+
+
+class Response:
+    """与客户端实现无关的响应"""
+
+    def __init__(self, status, body, elapsed, queries=None):
+        self.status = status
+        self.body = body
+        self.elapsed = elapsed
+        self.queries = queries
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class FlaskClientAdapter:
+    """通过 Flask 测试客户端在进程内发起请求，并统计每个请求执行的SQL语句数"""
+
+    name = 'flask-test-client'
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+        self._queries = 0
+        with app.app_context():
+            self.engine = db.engine
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._queries += 1
+
+    def close(self):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+    def request(self, method, path, json=None, headers=None, params=None):
+        self._queries = 0
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, json=json, headers=headers, query_string=params)
+        elapsed = time.perf_counter() - started
+        return Response(response.status_code, response.get_data(), elapsed, self._queries)
+
+
+class HttpAdapter:
+    """向本地运行的服务器发起 HTTP 请求；服务器返回 X-DB-Queries 响应头时记录查询数"""
+
+    name = 'http'
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def close(self):
+        pass
+
+    def request(self, method, path, json=None, headers=None, params=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        headers = dict(headers or {})
+        data = None
+        if json is not None:
+            data = _dumps(json)
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                status, body, response_headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, body, response_headers = e.code, e.read(), e.headers
+        elapsed = time.perf_counter() - started
+
+        queries = response_headers.get('X-DB-Queries')
+        return Response(status, body, elapsed, int(queries) if queries is not None else None)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+def percentile(sorted_values, q):
+    """最近秩法百分位数，sorted_values 须已排序"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(responses, wall_time):
+    """汇总一个场景的吞吐量、延迟分布和每请求查询数"""
+    latencies = sorted(response.elapsed * 1000 for response in responses)
+    queries = [response.queries for response in responses if response.queries is not None]
+    errors = [response.status for response in responses if response.status >= 400]
+    return {
+        'requests': len(responses),
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors)),
+        'wall_time_s': round(wall_time, 4),
+        'throughput_rps': round(len(responses) / wall_time, 2) if wall_time > 0 else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50': round(percentile(latencies, 50), 3) if latencies else None,
+            'p95': round(percentile(latencies, 95), 3) if latencies else None,
+            'p99': round(percentile(latencies, 99), 3) if latencies else None,
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def run_scenario(ctx, scenario, iterations, warmup=0, concurrency=1):
+    """执行一个场景：setup (不计时) -> 预热 -> 计时执行 iterations 次"""
+    if scenario.setup:
+        scenario.setup(ctx, warmup + iterations)
+
+    for i in range(warmup):
+        scenario.step(ctx, i)
+
+    indexes = range(warmup, warmup + iterations)
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            responses = list(pool.map(lambda i: scenario.step(ctx, i), indexes))
+    else:
+        responses = [scenario.step(ctx, i) for i in indexes]
+    wall_time = time.perf_counter() - started
+
+    result = summarize(responses, wall_time)
+    result['description'] = scenario.description
+    return result
+
+
+def run(client, scenario_names=None, iterations=100, warmup=5, concurrency=1, seed=0, metadata=None):
+    """依次执行场景并返回可序列化为 JSON 的结果
+
+    Args:
+        client: FlaskClientAdapter 或 HttpAdapter
+        scenario_names: 要执行的场景名称，为空表示全部
+        iterations: 每个场景计时的请求数
+        warmup: 每个场景预热的请求数
+        concurrency: 并发线程数 (查询数统计仅在并发为1时准确)
+        seed: 随机种子
+        metadata: 附加到结果中的信息，例如数据库和数据规模
+    """
+    names = scenario_names or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"未知场景: {', '.join(unknown)}")
+
+    ctx = BenchmarkContext(client, seed=seed)
+    ctx.login()
+
+    results = {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'client': client.name,
+            'python': platform.python_version(),
+            'iterations': iterations,
+            'warmup': warmup,
+            'concurrency': concurrency,
+            **(metadata or {}),
+        },
+        'scenarios': {},
+    }
+    for name in names:
+        results['scenarios'][name] = run_scenario(ctx, SCENARIOS[name], iterations, warmup, concurrency)
+    return results
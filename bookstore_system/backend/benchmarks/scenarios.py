@@ -0,0 +1,139 @@
+"""基准场景
+
+每个场景由 setup(ctx, iterations) 和 step(ctx, i) 组成：setup 准备数据（不计时），
+step 发出一次被计时的请求并返回 Response。ctx 是 BenchmarkContext，持有客户端、令牌和随机数。
+"""
+import random
+from datetime import date, timedelta
+from .datagen import BENCH_ADMIN, TOPICS, SUFFIXES
+
+
+class BenchmarkContext:
+    """场景共享的状态"""
+
+    def __init__(self, client, seed=0):
+        self.client = client
+        self.rng = random.Random(seed)
+        self.token = None
+        self.book_ids = []
+        self.pool = {}  # 各场景 setup 准备的数据
+
+    @property
+    def headers(self):
+        return {'Authorization': f'Bearer {self.token}'}
+
+    def login(self):
+        response = self.client.request('POST', '/api/auth/login',
+                                       json={'username': BENCH_ADMIN[0], 'password': BENCH_ADMIN[1]})
+        if response.status != 200:
+            raise RuntimeError(f"基准用户登录失败 ({response.status})，请先运行 generate")
+        self.token = response.json()['token']
+
+        response = self.client.request('GET', '/api/books/', headers=self.headers,
+                                       params={'cursor': '', 'per_page': 500, 'active_only': 'true'})
+        self.book_ids = [book['id'] for book in response.json()['items']]
+        if not self.book_ids:
+            raise RuntimeError("数据库中没有书籍，请先运行 generate")
+
+    def sale_payload(self):
+        items = [{'book_id': book_id, 'quantity': 1, 'price': '10.00'}
+                 for book_id in self.rng.sample(self.book_ids, min(3, len(self.book_ids)))]
+        return {'payment_method': 'CASH', 'items': items}
+
+
+class Scenario:
+    def __init__(self, name, step, setup=None, description=''):
+        self.name = name
+        self.step = step
+        self.setup = setup
+        self.description = description
+
+
+def _login(ctx, i):
+    return ctx.client.request('POST', '/api/auth/login',
+                              json={'username': BENCH_ADMIN[0], 'password': BENCH_ADMIN[1]})
+
+
+def _search(ctx, i):
+    term = ctx.rng.choice(TOPICS) + (ctx.rng.choice(SUFFIXES) if i % 2 else '')
+    return ctx.client.request('GET', '/api/books/', headers=ctx.headers,
+                              params={'search': term, 'per_page': 20, 'sort': 'relevance'})
+
+
+def _suggest(ctx, i):
+    term = ctx.rng.choice(TOPICS)
+    return ctx.client.request('GET', '/api/books/suggest', headers=ctx.headers,
+                              params={'q': term[:1 + i % len(term)]})
+
+
+def _checkout(ctx, i):
+    return ctx.client.request('POST', '/api/sales/', headers=ctx.headers, json=ctx.sale_payload())
+
+
+def _setup_refund(ctx, iterations):
+    sale_ids = []
+    for _ in range(iterations):
+        response = _checkout(ctx, 0)
+        sale_ids.append(response.json()['id'])
+    ctx.pool['refund'] = sale_ids
+
+
+def _refund(ctx, i):
+    sale_id = ctx.pool['refund'][i]
+    return ctx.client.request('POST', f'/api/sales/{sale_id}/refund', headers=ctx.headers)
+
+
+def _setup_stock_in(ctx, iterations):
+    order_ids = []
+    for _ in range(iterations):
+        items = [{'book_id': book_id, 'quantity': 20, 'purchase_price': '5.00'}
+                 for book_id in ctx.rng.sample(ctx.book_ids, min(3, len(ctx.book_ids)))]
+        response = ctx.client.request('POST', '/api/procurement/orders', headers=ctx.headers,
+                                      json={'supplier': '基准供应商', 'items': items})
+        order_id = response.json()['id']
+        ctx.client.request('POST', f'/api/procurement/orders/{order_id}/pay', headers=ctx.headers)
+        order_ids.append(order_id)
+    ctx.pool['stock_in'] = order_ids
+
+
+def _stock_in(ctx, i):
+    order_id = ctx.pool['stock_in'][i]
+    return ctx.client.request('POST', f'/api/procurement/orders/{order_id}/stock-in', headers=ctx.headers)
+
+
+def _report_params():
+    end = date.today()
+    return {'start_date': (end - timedelta(days=29)).isoformat(), 'end_date': end.isoformat()}
+
+
+def _finance_summary(ctx, i):
+    return ctx.client.request('GET', '/api/finance/summary', headers=ctx.headers, params=_report_params())
+
+
+def _finance_statistics(ctx, i):
+    return ctx.client.request('GET', '/api/finance/reports/sales-statistics', headers=ctx.headers,
+                              params=_report_params())
+
+
+def _finance_trend(ctx, i):
+    params = {**_report_params(), 'period': ('daily', 'weekly', 'monthly')[i % 3]}
+    return ctx.client.request('GET', '/api/finance/reports/sales-trend', headers=ctx.headers, params=params)
+
+
+def _finance_profit(ctx, i):
+    return ctx.client.request('GET', '/api/finance/reports/profit-analysis', headers=ctx.headers,
+                              params=_report_params())
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario('login', _login, description='登录 (bcrypt 校验 + 签发令牌)'),
+    Scenario('book_search', _search, description='书籍搜索，按相关度排序'),
+    Scenario('book_suggest', _suggest, description='输入联想'),
+    Scenario('checkout', _checkout, description='创建3本书的销售单'),
+    Scenario('refund', _refund, setup=_setup_refund, description='销售单退款'),
+    Scenario('stock_in', _stock_in, setup=_setup_stock_in, description='已付款进货单入库'),
+    Scenario('finance_summary', _finance_summary, description='30天财务摘要'),
+    Scenario('finance_sales_statistics', _finance_statistics, description='30天销售统计'),
+    Scenario('finance_sales_trend', _finance_trend, description='30天销售趋势'),
+    Scenario('finance_profit', _finance_profit, description='30天利润分析'),
+)}
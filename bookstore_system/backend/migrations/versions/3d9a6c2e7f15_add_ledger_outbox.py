@@ -0,0 +1,35 @@
+"""Add ledger_outbox table
+
+Revision ID: 3d9a6c2e7f15
+Revises: f2b6d8a41c37
+Create Date: 2026-10-18 19:26:03.118472
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9a6c2e7f15'
+down_revision = 'f2b6d8a41c37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ledger_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('type', sa.String(length=20), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('reference_id', sa.String(length=50), nullable=True),
+    sa.Column('reference_type', sa.String(length=20), nullable=True),
+    sa.Column('transaction_date', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ledger_outbox')
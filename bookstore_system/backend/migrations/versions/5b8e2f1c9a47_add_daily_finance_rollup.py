@@ -0,0 +1,74 @@
+"""Add daily_finance_rollup table
+
+Revision ID: 5b8e2f1c9a47
+Revises: d4c745cb31ca
+Create Date: 2026-10-18 10:12:41.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2f1c9a47'
+down_revision = 'd4c745cb31ca'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_finance_rollup',
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('income', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('expense', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('sale_count', sa.Integer(), nullable=False),
+    sa.Column('sale_revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('refund_count', sa.Integer(), nullable=False),
+    sa.Column('purchase_cost', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('date')
+    )
+    backfill_rollup()
+
+
+def backfill_rollup():
+    """按已有的交易、销售和进货单回填汇总表 (与 RollupService.rebuild 的口径一致)
+
+    报表默认读取汇总表 (FINANCE_ROLLUP_ENABLED)，升级后不回填会显示为零。
+    """
+    if op.get_bind().dialect.name == 'sqlite':
+        day = 'date({})'.format
+    else:
+        day = 'CAST({} AS DATE)'.format
+
+    op.execute(f"""
+        INSERT INTO daily_finance_rollup
+            (date, income, expense, sale_count, sale_revenue, refund_count, purchase_cost, updated_at)
+        SELECT day, SUM(income), SUM(expense), SUM(sale_count), SUM(sale_revenue),
+               SUM(refund_count), SUM(purchase_cost), CURRENT_TIMESTAMP
+        FROM (
+            SELECT {day('t.transaction_date')} AS day,
+                   CASE WHEN t.type = 'INCOME' THEN t.amount ELSE 0 END AS income,
+                   CASE WHEN t.type = 'EXPENSE' THEN t.amount ELSE 0 END AS expense,
+                   0 AS sale_count, 0 AS sale_revenue, 0 AS refund_count, 0 AS purchase_cost
+            FROM transactions t
+            UNION ALL
+            SELECT {day('s.sale_date')}, 0, 0, 1, s.total_amount, 0, 0
+            FROM sales s
+            WHERE s.status = 'COMPLETED'
+            UNION ALL
+            SELECT {day('t.transaction_date')}, 0, 0, 0, 0, 1, 0
+            FROM transactions t
+            JOIN sales s ON s.sale_number = t.reference_id
+            WHERE t.type = 'EXPENSE'
+            UNION ALL
+            SELECT {day('p.order_date')}, 0, 0, 0, 0, 0, p.total_amount
+            FROM purchase_orders p
+            WHERE p.status IN ('PAID', 'STOCKED')
+        ) AS src
+        GROUP BY day
+    """)
+
+
+def downgrade():
+    op.drop_table('daily_finance_rollup')
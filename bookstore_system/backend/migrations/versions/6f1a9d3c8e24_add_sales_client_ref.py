@@ -0,0 +1,28 @@
+"""Add client_ref to sales for offline batch sync
+
+Revision ID: 6f1a9d3c8e24
+Revises: 8b4e1f6a2c90
+Create Date: 2026-10-18 22:17:45.903614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f1a9d3c8e24'
+down_revision = '8b4e1f6a2c90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # PostgreSQL 上 sales 为分区表，新增列和索引会传播到所有分区
+    op.add_column('sales', sa.Column('client_ref', sa.String(length=64), nullable=True))
+    op.create_index('ix_sales_user_id_client_ref', 'sales', ['user_id', 'client_ref'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_sales_user_id_client_ref', table_name='sales')
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.drop_column('client_ref')
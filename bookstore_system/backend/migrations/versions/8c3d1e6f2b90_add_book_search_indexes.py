@@ -0,0 +1,60 @@
+"""Add book search indexes (pg_trgm on PostgreSQL, FTS5 on SQLite)
+
+Revision ID: 8c3d1e6f2b90
+Revises: 5b8e2f1c9a47
+Create Date: 2026-10-18 14:05:12.318402
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8c3d1e6f2b90'
+down_revision = '5b8e2f1c9a47'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_COLUMNS = ('name', 'author', 'isbn')
+
+# SQLite FTS5 外部内容表及同步触发器；更新触发器只监听被索引的列，库存变化不会改写索引
+SQLITE_FTS_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        name, author, isbn, content='books', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, name, author, isbn) VALUES (new.id, new.name, new.author, new.isbn);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, name, author, isbn) VALUES ('delete', old.id, old.name, old.author, old.isbn);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF name, author, isbn ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, name, author, isbn) VALUES ('delete', old.id, old.name, old.author, old.isbn);
+        INSERT INTO books_fts(rowid, name, author, isbn) VALUES (new.id, new.name, new.author, new.isbn);
+    END""",
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in TRIGRAM_COLUMNS:
+            op.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_books_{column}_trgm '
+                f'ON books USING gin ({column} gin_trgm_ops)'
+            )
+    elif dialect == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for column in TRIGRAM_COLUMNS:
+            op.execute(f'DROP INDEX IF EXISTS ix_books_{column}_trgm')
+    elif dialect == 'sqlite':
+        for trigger in ('books_fts_ai', 'books_fts_ad', 'books_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS books_fts')
@@ -0,0 +1,50 @@
+"""Add other_expense to daily_finance_rollup
+
+Revision ID: 9e7b4a1d5c36
+Revises: 6f1a9d3c8e24
+Create Date: 2026-10-18 23:41:08.316524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e7b4a1d5c36'
+down_revision = '6f1a9d3c8e24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('daily_finance_rollup', sa.Column('other_expense', sa.Numeric(precision=14, scale=2),
+                                                    server_default='0', nullable=False))
+    backfill_other_expense()
+    with op.batch_alter_table('daily_finance_rollup', schema=None) as batch_op:
+        batch_op.alter_column('other_expense', server_default=None)
+
+
+def backfill_other_expense():
+    """按已有的支出交易回填其他支出 (与 RollupService.rebuild 的口径一致：进货付款以外的支出)"""
+    if op.get_bind().dialect.name == 'sqlite':
+        day = 'date({})'.format
+    else:
+        day = 'CAST({} AS DATE)'.format
+
+    op.execute(f"""
+        UPDATE daily_finance_rollup
+        SET other_expense = src.amount
+        FROM (
+            SELECT {day('t.transaction_date')} AS day, SUM(t.amount) AS amount
+            FROM transactions t
+            WHERE t.type = 'EXPENSE'
+              AND (t.reference_type IS NULL OR t.reference_type <> 'purchase_order')
+            GROUP BY {day('t.transaction_date')}
+        ) AS src
+        WHERE daily_finance_rollup.date = src.day
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('daily_finance_rollup', schema=None) as batch_op:
+        batch_op.drop_column('other_expense')
@@ -0,0 +1,35 @@
+"""Add composite/covering indexes for finance and sales reports
+
+Revision ID: a7f3c2d9e514
+Revises: 8c3d1e6f2b90
+Create Date: 2026-10-18 16:40:27.905113
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7f3c2d9e514'
+down_revision = '8c3d1e6f2b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # postgresql_include 在其他数据库上会被忽略，退化为普通组合索引
+    op.create_index('ix_transactions_type_transaction_date', 'transactions', ['type', 'transaction_date'],
+                    unique=False, postgresql_include=['amount'])
+    op.create_index('ix_transactions_transaction_date', 'transactions', ['transaction_date'],
+                    unique=False, postgresql_include=['type', 'amount'])
+    op.create_index('ix_sales_status_sale_date', 'sales', ['status', 'sale_date'],
+                    unique=False, postgresql_include=['total_amount'])
+    op.create_index('ix_sales_user_id_sale_date', 'sales', ['user_id', 'sale_date'], unique=False)
+    op.create_index('ix_sale_items_book_id_sale_id', 'sale_items', ['book_id', 'sale_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_sale_items_book_id_sale_id', table_name='sale_items')
+    op.drop_index('ix_sales_user_id_sale_date', table_name='sales')
+    op.drop_index('ix_sales_status_sale_date', table_name='sales')
+    op.drop_index('ix_transactions_transaction_date', table_name='transactions')
+    op.drop_index('ix_transactions_type_transaction_date', table_name='transactions')
@@ -0,0 +1,170 @@
+"""Partition transactions, sales and sale_items by month (PostgreSQL)
+
+Revision ID: f2b6d8a41c37
+Revises: a7f3c2d9e514
+Create Date: 2026-10-18 18:12:44.530981
+
+"""
+from datetime import date
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b6d8a41c37'
+down_revision = 'a7f3c2d9e514'
+branch_labels = None
+depends_on = None
+
+# 迁移时预先创建到未来几个月的分区
+MONTHS_AHEAD = 3
+
+# 分区表及其分区键 (迁移保持为当时的快照，不引用 app.services.partition_service)
+PARTITION_KEYS = {
+    'transactions': 'transaction_date',
+    'sales': 'sale_date',
+    'sale_items': 'sale_date',
+}
+
+REPORT_INDEXES = (
+    ('ix_transactions_type_transaction_date', 'transactions', ['type', 'transaction_date'], ['amount']),
+    ('ix_transactions_transaction_date', 'transactions', ['transaction_date'], ['type', 'amount']),
+    ('ix_sales_status_sale_date', 'sales', ['status', 'sale_date'], ['total_amount']),
+    ('ix_sales_user_id_sale_date', 'sales', ['user_id', 'sale_date'], None),
+    ('ix_sale_items_book_id_sale_id', 'sale_items', ['book_id', 'sale_id'], None),
+)
+
+# 分区表的主键/唯一约束必须包含分区键
+KEYS = {
+    'transactions': ['PRIMARY KEY (id, transaction_date)'],
+    'sales': ['PRIMARY KEY (id, sale_date)', 'UNIQUE (sale_number, sale_date)'],
+    'sale_items': ['PRIMARY KEY (id, sale_date)'],
+}
+
+FOREIGN_KEYS = {
+    'transactions': ['FOREIGN KEY (user_id) REFERENCES users (id)'],
+    'sales': ['FOREIGN KEY (user_id) REFERENCES users (id)'],
+    # 可延迟：create-partitions 在默认分区和新分区之间移动 sales 行时在提交时才检查
+    'sale_items': ['FOREIGN KEY (book_id) REFERENCES books (id)',
+                   'FOREIGN KEY (sale_id, sale_date) REFERENCES sales (id, sale_date) '
+                   'DEFERRABLE INITIALLY IMMEDIATE'],
+}
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_month_partition(table, month):
+    """新建的分区表还没有默认分区，直接创建 <表名>_YYYY_MM 分区"""
+    lower, upper = month.isoformat(), _add_months(month, 1).isoformat()
+    op.execute(f"CREATE TABLE {table}_{month:%Y_%m} PARTITION OF {table} "
+               f"FOR VALUES FROM ('{lower}') TO ('{upper}')")
+
+
+def _add_sale_items_sale_date():
+    op.add_column('sale_items', sa.Column('sale_date', sa.DateTime(), nullable=True))
+    op.execute('UPDATE sale_items SET sale_date = '
+               '(SELECT sales.sale_date FROM sales WHERE sales.id = sale_items.sale_id)')
+    with op.batch_alter_table('sale_items') as batch_op:
+        batch_op.alter_column('sale_date', existing_type=sa.DateTime(), nullable=False)
+
+
+def _rename_table(conn, table, suffix):
+    """表改名为 <表名>_<suffix>，主键/唯一约束同样加上后缀
+
+    约束对应的索引名在 schema 内唯一，不改名的话新表无法使用原来的约束名。
+    """
+    new_name = f'{table}_{suffix}'
+    op.execute(f'ALTER TABLE {table} RENAME TO {new_name}')
+    for constraint, in conn.execute(sa.text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:table) AND contype IN ('p', 'u')"
+    ), {'table': new_name}).all():
+        op.execute(f'ALTER TABLE {new_name} RENAME CONSTRAINT "{constraint}" TO "{constraint}_{suffix}"')
+    return new_name
+
+
+def _partition(conn, table):
+    """把普通表重建为按月分区的表，数据原样复制"""
+    key = PARTITION_KEYS[table]
+    old = _rename_table(conn, table, 'old')
+    op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE ({key})')
+    for constraint in KEYS[table]:
+        op.execute(f'ALTER TABLE {table} ADD {constraint}')
+    for constraint in FOREIGN_KEYS[table]:
+        op.execute(f'ALTER TABLE {table} ADD {constraint}')
+
+    first, last = conn.execute(sa.text(f'SELECT min({key}), max({key}) FROM {old}')).one()
+    month = _month_start(first or date.today())
+    end = max(_month_start(last or date.today()), _add_months(_month_start(date.today()), MONTHS_AHEAD))
+    while month <= end:
+        _create_month_partition(table, month)
+        month = _add_months(month, 1)
+    op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+    op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+    # 序列归属新表，否则删除旧表时会一起删除
+    sequence = conn.execute(sa.text('SELECT pg_get_serial_sequence(:table, :column)'),
+                            {'table': old, 'column': 'id'}).scalar()
+    if sequence:
+        op.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+
+
+def _unpartition(conn, table, constraints):
+    """分区表还原为普通表"""
+    old = _rename_table(conn, table, 'partitioned')
+    op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS)')
+    for constraint in constraints:
+        op.execute(f'ALTER TABLE {table} ADD {constraint}')
+    op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+    sequence = conn.execute(sa.text('SELECT pg_get_serial_sequence(:table, :column)'),
+                            {'table': old, 'column': 'id'}).scalar()
+    if sequence:
+        op.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+
+
+def _create_report_indexes():
+    for name, table, columns, include in REPORT_INDEXES:
+        op.create_index(name, table, columns, unique=False, postgresql_include=include or [])
+
+
+def upgrade():
+    conn = op.get_bind()
+    _add_sale_items_sale_date()
+    if conn.dialect.name != 'postgresql':
+        return
+
+    for name, table, _, _ in REPORT_INDEXES:
+        op.drop_index(name, table_name=table)
+    for table in ('transactions', 'sales', 'sale_items'):
+        _partition(conn, table)
+    op.execute('DROP TABLE transactions_old')
+    op.execute('DROP TABLE sale_items_old')
+    op.execute('DROP TABLE sales_old')
+    _create_report_indexes()
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        for name, table, _, _ in REPORT_INDEXES:
+            op.drop_index(name, table_name=table)
+        _unpartition(conn, 'transactions', ['PRIMARY KEY (id)',
+                                            'FOREIGN KEY (user_id) REFERENCES users (id)'])
+        _unpartition(conn, 'sales', ['PRIMARY KEY (id)', 'UNIQUE (sale_number)',
+                                     'FOREIGN KEY (user_id) REFERENCES users (id)'])
+        _unpartition(conn, 'sale_items', ['PRIMARY KEY (id)',
+                                          'FOREIGN KEY (book_id) REFERENCES books (id)',
+                                          'FOREIGN KEY (sale_id) REFERENCES sales (id)'])
+        op.execute('DROP TABLE transactions_partitioned')
+        op.execute('DROP TABLE sale_items_partitioned')
+        op.execute('DROP TABLE sales_partitioned')
+        _create_report_indexes()
+
+    with op.batch_alter_table('sale_items') as batch_op:
+        batch_op.drop_column('sale_date')
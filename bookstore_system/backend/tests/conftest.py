@@ -1,4 +1,10 @@
+import os
+import importlib.util
 import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
 from app.models.user import User
 from app.utils.auth import generate_token
 from app import create_app, db as _db # Import create_app and db
@@ -31,11 +37,21 @@ def app():
 
     ctx.pop()
 
+def _run_migration_upgrade(filename):
+    """执行单个迁移的 upgrade()，用于 create_all 不会创建的对象 (如 FTS5 虚拟表和触发器)"""
+    path = os.path.join(os.path.dirname(__file__), '..', 'migrations', 'versions', filename)
+    spec = importlib.util.spec_from_file_location(filename[:-3], path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    with _db.engine.begin() as conn, Operations.context(MigrationContext.configure(conn)):
+        migration.upgrade()
+
 @pytest.fixture(scope='session')
 def db(app):
     """Session-wide test database."""
     _db.app = app
     _db.create_all()
+    _run_migration_upgrade('8c3d1e6f2b90_add_book_search_indexes.py')
 
     yield _db
 
@@ -48,6 +64,12 @@ def init_database(db):
     for table in reversed(db.metadata.sorted_tables):
         db.session.execute(table.delete())
     db.session.commit()
+    # 内存中的联想索引、令牌缓存、报表缓存、幂等响应缓存和库存读模型随数据一起重置
+    db.app.extensions.pop('book_suggest_index', None)
+    db.app.extensions.pop('auth_cache', None)
+    db.app.extensions.pop('report_cache', None)
+    db.app.extensions.pop('idempotency_cache', None)
+    db.app.extensions.pop('inventory_read_model', None)
     yield db
     # Clean up after test if needed, though session scope might handle it
     db.session.remove()
@@ -100,3 +122,37 @@ def client(app):
     """Creates a test client for the Flask application."""
     return app.test_client()
 
+
+
+@pytest.fixture
+def count_queries(db):
+    """返回一个上下文管理器，记录期间执行的所有SQL语句"""
+    @contextmanager
+    def _count_queries():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    return _count_queries
+
+
+@pytest.fixture
+def page_query_counts(client, count_queries):
+    """返回一个函数：按不同的每页数量请求列表接口，得到每次请求执行的SQL语句数"""
+    def _page_query_counts(url, headers, page_sizes=(5, 20)):
+        counts = {}
+        for per_page in page_sizes:
+            with count_queries() as statements:
+                response = client.get(url, headers=headers, query_string={'per_page': per_page})
+            assert response.status_code == 200
+            counts[per_page] = len(statements)
+        return counts
+
+    return _page_query_counts
@@ -0,0 +1,48 @@
+from benchmarks.datagen import generate
+from benchmarks.runner import FlaskClientAdapter, run, percentile
+from app.models.book import Book
+from app.models.sale import Sale
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
+
+
+def test_generate_and_run_smoke(app, init_database):
+    """测试小规模数据生成并执行每个场景，不出现错误响应"""
+    counts = generate(scale=30, chunk_size=7)
+    assert Book.query.count() == counts['books'] == 30
+    assert Sale.query.count() == counts['sales']
+
+    client = FlaskClientAdapter(app)
+    try:
+        results = run(client, iterations=2, warmup=0, metadata={'database': 'sqlite'})
+    finally:
+        client.close()
+
+    for name, result in results['scenarios'].items():
+        assert result['requests'] == 2, name
+        assert result['errors'] == 0, (name, result['error_statuses'])
+        assert result['latency_ms']['p99'] is not None
+        assert result['queries_per_request']['mean'] is not None
+
+
+def test_explain_compare_uses_report_indexes(app, init_database):
+    """测试报表索引被查询计划使用，且对比结束后索引被恢复"""
+    from sqlalchemy import inspect
+    from benchmarks.explain import compare
+    from app import db
+
+    generate(scale=30, chunk_size=50)
+    results = compare(repeat=1)
+
+    assert results['meta']['missing_indexes'] == []
+    ledger = results['queries']['ledger_type_range']
+    assert any('ix_transactions_type_transaction_date' in step for step in ledger['with_indexes']['plan'])
+    assert not any('ix_transactions_type_transaction_date' in step for step in ledger['without_indexes']['plan'])
+
+    names = {index['name'] for index in inspect(db.engine).get_indexes('transactions')}
+    assert 'ix_transactions_type_transaction_date' in names
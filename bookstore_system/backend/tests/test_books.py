@@ -1,5 +1,6 @@
 import pytest
 import json
+from sqlalchemy import text
 from app.models.user import User
 from app.models.book import Book
 from app.utils.auth import generate_token
@@ -309,4 +310,299 @@ def test_normal_user_cannot_modify_books(client, init_database, app):
                          headers={'Authorization': f'Bearer {token}'})
     
     # 验证响应 - 应该返回403禁止访问
-    assert response.status_code == 403
\ No newline at end of file
+    assert response.status_code == 403
+
+
+def test_list_books_cursor_pagination(client, create_sample_books):
+    """测试书籍列表的游标分页可以不重不漏地遍历所有书籍"""
+    seen = []
+    cursor = ''
+    while True:
+        response = client.get('/api/books/', query_string={'cursor': cursor, 'per_page': 2})
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert 'total' not in data
+        seen.extend(book['id'] for book in data['items'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == sorted(book.id for book in create_sample_books)
+
+    response = client.get('/api/books/', query_string={'cursor': '', 'with_total': 'true'})
+    assert json.loads(response.data)['total'] == 3
+
+    response = client.get('/api/books/', query_string={'cursor': 'not-a-cursor'})
+    assert response.status_code == 400
+
+def test_search_books_fts_backend(client, init_database, create_sample_books):
+    """测试 SQLite 下使用 FTS5 搜索，且索引随书籍的增删改同步"""
+    from app.services.book_service import get_search_backend
+
+    assert get_search_backend().name == 'fts5'
+
+    def search_names(term, **params):
+        response = client.get('/api/books/', query_string={'search': term, **params})
+        assert response.status_code == 200
+        return [book['name'] for book in json.loads(response.data)['items']]
+
+    # 中文子串、大小写不敏感、ISBN 片段
+    assert search_names('程序设计') == ['JavaScript高级程序设计']
+    assert search_names('zakas') == ['JavaScript高级程序设计']
+    assert search_names('7115546') == ['流畅的Python']
+    # 少于3个字符回退到 LIKE
+    assert len(search_names('Py')) == 2
+
+    # 相关度排序：书名以搜索词开头的排在前面
+    assert search_names('Python', sort='relevance')[0] == 'Python编程：从入门到实践'
+
+    # 更新和删除后索引同步
+    book = create_sample_books[2]
+    book.name = 'TypeScript实战'
+    init_database.session.commit()
+    assert search_names('JavaScript') == []
+    assert search_names('TypeScript') == ['TypeScript实战']
+
+    # 只修改库存时不触发索引更新 (total_changes 包含触发器写入的行)
+    session = init_database.session
+    before = session.execute(text('SELECT total_changes()')).scalar()
+    session.execute(text('UPDATE books SET quantity = quantity + 1 WHERE id = :id'), {'id': book.id})
+    assert session.execute(text('SELECT total_changes()')).scalar() - before == 1
+    session.commit()
+
+    init_database.session.delete(book)
+    init_database.session.commit()
+    assert search_names('TypeScript') == []
+
+def test_suggest_books(client, count_queries, create_admin_and_token, create_sample_books):
+    """测试前缀联想：首次查询构建索引，之后不再查询 books 表，增删改后增量更新"""
+    _, token = create_admin_and_token
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def suggest(q, **params):
+        response = client.get('/api/books/suggest', query_string={'q': q, **params}, headers=headers)
+        assert response.status_code == 200
+        return [book['name'] for book in json.loads(response.data)['items']]
+
+    # 书名、作者单词、ISBN 前缀，大小写不敏感
+    assert suggest('python') == ['Python编程：从入门到实践']
+    assert suggest('zak') == ['JavaScript高级程序设计']
+    assert suggest('9787115') == ['流畅的Python']
+    assert len(suggest('9787')) == 3
+    assert len(suggest('9787', limit=2)) == 2
+    assert suggest('') == []
+
+    with count_queries() as statements:
+        suggest('流畅')
+    assert not [s for s in statements if 'FROM books' in s]
+
+    # 新增
+    response = client.post('/api/books', headers=headers, json={
+        'isbn': '9787020002207', 'name': '红楼梦', 'author': '曹雪芹',
+        'publisher': '人民文学出版社', 'retail_price': 59.7, 'quantity': 10
+    })
+    assert response.status_code == 201
+    new_id = json.loads(response.data)['id']
+    assert suggest('红楼') == ['红楼梦']
+
+    # 修改书名和下架
+    response = client.put(f'/api/books/{new_id}', headers=headers, json={'name': '石头记'})
+    assert response.status_code == 200
+    assert suggest('红楼') == []
+    assert suggest('石头') == ['石头记']
+
+    response = client.put(f'/api/books/{new_id}', headers=headers, json={'is_active': False})
+    assert response.status_code == 200
+    assert suggest('石头') == []
+
+    # 删除
+    response = client.delete(f'/api/books/{create_sample_books[1].id}', headers=headers)
+    assert response.status_code == 200
+    assert suggest('流畅') == []
+
+def test_import_books_csv(client, count_queries, create_admin_and_token, create_sample_books):
+    """测试 CSV 批量导入：新建与覆盖、逐行错误报告，每批只查询一次已有 ISBN"""
+    _, token = create_admin_and_token
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'text/csv'}
+    body = (
+        'isbn,name,author,publisher,retail_price,quantity\n'
+        '9787020002207,红楼梦,曹雪芹,人民文学出版社,59.70,10\n'
+        '9787302275954,Python编程（第3版）,埃里克·马瑟斯,人民邮电出版社,89.00,999\n'
+        ',缺少ISBN,,,10.00,1\n'
+        '9787020008735,西游记,吴承恩,,-5,1\n'
+        '9787020008728,三国演义,罗贯中,,39.50,\n'
+    ).encode('utf-8')
+
+    with count_queries() as statements:
+        response = client.post('/api/books/import', headers=headers, data=body,
+                               query_string={'batch_size': 100})
+    assert response.status_code == 200
+    report = json.loads(response.data)
+    assert report['total'] == 5
+    assert (report['created'], report['updated'], report['failed']) == (2, 1, 2)
+    assert [error['line'] for error in report['errors']] == [4, 5]
+    assert 'isbn' in report['errors'][0]['errors']
+    assert 'retail_price' in report['errors'][1]['errors']
+    assert len([s for s in statements if 'FROM books' in s and 'IN' in s]) == 1
+
+    existing = Book.query.filter_by(isbn='9787302275954').first()
+    assert existing.name == 'Python编程（第3版）'
+    assert existing.quantity == 100  # 已有书籍的库存不被导入覆盖
+    assert Book.query.filter_by(isbn='9787020008728').first().quantity == 0
+
+    response = client.get('/api/books/suggest', headers=headers, query_string={'q': '红楼'})
+    assert [book['name'] for book in json.loads(response.data)['items']] == ['红楼梦']
+
+
+def test_import_books_jsonl(client, create_admin_and_token, create_sample_books):
+    """测试 JSONL 导入：skip 模式不修改已有书籍，同一批内重复 ISBN 以最后一行为准"""
+    _, token = create_admin_and_token
+    headers = {'Authorization': f'Bearer {token}'}
+    lines = [
+        json.dumps({'isbn': '9787115546081', 'name': '流畅的Python（第2版）', 'retail_price': 159}),
+        json.dumps({'isbn': '9787020002207', 'name': '红楼梦', 'retail_price': 59.7}),
+        'not json',
+        json.dumps({'isbn': '9787020002207', 'name': '红楼梦（校注本）', 'retail_price': 69}),
+    ]
+    response = client.post('/api/books/import', headers=headers, data='\n'.join(lines).encode('utf-8'),
+                           query_string={'format': 'jsonl', 'on_conflict': 'skip'})
+    assert response.status_code == 200
+    report = json.loads(response.data)
+    assert (report['created'], report['updated'], report['skipped'], report['failed']) == (1, 0, 1, 2)
+    assert [error['line'] for error in report['errors']] == [3, 2]
+    assert Book.query.filter_by(isbn='9787115546081').first().name == '流畅的Python'
+    assert Book.query.filter_by(isbn='9787020002207').first().name == '红楼梦（校注本）'
+
+    response = client.post('/api/books/import', headers=headers, data=b'{}',
+                           content_type='application/json')
+    assert response.status_code == 400
+
+def test_import_books_update_keeps_unprovided_fields(client, init_database, create_admin_and_token, create_sample_books):
+    """测试 update 模式只覆盖提供了的字段：空单元格、缺少的列和键不会清空原值，也不会重新上架已下架的书籍"""
+    _, token = create_admin_and_token
+    headers = {'Authorization': f'Bearer {token}'}
+    create_sample_books[0].is_active = False
+    init_database.session.commit()
+
+    body = (
+        'isbn,name,author,retail_price\n'
+        '9787302275954,Python编程（第3版）,,89.00\n'
+        '9787115546081,流畅的Python（第2版）,Luciano Ramalho,159.00\n'
+    ).encode('utf-8')
+    response = client.post('/api/books/import', headers={**headers, 'Content-Type': 'text/csv'}, data=body)
+    assert json.loads(response.data)['updated'] == 2
+    lines = [json.dumps({'isbn': '9787111616054', 'name': 'JavaScript高级程序设计（第4版）',
+                         'retail_price': 139, 'publisher': None, 'is_active': False})]
+    response = client.post('/api/books/import', headers=headers, data='\n'.join(lines).encode('utf-8'),
+                           query_string={'format': 'jsonl'})
+    assert json.loads(response.data)['updated'] == 1
+
+    init_database.session.expire_all()
+    first, second, third = (init_database.session.get(Book, book.id) for book in create_sample_books)
+    assert (first.name, first.author, first.publisher, first.is_active) == \
+        ('Python编程（第3版）', '埃里克·马瑟斯', '人民邮电出版社', False)
+    assert (second.author, second.publisher, second.is_active) == ('Luciano Ramalho', '人民邮电出版社', True)
+    # JSONL 中显式给出的 null 和 false 会覆盖
+    assert (third.author, third.publisher, third.is_active) == ('Nicholas C. Zakas', None, False)
+
+def test_inventory_read_model(client, app, count_queries, create_admin_and_token, create_sample_books):
+    """测试库存读模型：查询不访问数据库，提交后的修改立即可见，回滚的修改不可见，核对命令能发现并修正偏差"""
+    from sqlalchemy import update
+    from app import db
+    _, token = create_admin_and_token
+    headers = {'Authorization': f'Bearer {token}'}
+    first, second, third = (book.id for book in create_sample_books)
+
+    def stock(*book_ids):
+        response = client.get('/api/books/stock', query_string={'ids': ','.join(map(str, book_ids))}, headers=headers)
+        assert response.status_code == 200
+        return json.loads(response.data)
+
+    data = stock(first, 999999)
+    assert data['items'] == [{'book_id': first, 'quantity': 100, 'retail_price': 59.0, 'is_active': True}]
+    assert data['missing'] == [999999]
+    with count_queries() as statements:
+        stock(first, second, third)
+    assert not [s for s in statements if 'FROM books' in s]
+
+    # 销售 (原子扣减)、退款 (ORM 修改) 提交后立即可见
+    response = client.post('/api/sales', headers=headers, json={
+        'payment_method': 'CASH', 'items': [{'book_id': first, 'quantity': 3, 'price': 59}]
+    })
+    assert response.status_code == 201
+    assert stock(first)['items'][0]['quantity'] == 97
+    response = client.post(f"/api/sales/{json.loads(response.data)['id']}/refund", headers=headers)
+    assert response.status_code == 200
+    assert stock(first)['items'][0]['quantity'] == 100
+
+    # 库存不足而回滚的销售不影响读模型
+    response = client.post('/api/sales', headers=headers, json={
+        'payment_method': 'CASH', 'items': [{'book_id': second, 'quantity': 1, 'price': 139},
+                                            {'book_id': third, 'quantity': 1000, 'price': 129}]
+    })
+    assert response.status_code == 409
+    assert stock(second)['items'][0]['quantity'] == 50
+
+    # 修改价格、下架和删除
+    assert client.put(f'/api/books/{second}', headers=headers, json={'retail_price': 99.5}).status_code == 200
+    assert client.put(f'/api/books/{first}', headers=headers, json={'is_active': False}).status_code == 200
+    assert client.delete(f'/api/books/{third}', headers=headers).status_code == 200
+    data = stock(first, second, third)
+    assert data['missing'] == [third]
+    assert [(item['retail_price'], item['is_active']) for item in data['items']] == [(59.0, False), (99.5, True)]
+
+    # 绕过会话事件的修改 (例如直接执行SQL) 由核对命令发现
+    with app.app_context():
+        db.session.execute(update(Book.__table__).where(Book.__table__.c.id == second).values(quantity=7))
+        db.session.commit()
+    response = client.get('/api/books/stock/consistency', headers=headers)
+    assert json.loads(response.data)['mismatch_count'] == 1
+    result = app.test_cli_runner().invoke(args=['check-inventory', '--repair'])
+    assert '共 1 本书籍不一致，已修正' in result.output
+    assert stock(second)['items'][0]['quantity'] == 7
+    result = app.test_cli_runner().invoke(args=['check-inventory'])
+    assert result.exit_code == 0 and '一致' in result.output
+
+
+def test_inventory_read_model_commit_path(app, count_queries, create_sample_books, monkeypatch):
+    """测试提交后写入读模型不再访问数据库 (不另外占用连接)，乱序的提交结果不会覆盖更新的条目，
+    过期重建只由一个线程执行"""
+    import time
+    from app import db
+    from app.services.inventory_service import get_inventory
+    model = get_inventory()
+    first, second, _ = (book.id for book in create_sample_books)
+    model.build()
+    db.session.commit()
+
+    def no_new_connection(*args, **kwargs):
+        raise AssertionError('提交后不应另外获取数据库连接')
+
+    # 原子扣减 (RETURNING) 和 ORM 修改价格都在提交前确定写入后的值
+    db.session.connection()
+    monkeypatch.setattr(db.engine, 'connect', no_new_connection)
+    Book.decrease_stock_atomic(first, 5)
+    db.session.get(Book, second).retail_price = 88
+    with count_queries() as statements:
+        db.session.commit()
+    monkeypatch.undo()
+    assert len([s for s in statements if s.lstrip().startswith('SELECT')]) <= 1
+    assert model.get(first)['quantity'] == 95
+    assert model.get(second)['retail_price'] == 88.0
+
+    # 同一本书两个事务的 after_commit 乱序执行：先提交的结果不会覆盖后提交的
+    earlier, later = model.begin_commit(), model.begin_commit()
+    model.end_commit(later, {first: (40, 5900, 1)})
+    model.end_commit(earlier, {first: (41, 5900, 1)})
+    assert model.get(first)['quantity'] == 40
+
+    # 超过 TTL 时如果已有线程在重建，其余查询继续读取旧的数组
+    model._built_at = time.monotonic() - model.ttl - 1
+    model._build_lock.acquire()
+    try:
+        with count_queries() as statements:
+            assert model.get(first)['quantity'] == 40
+        assert not [s for s in statements if 'FROM books' in s]
+    finally:
+        model._build_lock.release()
+    assert model.get(first)['quantity'] == 95
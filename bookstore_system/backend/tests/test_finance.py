@@ -2,6 +2,9 @@ import pytest
 import json
 from datetime import datetime, timedelta
 from app.models.transaction import Transaction, TRANSACTION_TYPES
+from app.models.finance_rollup import DailyFinanceRollup
+from app.services.rollup_service import RollupService
+from app.services.report_cache import invalidate_reports
 from app.utils.auth import generate_token
 
 
@@ -66,4 +69,327 @@ def test_access_control(client, normal_token):
     response = client.get('/api/finance/summary', headers=headers)
     
     # 验证是否被拒绝访问
-    assert response.status_code == 403
\ No newline at end of file
+    assert response.status_code == 403
+
+def _add_transaction(session, user_id, amount, t_type, when):
+    """辅助函数：直接写入一条交易记录"""
+    session.add(Transaction(
+        amount=amount,
+        type=t_type,
+        description='测试交易',
+        user_id=user_id,
+        transaction_date=when
+    ))
+
+
+@pytest.fixture
+def trend_transactions(init_database, admin_token):
+    """在 2025-03-03(周一) 至 2025-03-12 之间写入若干交易"""
+    from app.models.user import User
+    admin = init_database.session.query(User).filter_by(username='testadmin').first()
+    _add_transaction(init_database.session, admin.id, 100, TRANSACTION_TYPES['INCOME'], datetime(2025, 3, 3, 9, 30))
+    _add_transaction(init_database.session, admin.id, 50, TRANSACTION_TYPES['INCOME'], datetime(2025, 3, 3, 23, 59))
+    _add_transaction(init_database.session, admin.id, 30, TRANSACTION_TYPES['EXPENSE'], datetime(2025, 3, 5, 12, 0))
+    _add_transaction(init_database.session, admin.id, 80, TRANSACTION_TYPES['INCOME'], datetime(2025, 3, 10, 0, 0))
+    # 范围之外的数据不应被统计
+    _add_transaction(init_database.session, admin.id, 999, TRANSACTION_TYPES['INCOME'], datetime(2025, 2, 1, 8, 0))
+    init_database.session.commit()
+    # 直接写入的交易不会经过增量维护，需要重建汇总表
+    RollupService.rebuild()
+    return admin_token
+
+
+def test_sales_trend_daily_fills_empty_days(client, trend_transactions):
+    """测试按日趋势：空日期补零，同日交易合并"""
+    headers = {'Authorization': f'Bearer {trend_transactions}'}
+    response = client.get('/api/finance/reports/sales-trend', headers=headers, query_string={
+        'period': 'daily', 'start_date': '2025-03-03', 'end_date': '2025-03-06'
+    })
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [row['period'] for row in data] == ['2025-03-03', '2025-03-04', '2025-03-05', '2025-03-06']
+    assert data[0] == {'period': '2025-03-03', 'income': 150.0, 'expense': 0.0}
+    assert data[1] == {'period': '2025-03-04', 'income': 0.0, 'expense': 0.0}
+    assert data[2]['expense'] == 30.0
+
+
+def test_sales_trend_weekly(client, trend_transactions):
+    """测试按周趋势：以星期一为一周的开始"""
+    headers = {'Authorization': f'Bearer {trend_transactions}'}
+    response = client.get('/api/finance/reports/sales-trend', headers=headers, query_string={
+        'period': 'weekly', 'start_date': '2025-03-05', 'end_date': '2025-03-12'
+    })
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data == [
+        {'period': '2025-03-03 ~ 2025-03-09', 'income': 150.0, 'expense': 30.0},
+        {'period': '2025-03-10 ~ 2025-03-16', 'income': 80.0, 'expense': 0.0},
+    ]
+
+
+def test_sales_trend_monthly(client, trend_transactions):
+    """测试按月趋势"""
+    headers = {'Authorization': f'Bearer {trend_transactions}'}
+    response = client.get('/api/finance/reports/sales-trend', headers=headers, query_string={
+        'period': 'monthly', 'start_date': '2025-01-15', 'end_date': '2025-03-31'
+    })
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data == [
+        {'period': '2025-01', 'income': 0.0, 'expense': 0.0},
+        {'period': '2025-02', 'income': 999.0, 'expense': 0.0},
+        {'period': '2025-03', 'income': 230.0, 'expense': 30.0},
+    ]
+
+
+def test_sales_trend_from_ledger(client, app, trend_transactions, monkeypatch):
+    """测试关闭汇总表时直接从交易明细计算趋势，结果一致"""
+    monkeypatch.setitem(app.config, 'FINANCE_ROLLUP_ENABLED', False)
+    headers = {'Authorization': f'Bearer {trend_transactions}'}
+    response = client.get('/api/finance/reports/sales-trend', headers=headers, query_string={
+        'period': 'weekly', 'start_date': '2025-03-05', 'end_date': '2025-03-12'
+    })
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == [
+        {'period': '2025-03-03 ~ 2025-03-09', 'income': 150.0, 'expense': 30.0},
+        {'period': '2025-03-10 ~ 2025-03-16', 'income': 80.0, 'expense': 0.0},
+    ]
+
+
+def _rollup_snapshot(session):
+    """辅助函数：读取汇总表内容"""
+    return {
+        row.date: (float(row.income), float(row.expense), row.sale_count,
+                   float(row.sale_revenue), row.refund_count, float(row.purchase_cost), float(row.other_expense))
+        for row in session.query(DailyFinanceRollup).all()
+    }
+
+
+def test_rollup_maintained_by_sales_and_payments(client, app, admin_token, book_fixture, init_database, monkeypatch):
+    """测试销售、退款和进货付款在同一事务中维护汇总表，且与重建结果一致"""
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    sale_data = {'items': [{'book_id': book_fixture.id, 'quantity': 2, 'price': 40.00}]}
+
+    first = client.post('/api/sales', json=sale_data, headers=headers)
+    second = client.post('/api/sales', json=sale_data, headers=headers)
+    assert first.status_code == 201 and second.status_code == 201
+
+    refund = client.post(f"/api/sales/{json.loads(second.data)['id']}/refund", headers=headers)
+    assert refund.status_code == 200
+
+    order = client.post('/api/procurement/orders', headers=headers, json={
+        'supplier': '测试供应商',
+        'items': [{'book_id': book_fixture.id, 'quantity': 3, 'purchase_price': 20.00}]
+    })
+    order_id = json.loads(order.data)['id']
+    assert client.post(f'/api/procurement/orders/{order_id}/pay', headers=headers).status_code == 200
+
+    incremental = _rollup_snapshot(init_database.session)
+    assert len(incremental) == 1
+    income, expense, sale_count, sale_revenue, refund_count, purchase_cost, other_expense = next(iter(incremental.values()))
+    assert income == 160.0
+    assert expense == 80.0 + 60.0
+    assert (sale_count, sale_revenue, refund_count, purchase_cost) == (1, 80.0, 1, 60.0)
+    # 其他支出只包括退款，不包括进货付款
+    assert other_expense == 80.0
+
+    # 重建结果应与增量维护的结果完全一致
+    RollupService.rebuild()
+    init_database.session.expire_all()
+    assert _rollup_snapshot(init_database.session) == incremental
+
+    # 整天范围的报表读取汇总表
+    today = next(iter(incremental)).strftime('%Y-%m-%d')
+    response = client.get('/api/finance/reports/sales-statistics', headers=headers,
+                          query_string={'start_date': today, 'end_date': today})
+    assert json.loads(response.data) == {'total_sales': 1, 'total_revenue': 80.0}
+
+    response = client.get('/api/finance/reports/profit-analysis', headers=headers,
+                          query_string={'start_date': today, 'end_date': today})
+    profit = json.loads(response.data)
+    assert profit['total_revenue'] == 80.0
+    assert profit['total_cost'] == 60.0
+    assert profit['other_expenses'] == 80.0
+    assert profit['net_profit'] == 80.0 - 60.0 - 80.0
+
+    # 不使用汇总表时扫描明细的结果与汇总表一致
+    monkeypatch.setitem(app.config, 'FINANCE_ROLLUP_ENABLED', False)
+    invalidate_reports(historical=True)
+    response = client.get('/api/finance/reports/profit-analysis', headers=headers,
+                          query_string={'start_date': today, 'end_date': today})
+    assert json.loads(response.data) == profit
+
+
+def _non_auth_statements(statements):
+    """辅助函数：排除认证装饰器查询用户的语句"""
+    return [statement for statement in statements if 'FROM users' not in statement]
+
+
+@pytest.mark.parametrize('rollup_enabled', [True, False])
+def test_summary_single_statement(client, app, trend_transactions, count_queries, monkeypatch, rollup_enabled):
+    """测试财务摘要只执行一条统计语句，且结果正确"""
+    monkeypatch.setitem(app.config, 'FINANCE_ROLLUP_ENABLED', rollup_enabled)
+    headers = {'Authorization': f'Bearer {trend_transactions}'}
+
+    with count_queries() as statements:
+        response = client.get('/api/finance/summary', headers=headers, query_string={
+            'start_date': '2025-03-06', 'end_date': '2025-03-12'
+        })
+
+    assert response.status_code == 200
+    assert len(_non_auth_statements(statements)) == 1
+
+    data = json.loads(response.data)
+    assert data['total_income'] == 80.0
+    assert data['total_expense'] == 0.0
+    assert data['by_type'] == {'INCOME': 80.0, 'EXPENSE': 0.0}
+    # 上一周期为 2025-02-27 ~ 2025-03-05: 收入150，支出30
+    assert data['comparison']['income_change_rate'] == round((80 - 150) / 150 * 100, 2)
+    assert data['comparison']['expense_change_rate'] == -100.0
+
+
+def test_summary_without_range(client, trend_transactions, count_queries):
+    """测试不带日期范围的财务摘要统计全部数据"""
+    headers = {'Authorization': f'Bearer {trend_transactions}'}
+
+    with count_queries() as statements:
+        response = client.get('/api/finance/summary', headers=headers)
+
+    assert len(_non_auth_statements(statements)) == 1
+    data = json.loads(response.data)
+    assert data['total_income'] == 1229.0
+    assert data['net_profit'] == 1199.0
+    assert data['comparison'] == {}
+
+
+def test_transactions_cursor_pagination(client, trend_transactions):
+    """测试交易记录的游标分页按 (日期, ID) 降序遍历全部记录"""
+    headers = {'Authorization': f'Bearer {trend_transactions}'}
+    seen = []
+    cursor = ''
+    while True:
+        response = client.get('/api/finance/transactions', headers=headers,
+                              query_string={'cursor': cursor, 'per_page': 2})
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert 'total' not in data['pagination']
+        seen.extend(row['transaction_date'] for row in data['transactions'])
+        cursor = data['pagination']['next_cursor']
+        if cursor is None:
+            break
+
+    assert len(seen) == 5
+    assert seen == sorted(seen, reverse=True)
+
+    response = client.get('/api/finance/transactions', headers=headers,
+                          query_string={'cursor': '', 'with_total': 'true',
+                                        'transaction_type': TRANSACTION_TYPES['INCOME']})
+    assert json.loads(response.data)['pagination']['total'] == 4
+
+
+def test_partition_helpers_and_commands(app):
+    """测试分区月份计算；非 PostgreSQL 数据库上分区命令不做任何操作"""
+    from datetime import date
+    from app.services.partition_service import add_months, month_start, partition_name
+
+    assert month_start(date(2025, 3, 17)) == date(2025, 3, 1)
+    assert add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert partition_name('sale_items', date(2025, 2, 1)) == 'sale_items_2025_02'
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['create-partitions', '--months-ahead', '2'])
+    assert result.exit_code == 0
+    assert '无需创建分区' in result.output
+
+    result = runner.invoke(args=['archive-partitions', '--before', '2024-13'])
+    assert result.exit_code != 0
+
+    result = runner.invoke(args=['archive-partitions', '--before', '2024-01', '--mode', 'archive'])
+    assert result.exit_code == 0
+    assert '无需归档' in result.output
+
+
+def test_export_transactions(client, trend_transactions):
+    """测试交易记录导出：沿用列表的筛选条件，按日期升序流式输出，可选 gzip"""
+    import csv
+    import gzip
+    import io
+    headers = {'Authorization': f'Bearer {trend_transactions}'}
+    params = {'start_date': '2025-03-01', 'end_date': '2025-03-31', 'transaction_type': TRANSACTION_TYPES['INCOME']}
+
+    response = client.get('/api/finance/transactions/export', headers=headers, query_string=params)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.is_streamed
+    rows = list(csv.reader(io.StringIO(response.get_data().decode('utf-8-sig'))))
+    assert rows[0][:4] == ['ID', '交易日期', '类型', '金额']
+    assert [row[3] for row in rows[1:]] == ['100.00', '50.00', '80.00']
+    assert rows[1][1] == '2025-03-03 09:30:00'
+
+    response = client.get('/api/finance/transactions/export', headers=headers,
+                          query_string={**params, 'gzip': 'true'})
+    assert response.mimetype == 'application/gzip'
+    assert 'transactions_' in response.headers['Content-Disposition']
+    assert gzip.decompress(response.get_data()).decode('utf-8-sig').count('\n') == 4
+
+    response = client.get('/api/finance/transactions/export', headers=headers,
+                          query_string={'start_date': '2025/03/01'})
+    assert response.status_code == 400
+
+
+def test_report_cache_invalidation(client, trend_transactions, book_fixture, count_queries):
+    """测试报表缓存：重复请求不查询数据库；新销售只使包含今天的范围失效，退款使所有范围失效"""
+    headers = {'Authorization': f'Bearer {trend_transactions}'}
+    today = datetime.now().strftime('%Y-%m-%d')
+    history = {'start_date': '2025-03-01', 'end_date': '2025-03-31'}
+    current = {'start_date': today, 'end_date': today}
+
+    def statistics(params):
+        response = client.get('/api/finance/reports/sales-statistics', headers=headers, query_string=params)
+        assert response.status_code == 200
+        return json.loads(response.data)
+
+    assert statistics(current)['total_sales'] == 0
+    statistics(history)
+    with count_queries() as statements:
+        assert statistics(current)['total_sales'] == 0
+        statistics(history)
+    assert _non_auth_statements(statements) == []
+
+    response = client.post('/api/sales', headers=headers, json={
+        'payment_method': 'CASH', 'items': [{'book_id': book_fixture.id, 'quantity': 1, 'price': 50}]
+    })
+    sale_id = json.loads(response.data)['id']
+    with count_queries() as statements:
+        statistics(history)
+    assert _non_auth_statements(statements) == []
+    assert statistics(current)['total_sales'] == 1
+
+    client.post(f'/api/sales/{sale_id}/refund', headers=headers)
+    with count_queries() as statements:
+        statistics(history)
+    assert _non_auth_statements(statements) != []
+    assert statistics(current)['total_sales'] == 0
+
+
+def test_report_cache_sqlite_backend(tmp_path):
+    """测试 SQLite 后端在多个缓存实例 (模拟多个工作进程) 之间共享条目和版本号"""
+    from app.services.report_cache import ReportCache, SqliteReportBackend
+
+    path = str(tmp_path / 'reports.db')
+    first = ReportCache(SqliteReportBackend(path), ttl=60, historical_ttl=3600)
+    second = ReportCache(SqliteReportBackend(path), ttl=60, historical_ttl=3600)
+    arguments = {'start_date': datetime.now(), 'end_date': datetime.now()}
+
+    assert first.get_or_compute('report', arguments, lambda: {'total': 1}) == {'total': 1}
+    assert second.get_or_compute('report', arguments, lambda: {'total': 2}) == {'total': 1}
+    assert (second.hits, second.misses) == (1, 0)
+
+    first.invalidate()
+    assert second.get_or_compute('report', arguments, lambda: {'total': 2}) == {'total': 2}
+    assert len(second) == 2
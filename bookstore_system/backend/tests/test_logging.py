@@ -0,0 +1,60 @@
+import json
+import logging
+import queue
+import sys
+from app.utils.logger import AppQueueHandler, JsonFormatter, RequestIdFilter, SamplingFilter
+
+
+def make_record(msg='测试消息', level=logging.INFO, lineno=1, **extra):
+    record = logging.LogRecord('app.test', level, __file__, lineno, msg, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_request_id_and_extra(app):
+    """测试JSON日志包含请求ID和extra字段"""
+    with app.test_request_context('/api', headers={'X-Request-ID': 'req-123'}):
+        app.preprocess_request()
+        record = make_record(order_id=7)
+        RequestIdFilter().filter(record)
+        entry = json.loads(JsonFormatter().format(record))
+
+    assert entry['message'] == '测试消息'
+    assert entry['level'] == 'INFO'
+    assert entry['request_id'] == 'req-123'
+    assert entry['order_id'] == 7
+
+
+def test_queued_record_keeps_exception_separate():
+    """测试异步日志入队后 message 不包含堆栈，JSON 中仍有独立的 exc_info 字段"""
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = logging.LogRecord('app.test', logging.ERROR, __file__, 1, '处理 %s 失败', ('订单',), sys.exc_info())
+
+    queued = AppQueueHandler(queue.SimpleQueue()).prepare(record)
+    entry = json.loads(JsonFormatter().format(queued))
+
+    assert queued.exc_info is None
+    assert entry['message'] == '处理 订单 失败'
+    assert 'Traceback' in entry['exc_info'] and 'ValueError: boom' in entry['exc_info']
+    # 文本格式仍在消息之后输出堆栈
+    assert logging.Formatter().format(queued).startswith('处理 订单 失败\nTraceback')
+
+
+def test_sampling_filter_limits_low_levels_per_call_site():
+    """测试同一调用位置的DEBUG/INFO日志被限流，WARNING不受影响，其他位置互不影响"""
+    sampler = SamplingFilter(rate=0.001, burst=3)
+
+    passed = [sampler.filter(make_record()) for _ in range(10)]
+    assert passed.count(True) == 3
+
+    assert sampler.filter(make_record(lineno=2))
+    assert all(sampler.filter(make_record(level=logging.WARNING)) for _ in range(10))
+
+
+def test_response_carries_request_id(client):
+    """测试响应头返回请求ID"""
+    response = client.get('/api', headers={'X-Request-ID': 'abc'})
+    assert response.headers['X-Request-ID'] == 'abc'
+    assert client.get('/api').headers['X-Request-ID']
@@ -0,0 +1,81 @@
+import json
+import os
+import re
+from app.utils.metrics import Counter, Histogram, Registry, MultiprocessStore, merge_snapshots, render
+
+
+def sample_value(text, name, **labels):
+    """从 Prometheus 文本中取出一个样本值"""
+    for line in text.splitlines():
+        if line.startswith('#') or not line.startswith(name):
+            continue
+        series, value = line.rsplit(' ', 1)
+        if series.split('{')[0] != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', series))
+        if all(found.get(key) == str(val) for key, val in labels.items()):
+            return float(value)
+    return None
+
+
+def test_metrics_endpoint_labels_by_blueprint(client, init_database):
+    """测试请求计数和延迟直方图按蓝图和端点打标签"""
+    before = sample_value(client.get('/metrics').get_data(as_text=True),
+                          'bookstore_http_requests_total', blueprint='book', endpoint='book.list_books', status=200) or 0
+    client.get('/api/books/')
+    client.get('/api/books/suggest')  # 未登录 -> 401
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert sample_value(text, 'bookstore_http_requests_total',
+                        blueprint='book', endpoint='book.list_books', status=200) == before + 1
+    assert sample_value(text, 'bookstore_http_request_duration_seconds_count',
+                        blueprint='book', endpoint='book.list_books') >= 1
+    assert sample_value(text, 'bookstore_http_request_duration_seconds_bucket',
+                        blueprint='book', endpoint='book.list_books', le='+Inf') >= 1
+    assert sample_value(text, 'bookstore_http_request_errors_total',
+                        blueprint='book', endpoint='book.suggest_books', status_class='4xx') >= 1
+    assert '# TYPE bookstore_sales_total counter' in text
+    # /metrics 自身不计入
+    assert 'endpoint="metrics"' not in text
+
+
+def test_histogram_and_render():
+    registry = Registry()
+    latency = Histogram('test_latency_seconds', '耗时', ('route',), buckets=(0.1, 1.0), registry=registry)
+    requests = Counter('test_requests_total', '请求数', ('route',), registry=registry)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, route='a')
+    requests.inc(route='a"b')
+
+    text = render(registry.snapshot(), [('test_gauge', '瞬时值', [({'pool': 'x'}, 3)])], registry)
+    assert 'test_latency_seconds_bucket{route="a",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="a",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{route="a",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{route="a"} 3' in text
+    assert 'test_requests_total{route="a\\"b"} 1' in text
+    assert 'test_gauge{pool="x"} 3' in text
+
+
+def test_multiprocess_store_sums_workers(tmp_path):
+    """测试多进程模式汇总其他进程写入的快照"""
+    registry = Registry()
+    counter = Counter('test_sales_total', '销售数', registry=registry)
+    counter.inc(2)
+
+    # 模拟另一个工作进程写入的快照
+    other = {'counters': {'test_sales_total': {json.dumps([]): 5}},
+             'gauges': [['test_pool_size', '连接池大小', [[{}, 10]]]]}
+    (tmp_path / 'metrics_99999.json').write_text(json.dumps(other))
+
+    store = MultiprocessStore(str(tmp_path), lambda: [('test_pool_size', '连接池大小', [({}, 4)])],
+                              registry=registry)
+    snapshot, gauges = store.collect()
+    assert snapshot['test_sales_total'][json.dumps([])] == 7
+    assert os.path.exists(store.path)
+
+    text = render(snapshot, gauges, registry)
+    assert 'test_pool_size{pid="99999"} 10' in text
+    assert f'test_pool_size{{pid="{os.getpid()}"}} 4' in text
+
+    assert merge_snapshots([{'h': {'[]': [1, 0, 0.5, 1]}}, {'h': {'[]': [0, 1, 2.0, 1]}}]) == \
+        {'h': {'[]': [1, 1, 2.5, 2]}}
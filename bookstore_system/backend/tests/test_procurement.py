@@ -5,6 +5,7 @@ from app.models.purchase_order import PurchaseOrder, PurchaseOrderItem, ORDER_ST
 from app.models.transaction import Transaction, TRANSACTION_TYPES  # 修改为绝对导入
 from app.models.book import Book  # 修改为绝对导入
 from app.utils.auth import generate_token  # 修改为绝对导入
+from app import db
 
 
 def create_test_order(client, admin_token, order_data=None):
@@ -279,4 +280,157 @@ def test_return_paid_order(client, admin_token):
         # 非 JSON 响应，检查状态码已经足够
         # 可以检查是否包含预期的错误消息
         error_text = response.data.decode('utf-8')
-        assert '只有未支付的订单' in error_text or '只有已支付的订单' in error_text
\ No newline at end of file
+        assert '只有未支付的订单' in error_text or '只有已支付的订单' in error_text
+
+def test_get_orders_query_count_bounded(client, admin_token, book_fixture, page_query_counts):
+    """测试进货订单列表的查询次数与每页数量无关"""
+    for _ in range(20):
+        response = create_test_order(client, admin_token, {
+            'supplier': '批量供应商',
+            'items': [
+                {'book_id': book_fixture.id, 'quantity': 2, 'purchase_price': 10.00},
+                {'title': '新书', 'author': '作者', 'publisher': '出版社',
+                 'isbn': f'978{uuid.uuid4().hex[:10]}', 'quantity': 1, 'purchase_price': 15.00}
+            ]
+        })
+        assert response.status_code == 201
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    counts = page_query_counts('/api/procurement/orders', headers)
+
+    # 认证查询用户 + 总数 + 当前页(含用户) + 订单项(含书籍)
+    assert counts[5] == counts[20]
+    assert counts[20] <= 4
+
+
+def test_get_orders_cursor_pagination(client, admin_token):
+    """测试进货订单列表的游标分页"""
+    created = [json.loads(create_test_order(client, admin_token).data)['id'] for _ in range(3)]
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    response = client.get('/api/procurement/orders', headers=headers,
+                          query_string={'cursor': '', 'per_page': 2, 'with_total': 'true'})
+    data = json.loads(response.data)
+    assert [order['id'] for order in data['orders']] == sorted(created, reverse=True)[:2]
+    assert data['pagination']['total'] == 3
+
+    response = client.get('/api/procurement/orders', headers=headers,
+                          query_string={'cursor': data['pagination']['next_cursor'], 'per_page': 2})
+    data = json.loads(response.data)
+    assert [order['id'] for order in data['orders']] == [min(created)]
+    assert data['pagination']['next_cursor'] is None
+
+
+def _paid_order(client, headers, items):
+    response = client.post('/api/procurement/orders', headers=headers, json={'supplier': '批量供应商', 'items': items})
+    assert response.status_code == 201
+    order_id = json.loads(response.data)['id']
+    assert client.post(f'/api/procurement/orders/{order_id}/pay', headers=headers).status_code == 200
+    return order_id
+
+
+def _new_book_item(isbn, quantity=1, **extra):
+    return {'isbn': isbn, 'title': f'新书{isbn}', 'author': '作者', 'publisher': '出版社',
+            'quantity': quantity, 'purchase_price': 10.00, **extra}
+
+
+def test_stock_in_bulk(client, app, admin_token, book_fixture, count_queries):
+    """测试集合式入库：合并重复行、已存在ISBN按已有书籍入库、新书关联回订单项，语句数与行数无关"""
+    from decimal import Decimal
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    with app.app_context():
+        initial_quantity = db.session.get(Book, book_fixture.id).quantity
+        fixture_isbn = db.session.get(Book, book_fixture.id).isbn
+
+    # 先构建库存读模型，入库后应由提交事件增量更新
+    assert client.get('/api/books/stock', query_string={'ids': book_fixture.id}, headers=headers).status_code == 200
+
+    order_id = _paid_order(client, headers, [
+        {'book_id': book_fixture.id, 'quantity': 3, 'purchase_price': 20.00},
+        {'book_id': book_fixture.id, 'quantity': 2, 'purchase_price': 20.00, 'suggested_retail_price': 88.00},
+        _new_book_item(fixture_isbn, 4),
+        _new_book_item('9790000000001', 5, suggested_retail_price=30.00),
+        _new_book_item('9790000000001', 1),
+        _new_book_item('9790000000002', 2),
+    ])
+    response = client.post(f'/api/procurement/orders/{order_id}/stock-in', headers=headers)
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['order']['status'] == ORDER_STATUS['STOCKED']
+
+    with app.app_context():
+        book = db.session.get(Book, book_fixture.id)
+        assert book.quantity == initial_quantity + 9
+        assert book.retail_price == Decimal('88.00')
+        first = Book.query.filter_by(isbn='9790000000001').one()
+        second = Book.query.filter_by(isbn='9790000000002').one()
+        assert (first.quantity, first.retail_price) == (6, Decimal('30.00'))
+        assert (second.quantity, second.retail_price) == (2, Decimal('15.00'))
+        linked = [item.book_id for item in PurchaseOrderItem.query.filter_by(purchase_order_id=order_id)
+                  .order_by(PurchaseOrderItem.id)]
+        assert linked == [book.id, book.id, book.id, first.id, first.id, second.id]
+
+    assert json.loads(client.get('/api/books/stock/consistency', headers=headers).data)['consistent']
+
+    # 重复入库被拒绝
+    assert client.post(f'/api/procurement/orders/{order_id}/stock-in', headers=headers).status_code == 400
+
+    def stock_in_statements(count, prefix):
+        order_id = _paid_order(client, headers, [
+            {'book_id': book_fixture.id, 'quantity': 1, 'purchase_price': 20.00} for _ in range(count)
+        ] + [_new_book_item(f'{prefix}{i:04d}') for i in range(count)])
+        with count_queries() as statements:
+            response = client.post(f'/api/procurement/orders/{order_id}/stock-in', headers=headers)
+        assert response.status_code == 200
+        return [s for s in statements if 'FROM users' not in s]
+
+    assert len(stock_in_statements(3, '97911')) == len(stock_in_statements(30, '97922'))
+
+
+def test_create_orders_bulk(client, app, admin_token, book_fixture, count_queries):
+    """测试批量创建订单：逐单返回结果，书籍引用一次校验，语句数与订单项数无关"""
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    with app.app_context():
+        fixture_isbn = db.session.get(Book, book_fixture.id).isbn
+
+    response = client.post('/api/procurement/orders/bulk', headers=headers, json={'orders': [
+        {'ref': 'A', 'supplier': '供应商A', 'items': [
+            {'book_id': book_fixture.id, 'quantity': 2, 'purchase_price': 10.00},
+            _new_book_item(fixture_isbn, 3),
+        ]},
+        {'ref': 'B', 'items': [{'book_id': 999999, 'quantity': 1, 'purchase_price': 10.00}]},
+        {'ref': 'C', 'items': []},
+    ]})
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert (data['created'], data['failed']) == (1, 2)
+    first, second, third = data['results']
+    assert first['ref'] == 'A' and first['total_amount'] == 50.0 and first['items'] == 2
+    assert second['errors'] == {'items': {'0': {'book_id': ['指定的书籍不存在']}}}
+    assert 'items' in third['errors']
+    with app.app_context():
+        order = db.session.get(PurchaseOrder, first['id'])
+        assert order.supplier == '供应商A' and order.status == ORDER_STATUS['UNPAID']
+        assert [item.book_id for item in order.items] == [book_fixture.id, book_fixture.id]
+
+    csv_body = ('order_ref,supplier,book_id,isbn,title,author,publisher,quantity,purchase_price\n'
+                f'X,供应商X,{book_fixture.id},,,,,1,12.50\n'
+                'X,,,9790000000101,新书,作者,出版社,2,8.00\n'
+                'Y,供应商Y,,9790000000102,新书二,作者,出版社,1,5.00\n'
+                ',,,,,,,1,1.00\n')
+    response = client.post('/api/procurement/orders/bulk', headers=headers,
+                           data=csv_body.encode('utf-8'), content_type='text/csv')
+    data = json.loads(response.data)
+    assert (data['created'], data['failed']) == (2, 0)
+    assert [result['total_amount'] for result in data['results']] == [28.5, 5.0]
+    assert data['row_errors'] == [{'line': 5, 'errors': '缺少 order_ref'}]
+
+    def bulk_statements(count):
+        orders = [{'items': [{'book_id': book_fixture.id, 'quantity': 1, 'purchase_price': 1.00}] * count
+                   + [_new_book_item(f'97933{i:05d}') for i in range(count)]} for _ in range(3)]
+        with count_queries() as statements:
+            response = client.post('/api/procurement/orders/bulk', headers=headers, json={'orders': orders})
+        assert json.loads(response.data)['created'] == 3
+        return [s for s in statements if 'FROM users' not in s]
+
+    assert len(bulk_statements(2)) == len(bulk_statements(20))
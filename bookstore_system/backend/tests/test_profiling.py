@@ -0,0 +1,53 @@
+import logging
+import pytest
+from app import create_app, db
+from app.config import config, TestingConfig
+from app.models.user import User
+from app.utils.auth import generate_token
+
+
+@pytest.fixture
+def profiled_app():
+    """开启SQL统计、慢查询阈值为0的独立应用"""
+    class ProfilingConfig(TestingConfig):
+        SQL_PROFILING_ENABLED = True
+        SQL_SLOW_QUERY_MS = 0
+        SQL_QUERY_COUNT_WARN = 1
+
+    config['profiling'] = ProfilingConfig
+    app = create_app('profiling')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+    config.pop('profiling', None)
+
+
+def test_query_headers_and_slow_query_log(profiled_app, caplog):
+    """测试响应头包含SQL语句数和耗时，慢查询日志包含语句和路由"""
+    admin = User(username='admin', employee_id='ADMIN1', role='SUPER_ADMIN')
+    admin.set_password('admin123')
+    db.session.add(admin)
+    db.session.commit()
+    headers = {'Authorization': f'Bearer {generate_token(admin.id, admin.role)}'}
+
+    profiling_logger = logging.getLogger('app.utils.profiling')
+    profiling_logger.addHandler(caplog.handler)
+    try:
+        response = profiled_app.test_client().get('/api/sales/', headers=headers)
+    finally:
+        profiling_logger.removeHandler(caplog.handler)
+
+    assert response.status_code == 200
+    assert int(response.headers['X-DB-Queries']) >= 2
+    assert float(response.headers['X-DB-Time']) >= 0
+
+    slow = [r for r in caplog.records if r.getMessage() == '慢查询']
+    assert slow
+    assert any('FROM sales' in r.statement and r.route == 'GET /api/sales/' for r in slow)
+    assert any('N+1' in r.getMessage() for r in caplog.records)
+
+
+def test_profiling_disabled_by_default(client):
+    assert 'X-DB-Queries' not in client.get('/api').headers
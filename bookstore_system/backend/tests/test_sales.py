@@ -1,8 +1,10 @@
 import pytest
 import json
+from datetime import datetime, date, timezone
 from app.models.sale import Sale, SaleItem, SALE_STATUS
 from app.models.transaction import Transaction, TRANSACTION_TYPES
 from app.models.book import Book
+from app.models.user import User
 from app import db  # 直接导入db对象
 
 
@@ -58,6 +60,10 @@ def test_create_sale(client, admin_token, book_fixture):
         book_after_sale = db.session.get(Book, book_fixture.id)
         assert book_after_sale.quantity == expected_quantity_after_sale
 
+        # 销售项冗余保存所属销售单的日期 (PostgreSQL 上的分区键)
+        sale = db.session.get(Sale, data['id'])
+        assert all(item.sale_date == sale.sale_date for item in sale.items)
+
 
 def test_create_sale_insufficient_stock(client, admin_token, book_fixture):
     """测试库存不足的情况"""
@@ -183,4 +189,313 @@ def test_refund_sale(client, admin_token, book_fixture):
     with client.application.app_context():
         book_after_refund = db.session.get(Book, book_fixture.id)
         print(f"[test_refund_sale] Quantity after refund: {book_after_refund.quantity}") # Debug
-        assert book_after_refund.quantity == expected_after_refund, f"Stock not restored correctly after refund. Expected {expected_after_refund}, got {book_after_refund.quantity}"
\ No newline at end of file
+        assert book_after_refund.quantity == expected_after_refund, f"Stock not restored correctly after refund. Expected {expected_after_refund}, got {book_after_refund.quantity}"
+
+def test_refund_and_cancel_restore_duplicate_lines(client, admin_token, book_fixture):
+    """测试同一本书占多行的销售，退款和取消后库存按所有行的数量之和恢复"""
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    book = db.session.get(Book, book_fixture.id)
+    book.quantity = 10
+    db.session.commit()
+    payload = {'payment_method': 'CASH', 'items': [
+        {'book_id': book_fixture.id, 'quantity': 2, 'price': 20},
+        {'book_id': book_fixture.id, 'quantity': 3, 'price': 20},
+    ]}
+
+    for method, path in (('post', '/api/sales/{}/refund'), ('delete', '/api/sales/{}')):
+        response = client.post('/api/sales', json=payload, headers=headers)
+        assert response.status_code == 201
+        db.session.expire_all()
+        assert db.session.get(Book, book_fixture.id).quantity == 5
+
+        sale_id = json.loads(response.data)['id']
+        assert getattr(client, method)(path.format(sale_id), headers=headers).status_code == 200
+        db.session.expire_all()
+        assert db.session.get(Book, book_fixture.id).quantity == 10
+
+def test_list_sales_query_count_bounded(client, admin_token, init_database, page_query_counts):
+    """测试销售列表的查询次数与每页数量无关"""
+    books = [
+        Book(isbn=f'97800000200{i:02d}', name=f'列表测试书{i}', retail_price=20.00, quantity=100)
+        for i in range(3)
+    ]
+    init_database.session.add_all(books)
+    init_database.session.commit()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    for _ in range(20):
+        response = client.post('/api/sales', headers=headers, json={'items': [
+            {'book_id': book.id, 'quantity': 1, 'price': 20.00} for book in books
+        ]})
+        assert response.status_code == 201
+
+    counts = page_query_counts('/api/sales', headers)
+
+    # 认证查询用户 + 总数 + 当前页(含用户) + 销售项(含书籍)
+    assert counts[5] == counts[20]
+    assert counts[20] <= 4
+
+
+def test_list_sales_cursor_pagination(client, admin_token, book_fixture):
+    """测试销售列表的游标分页在同一时间戳下也不会重复或遗漏"""
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    created = []
+    for _ in range(5):
+        response = client.post('/api/sales', headers=headers, json={'items': [
+            {'book_id': book_fixture.id, 'quantity': 1, 'price': 50.00}
+        ]})
+        created.append(json.loads(response.data)['id'])
+
+    seen = []
+    cursor = ''
+    while cursor is not None:
+        response = client.get('/api/sales', headers=headers, query_string={'cursor': cursor, 'per_page': 2})
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        seen.extend(sale['id'] for sale in data['items'])
+        cursor = data['next_cursor']
+
+    assert sorted(seen) == sorted(created)
+    assert len(seen) == len(set(seen))
+
+    # 编码正确但值的类型与排序列不符的游标返回 400
+    from app.utils.pagination import encode_cursor
+    for values in ([123, 1], ['2026-01-01T00:00:00', 'abc'], ['2026-01-01T00:00:00', True], [None, 1], ['not-a-date', 1]):
+        response = client.get('/api/sales', headers=headers, query_string={'cursor': encode_cursor(values)})
+        assert response.status_code == 400, values
+
+
+def test_export_sales_and_books(client, admin_token, book_fixture):
+    """测试销售单 (含明细) 和书籍库存导出"""
+    import csv
+    import io
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    response = client.post('/api/sales', headers=headers, json={
+        'payment_method': 'CASH',
+        'customer_name': '=HYPERLINK("http://example.com","点击")',
+        'contact': '+8613800138000',
+        'items': [{'book_id': book_fixture.id, 'quantity': 2, 'price': 45.5}]
+    })
+    assert response.status_code == 201
+    sale_number = json.loads(response.data)['sale_number']
+
+    response = client.get('/api/sales/export', headers=headers, query_string={'status': SALE_STATUS['COMPLETED']})
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.get_data().decode('utf-8-sig'))))
+    exported = [row for row in rows[1:] if row[0] == sale_number]
+    assert len(exported) == 1
+    assert exported[0][8:] == [book_fixture.isbn, book_fixture.name, '2', '45.50', '91.00']
+    # 以公式字符开头的文本加单引号前缀，防止 CSV 注入
+    assert exported[0][5:7] == ['\'=HYPERLINK("http://example.com","点击")', "'+8613800138000"]
+
+    response = client.get('/api/books/export', headers=headers, query_string={'search': book_fixture.isbn})
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.get_data().decode('utf-8-sig'))))
+    assert len(rows) == 2
+    assert rows[1][1] == book_fixture.isbn
+    assert rows[1][8] == '是'
+
+
+def test_ledger_outbox(client, app, admin_token, book_fixture, monkeypatch):
+    """测试发件箱模式：销售只写发件箱，工作进程批量生成交易且每条记录只处理一次"""
+    from app.models.ledger_outbox import LedgerOutbox
+    from app.services.ledger_service import LedgerService
+    monkeypatch.setitem(app.config, 'LEDGER_OUTBOX_ENABLED', True)
+    headers = {'Authorization': f'Bearer {admin_token}'}
+
+    sale_ids = []
+    for _ in range(3):
+        response = client.post('/api/sales', headers=headers, json={
+            'payment_method': 'CASH', 'items': [{'book_id': book_fixture.id, 'quantity': 1, 'price': 20}]
+        })
+        assert response.status_code == 201
+        sale_ids.append(json.loads(response.data)['id'])
+    response = client.post(f'/api/sales/{sale_ids[0]}/refund', headers=headers)
+    assert response.status_code == 200
+
+    assert Transaction.query.count() == 0
+    assert LedgerOutbox.query.count() == 4
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'bookstore_ledger_outbox_pending 4' in metrics
+
+    # 不使用汇总表的报表扫描 transactions，工作进程提交后缓存的结果应失效
+    monkeypatch.setitem(app.config, 'FINANCE_ROLLUP_ENABLED', False)
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+    def trend_income():
+        response = client.get('/api/finance/reports/sales-trend', headers=headers, query_string={
+            'period': 'daily', 'start_date': today, 'end_date': today
+        })
+        return sum(row['income'] for row in json.loads(response.data))
+
+    assert trend_income() == 0
+
+    with app.app_context():
+        assert LedgerService.process_batch(batch_size=3) == 3
+    assert trend_income() == 60.0
+    result = app.test_cli_runner().invoke(args=['ledger-worker', '--once'])
+    assert result.exit_code == 0
+    assert '已写入 1 条交易记录' in result.output
+
+    with app.app_context():
+        assert LedgerService.process_batch() == 0
+        assert LedgerService.lag() == (0, 0.0)
+    transactions = Transaction.query.order_by(Transaction.id).all()
+    assert [t.type for t in transactions] == [TRANSACTION_TYPES['INCOME']] * 3 + [TRANSACTION_TYPES['EXPENSE']]
+    assert transactions[3].description.endswith('退款')
+    assert LedgerOutbox.query.count() == 0
+
+
+def test_idempotent_sale_and_refund(client, app, admin_token, book_fixture, count_queries):
+    """测试 Idempotency-Key：重放返回保存的响应且不再修改库存和财务记录"""
+    from app.models.idempotency_key import IdempotencyKey
+    headers = {'Authorization': f'Bearer {admin_token}', 'Idempotency-Key': 'pos-1-0001'}
+    payload = {'payment_method': 'CASH', 'items': [{'book_id': book_fixture.id, 'quantity': 2, 'price': 20}]}
+
+    first = client.post('/api/sales', headers=headers, json=payload)
+    assert first.status_code == 201
+    replay = client.post('/api/sales', headers=headers, json=payload)
+    assert replay.status_code == 201
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert json.loads(replay.data) == json.loads(first.data)
+
+    # 进程内缓存失效后 (例如请求落到其他工作进程)，重放只执行一次索引查询
+    app.extensions.pop('idempotency_cache', None)
+    with count_queries() as statements:
+        replay = client.post('/api/sales', headers=headers, json=payload)
+    assert replay.status_code == 201
+    statements = [s for s in statements if 'FROM users' not in s]
+    assert len(statements) == 1 and 'FROM idempotency_keys' in statements[0]
+
+    assert Sale.query.count() == 1
+    assert Transaction.query.count() == 1
+    assert db.session.get(Book, book_fixture.id).quantity == 98
+
+    # 同一个键用于不同的请求体
+    other = client.post('/api/sales', headers=headers, json={**payload, 'payment_method': 'CARD'})
+    assert other.status_code == 422
+
+    # 失败的请求不保存响应，修正后可以用同一个键重试
+    retry_headers = {**headers, 'Idempotency-Key': 'pos-1-0002'}
+    failed = client.post('/api/sales', headers=retry_headers,
+                         json={'payment_method': 'CASH', 'items': [{'book_id': book_fixture.id, 'quantity': 500}]})
+    assert failed.status_code >= 400
+    assert IdempotencyKey.query.filter_by(key='pos-1-0002').count() == 0
+
+    sale_id = json.loads(first.data)['id']
+    refund_headers = {**headers, 'Idempotency-Key': 'pos-1-refund'}
+    assert client.post(f'/api/sales/{sale_id}/refund', headers=refund_headers).status_code == 200
+    replay = client.post(f'/api/sales/{sale_id}/refund', headers=refund_headers)
+    assert replay.status_code == 200 and replay.headers['Idempotent-Replayed'] == 'true'
+    assert Transaction.query.filter_by(type=TRANSACTION_TYPES['EXPENSE']).count() == 1
+    assert db.session.get(Book, book_fixture.id).quantity == 100
+
+    app.config['IDEMPOTENCY_TTL'] = 0
+    try:
+        result = app.test_cli_runner().invoke(args=['purge-idempotency-keys'])
+    finally:
+        app.config['IDEMPOTENCY_TTL'] = 86400
+    assert '已删除 2 个过期的幂等键' in result.output
+
+
+def test_idempotency_abandoned_reservation(client, app, admin_token, book_fixture):
+    """测试首个请求中途退出后留下的预留：租约内返回 409，超过 IDEMPOTENCY_LEASE 后相同请求可以接管"""
+    from datetime import timedelta
+    from app.models.idempotency_key import IdempotencyKey
+    from app.utils.idempotency import request_fingerprint, _utcnow
+    headers = {'Authorization': f'Bearer {admin_token}', 'Idempotency-Key': 'pos-1-crashed'}
+    payload = {'payment_method': 'CASH', 'items': [{'book_id': book_fixture.id, 'quantity': 1, 'price': 20}]}
+    with app.test_request_context('/api/sales', method='POST', json=payload):
+        fingerprint = request_fingerprint()
+    admin_id = User.query.filter_by(username='testadmin').one().id
+    db.session.add(IdempotencyKey(user_id=admin_id, key='pos-1-crashed', fingerprint=fingerprint))
+    db.session.commit()
+
+    assert client.post('/api/sales', headers=headers, json=payload).status_code == 409
+
+    reservation = IdempotencyKey.query.filter_by(key='pos-1-crashed').one()
+    reservation.created_at = _utcnow() - timedelta(seconds=app.config['IDEMPOTENCY_LEASE'] + 1)
+    db.session.commit()
+    # 不同的请求体不能接管
+    assert client.post('/api/sales', headers=headers, json={**payload, 'payment_method': 'CARD'}).status_code == 422
+
+    response = client.post('/api/sales', headers=headers, json=payload)
+    assert response.status_code == 201
+    replay = client.post('/api/sales', headers=headers, json=payload)
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert json.loads(replay.data)['id'] == json.loads(response.data)['id']
+    assert Sale.query.count() == 1
+
+
+def test_sales_batch_sync(client, app, admin_token, book_fixture, count_queries):
+    """测试离线销售批量上传：按顺序扣减库存、逐笔返回结果、重传不重复创建"""
+    from app.models.finance_rollup import DailyFinanceRollup
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    with app.app_context():
+        book = db.session.get(Book, book_fixture.id)
+        book.quantity = 5
+        db.session.commit()
+
+    assert client.get('/api/books/stock', query_string={'ids': book_fixture.id}, headers=headers).status_code == 200
+
+    def entry(ref, quantity, **extra):
+        return {'client_ref': ref, 'items': [{'book_id': book_fixture.id, 'quantity': quantity, 'price': 10}], **extra}
+
+    sales = [
+        entry('till-1', 2, sale_date='2026-01-05T09:30:00Z'),
+        entry('till-2', 4),
+        entry('till-3', 3),
+        entry('till-1', 1),
+        {'client_ref': 'till-4', 'items': []},
+        {'client_ref': 'till-5', 'items': [{'book_id': 999999, 'quantity': 1, 'price': 10}]},
+    ]
+    response = client.post('/api/sales/batch', headers=headers, json={'sales': sales})
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [r['status'] for r in data['results']] == ['created', 'conflict', 'created', 'duplicate', 'invalid', 'conflict']
+    assert (data['created'], data['conflict'], data['duplicate'], data['invalid']) == (2, 2, 1, 1)
+    assert '库存不足' in data['results'][1]['error']
+
+    with app.app_context():
+        assert db.session.get(Book, book_fixture.id).quantity == 0
+        assert Sale.query.count() == 2
+        assert SaleItem.query.count() == 2
+        assert Transaction.query.count() == 2
+        offline = Sale.query.filter_by(client_ref='till-1').one()
+        assert offline.sale_date.date().isoformat() == '2026-01-05'
+        assert offline.items[0].sale_date == offline.sale_date
+        rollup = DailyFinanceRollup.query.filter(DailyFinanceRollup.date == offline.sale_date.date()).one()
+        assert (rollup.sale_count, float(rollup.income)) == (1, 20.0)
+
+    assert json.loads(client.get('/api/books/stock/consistency', headers=headers).data)['consistent']
+
+    # 上一次响应丢失后整批重传
+    response = client.post('/api/sales/batch', headers=headers, json={'sales': sales[:3]})
+    results = json.loads(response.data)['results']
+    assert [r['status'] for r in results] == ['duplicate', 'conflict', 'duplicate']
+    assert results[0]['sale_number'] == data['results'][0]['sale_number']
+    with app.app_context():
+        assert Sale.query.count() == 2
+
+    def batch_statements(count, prefix):
+        with app.app_context():
+            db.session.get(Book, book_fixture.id).quantity = 1000
+            db.session.commit()
+        with count_queries() as statements:
+            response = client.post('/api/sales/batch', headers=headers,
+                                   json={'sales': [entry(f'{prefix}-{i}', 1) for i in range(count)]})
+        assert json.loads(response.data)['created'] == count
+        return [s for s in statements if 'FROM users' not in s]
+
+    assert len(batch_statements(3, 'a')) == len(batch_statements(50, 'b'))
+
+    # 带其他时区偏移的销售时间换算为 UTC 保存，按 UTC 日期汇总
+    response = client.post('/api/sales/batch', headers=headers,
+                           json={'sales': [entry('till-tz', 1, sale_date='2026-01-10T07:30:00+08:00')]})
+    assert json.loads(response.data)['created'] == 1
+    with app.app_context():
+        offline = Sale.query.filter_by(client_ref='till-tz').one()
+        assert offline.sale_date == datetime(2026, 1, 9, 23, 30)
+        assert Transaction.query.filter_by(reference_id=offline.sale_number).one().transaction_date == offline.sale_date
+        assert DailyFinanceRollup.query.filter(DailyFinanceRollup.date == date(2026, 1, 9)).one().sale_count == 1
+        assert DailyFinanceRollup.query.filter(DailyFinanceRollup.date == date(2026, 1, 10)).count() == 0
@@ -0,0 +1,136 @@
+import os
+import json
+import threading
+import pytest
+from app import create_app, db
+from app.config import config, TestingConfig
+from app.models.book import Book
+from app.models.sale import Sale, SALE_STATUS
+from app.models.user import User
+from app.utils.auth import generate_token
+
+
+INITIAL_STOCK = 60
+THREADS = 8
+ATTEMPTS_PER_THREAD = 12
+
+
+def _database_urls():
+    """SQLite 文件数据库总是参与测试；设置 TEST_POSTGRES_URL 时同时测试 PostgreSQL"""
+    urls = [pytest.param('sqlite', id='sqlite')]
+    postgres_url = os.environ.get('TEST_POSTGRES_URL')
+    urls.append(pytest.param(
+        postgres_url, id='postgresql',
+        marks=pytest.mark.skipif(not postgres_url, reason='未设置 TEST_POSTGRES_URL')
+    ))
+    return urls
+
+
+@pytest.fixture(params=_database_urls())
+def concurrent_app(request, tmp_path):
+    """使用支持多连接的真实数据库创建独立应用"""
+    url = request.param
+    if url == 'sqlite':
+        url = f"sqlite:///{tmp_path / 'concurrency.db'}"
+
+    class ConcurrencyConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = url
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}} if url.startswith('sqlite') else {}
+
+    config['concurrency'] = ConcurrencyConfig
+    app = create_app('concurrency')
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+    config.pop('concurrency', None)
+
+
+def test_concurrent_sales_never_oversell(concurrent_app):
+    """多线程同时销售同一本书：成功数量恰好等于库存，库存不会为负"""
+    with concurrent_app.app_context():
+        admin = User(username='pos_admin', employee_id='POS001', role='SUPER_ADMIN')
+        admin.set_password('adminpass')
+        book = Book(isbn='9780000000001', name='畅销书', retail_price=30.00, quantity=INITIAL_STOCK)
+        db.session.add_all([admin, book])
+        db.session.commit()
+        token = generate_token(admin.id, admin.role)
+        book_id = book.id
+
+    statuses = []
+    lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def checkout():
+        client = concurrent_app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        start.wait()
+        for _ in range(ATTEMPTS_PER_THREAD):
+            response = client.post('/api/sales', headers=headers, json={
+                'items': [{'book_id': book_id, 'quantity': 1, 'price': 30.00}]
+            })
+            with lock:
+                statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=checkout) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses.count(201) == INITIAL_STOCK
+    assert statuses.count(409) == THREADS * ATTEMPTS_PER_THREAD - INITIAL_STOCK
+
+    with concurrent_app.app_context():
+        assert db.session.get(Book, book_id).quantity == 0
+        assert Sale.query.filter_by(status=SALE_STATUS['COMPLETED']).count() == INITIAL_STOCK
+
+
+def test_insufficient_stock_message(client, admin_token, book_fixture):
+    """测试库存不足时返回409及原有的错误信息，且库存不变"""
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    response = client.post('/api/sales', headers=headers, json={
+        'items': [{'book_id': book_fixture.id, 'quantity': 101, 'price': 50.00}]
+    })
+
+    assert response.status_code == 409
+    assert json.loads(response.data)['error'] == '库存不足: 当前库存100, 请求数量101'
+    assert db.session.get(Book, book_fixture.id).quantity == 100
+
+
+def test_multi_line_sale_loads_books_once(client, admin_token, init_database, count_queries):
+    """测试多行销售单在扣减库存之前只用一条语句加载所有书籍"""
+    books = [
+        Book(isbn=f'97800000100{i:02d}', name=f'书籍{i}', retail_price=10.00, quantity=10)
+        for i in range(12)
+    ]
+    init_database.session.add_all(books)
+    init_database.session.commit()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    items = [{'book_id': book.id, 'quantity': 1, 'price': 10.00} for book in reversed(books)]
+
+    with count_queries() as statements:
+        response = client.post('/api/sales', headers=headers, json={'items': items})
+
+    assert response.status_code == 201
+    first_stock_update = next(i for i, s in enumerate(statements) if s.lstrip().startswith('UPDATE books'))
+    book_selects = [s for s in statements[:first_stock_update] if 'FROM books' in s]
+    assert len(book_selects) == 1
+    assert 'IN (' in book_selects[0]
+
+
+def test_multi_line_sale_reports_first_missing_book(client, admin_token, book_fixture):
+    """测试批量加载后，不存在的书籍仍按原有格式报错且不扣减库存"""
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    response = client.post('/api/sales', headers=headers, json={'items': [
+        {'book_id': book_fixture.id, 'quantity': 1, 'price': 50.00},
+        {'book_id': 999999, 'quantity': 1, 'price': 50.00},
+    ]})
+
+    assert response.status_code == 404
+    assert json.loads(response.data)['error'] == '书籍ID 999999 不存在'
+    assert db.session.get(Book, book_fixture.id).quantity == 100
@@ -121,3 +121,39 @@ def test_update_own_profile(client, init_database, app): # 添加 app fixture
     updated_user = User.query.filter_by(id=user.id).first()
     assert updated_user.full_name == 'New Full Name'
 
+
+def test_token_cache_and_invalidation(client, init_database, app, count_queries):
+    """测试令牌缓存：重复请求不再校验令牌和查询用户，角色变更和删除后缓存失效"""
+    from app.utils.auth import get_auth_cache
+
+    admin = User(username='admin', employee_id='ADMIN1', role='SUPER_ADMIN')
+    admin.set_password('admin123')
+    user = User(username='staff', employee_id='EMP500', role='SUPER_ADMIN')
+    user.set_password('password123')
+    init_database.session.add_all([admin, user])
+    init_database.session.commit()
+    user_id = user.id
+
+    admin_headers = {'Authorization': f'Bearer {generate_token(admin.id, admin.role)}'}
+    user_headers = {'Authorization': f'Bearer {generate_token(user.id, user.role)}'}
+    cache = get_auth_cache()
+
+    assert client.get('/api/users/', headers=user_headers).status_code == 200
+    assert cache.misses == 1
+    init_database.session.expunge_all()
+    with count_queries() as statements:
+        assert client.get('/api/users/', headers=user_headers).status_code == 200
+    assert cache.hits == 1
+    # 只剩接口本身的用户列表查询
+    assert len([s for s in statements if 'FROM users' in s]) == 1
+
+    # 角色变更后缓存失效，重新从数据库加载用户快照
+    response = client.put(f'/api/users/{user_id}', json={'role': 'NORMAL_ADMIN'}, headers=admin_headers)
+    assert response.status_code == 200
+    response = client.get('/api/auth/me', headers=user_headers)
+    assert json.loads(response.data)['role'] == 'NORMAL_ADMIN'
+    assert cache.misses == 3
+
+    # 删除后令牌立即失效
+    assert client.delete(f'/api/users/{user_id}', headers=admin_headers).status_code == 200
+    assert client.get('/api/auth/me', headers=user_headers).status_code == 401